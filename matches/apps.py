@@ -5,3 +5,6 @@ from django.utils.translation import gettext_lazy as _
 class MatchesConfig(AppConfig):
     name = 'matches'
     verbose_name = _('Matches')
+
+    def ready(self):
+        from . import signals # noqa: F401 (registers the signal receivers)
@@ -0,0 +1,108 @@
+"""
+Streaming export of the results (scored matches and the ranking) as CSV or
+NDJSON, used by the `export_results` command and the export endpoint.
+
+Each export is a single query, with the related teams and categories joined
+in it, iterated in chunks on the server side and written row by row, so memory
+does not grow with the number of matches or teams.
+"""
+import csv
+import json
+from django.db.models import Q
+from teams.models import Team, with_positions
+from .models import Match
+
+# Rows fetched from the database at once
+CHUNK_SIZE = 2000
+
+def _team_columns(side):
+    return {
+        f'{side}_team': f'{side}_team__key',
+        f'{side}_team_name': f'{side}_team__name',
+        f'{side}_category': f'{side}_team__category__key',
+    }
+
+# Columns of each export, mapped to the fields they are read from
+MATCH_COLUMNS = {
+    'id': 'id',
+    'status': 'status',
+    **_team_columns('white'),
+    **_team_columns('black'),
+    'white_score': 'white_score',
+    'black_score': 'black_score',
+    'white_qualification_points': 'white_qualification_points',
+    'black_qualification_points': 'black_qualification_points',
+    'result': 'result',
+}
+
+RANKING_COLUMNS = {
+    'team': 'key',
+    'name': 'name',
+    'category': 'category__key',
+    'institution': 'institution__name',
+    'qualification_points': 'qualification_points',
+    'total_score': 'total_score',
+}
+
+def match_rows(category=None):
+    """
+    Scored matches (of teams of the given category key, if any), as dicts of MATCH_COLUMNS
+    """
+    matches = Match.scored_objects.filter(score__isnull=False)
+    if category is not None:
+        matches = matches.filter(Q(white_team__category__key=category) | Q(black_team__category__key=category))
+    fields = list(MATCH_COLUMNS.values())
+    for values in matches.order_by('id').values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(MATCH_COLUMNS, values))
+
+def ranking_rows(category=None):
+    """
+    Ranking (of the given category key, if any) from the standings, as dicts of
+    RANKING_COLUMNS plus their `position` (shared by tied teams, see `with_positions`)
+    """
+    ranking = Team.ranked_objects.ranking()
+    if category is not None:
+        ranking = ranking.filter(category__key=category)
+    fields = ['position', *RANKING_COLUMNS.values()]
+    for values in with_positions(ranking).values_list(*fields).iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(['position', *RANKING_COLUMNS], values))
+
+EXPORTS = {
+    'matches': (match_rows, list(MATCH_COLUMNS)),
+    'ranking': (ranking_rows, ['position', *RANKING_COLUMNS]),
+}
+
+class _Line:
+    """
+    File-like object returning what is written to it, for csv.writer
+    """
+    def write(self, value):
+        return value
+
+def write_csv(rows, columns):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row[column] for column in columns])
+
+def write_ndjson(rows, columns):
+    for row in rows:
+        yield json.dumps(row, default=str, separators=(',', ':')) + '\n'
+
+WRITERS = {
+    'csv': write_csv,
+    'ndjson': write_ndjson,
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def export(name, format, category=None):
+    """
+    Lines of the given export (one of EXPORTS) in the given format (one of WRITERS),
+    as a generator of strings
+    """
+    rows, columns = EXPORTS[name]
+    return WRITERS[format](rows(category), columns)
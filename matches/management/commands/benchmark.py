@@ -0,0 +1,93 @@
+import itertools
+import json
+from types import SimpleNamespace
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import reverse
+from robocat.benchmarking import Rollback, format_measurement, measure
+from robocat.schema import schema
+from robocat.synthetic import generate_tournament
+from matches.models import Match, Score
+
+QUERIES = {
+    'query ranking': '{ ranking { id name qualificationPoints totalScore } }',
+    'query allScoredMatches': '''{
+        allScoredMatches { id status whiteScore blackScore result whiteTeam { id } blackTeam { id } }
+    }''',
+    'query schedule matches': '{ schedule { matches { round table startTime match { id status } } } }',
+}
+
+class Command(BaseCommand):
+    help = ('Time the hot paths (GraphQL queries, the match admin and score saves) and count '
+        'their queries on synthetic tournaments of several sizes, optionally writing the results '
+        'as JSON to compare them across commits. The synthetic data is created inside a '
+        'transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 2000],
+            help='Number of teams of each tournament')
+        parser.add_argument('--rounds', type=int, default=6, help='Rounds of each tournament')
+        parser.add_argument('--played-rounds', type=int, default=4,
+            help='Rounds already played (the rest are only scheduled)')
+        parser.add_argument('--tables', type=int, default=10, help='Tables of the schedule')
+        parser.add_argument('--repeat', type=int, default=5, help='Times each benchmark is run')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='JSON file to write the results to')
+        parser.add_argument('--label', default='', help='Label of the results (e.g. the commit)')
+
+    def execute_query(self, query):
+        result = schema.execute(query, context=SimpleNamespace(user=AnonymousUser()))
+        if result.errors:
+            raise CommandError(str(result.errors[0]))
+
+    def benchmarks(self):
+        for label, query in QUERIES.items():
+            yield label, lambda query=query: self.execute_query(query)
+
+        request = RequestFactory().get(reverse('admin:matches_match_changelist'))
+        request.user = User.objects.create(username='benchmark', is_staff=True, is_superuser=True)
+        model_admin = admin.site._registry[Match]
+        yield 'admin match changelist', lambda: model_admin.changelist_view(request).render()
+
+        scores = itertools.cycle(Score.objects.order_by('id')[:100])
+        def save_score():
+            score = next(scores)
+            score.cubes_on_lower_white = (score.cubes_on_lower_white + 1) % 7
+            score.save()
+        yield 'score save', save_score
+
+    def benchmark(self, size, rounds, played_rounds, tables, repeat, seed):
+        tournament = generate_tournament(size, rounds=rounds, played_rounds=played_rounds,
+            tables=tables, seed=seed)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            '%d teams, %d matches' % (size, len(tournament.matches))))
+        results = []
+        for label, function in self.benchmarks():
+            measurement = measure(function, repeat)
+            self.stdout.write(format_measurement(label, measurement))
+            results.append({'teams': size, 'matches': len(tournament.matches), 'benchmark': label,
+                **measurement._asdict()})
+        return results
+
+    def handle(self, *args, sizes, rounds, played_rounds, tables, repeat, seed, output, label, **options):
+        results = []
+        for size in sizes:
+            try:
+                with transaction.atomic():
+                    results += self.benchmark(size, rounds, played_rounds, tables, repeat, seed)
+                    raise Rollback()
+            except Rollback:
+                pass
+        if output is not None:
+            with open(output, 'w') as file:
+                json.dump({
+                    'label': label,
+                    'rounds': rounds,
+                    'played_rounds': played_rounds,
+                    'repeat': repeat,
+                    'seed': seed,
+                    'results': results,
+                }, file, indent=2)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from matches.exporting import EXPORTS, WRITERS, export
+
+class Command(BaseCommand):
+    help = ('Export the scored matches or the ranking as CSV or NDJSON (see matches.exporting), '
+        'streaming them from the database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS), help='Export to write')
+        parser.add_argument('--format', choices=sorted(WRITERS), default='csv')
+        parser.add_argument('--category', help='Key of the category to export (by default, all of them)')
+        parser.add_argument('--output', help='File to write (by default, the standard output)')
+
+    def handle(self, *args, name, format, category, output, **options):
+        lines = export(name, format, category)
+        if output is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as file:
+                file.writelines(lines)
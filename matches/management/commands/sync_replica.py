@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from robocat import replicas
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite database to the read replica (see robocat.replicas), once or '
+        'every --interval seconds. The interval should be well below MAX_LAG, or the queries '
+        'will fall back to the primary database whenever the data changes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Seconds between syncs (by default, sync once)')
+
+    def handle(self, *args, interval, **options):
+        while True:
+            try:
+                replicas.sync()
+            except ValueError as e:
+                raise CommandError(str(e))
+            if interval is None:
+                break
+            time.sleep(interval)
+        self.stdout.write(self.style.SUCCESS('Synced the replica'))
@@ -0,0 +1,128 @@
+"""
+Merging of partial scores: each referee submits the partial score of one side
+of a match, and once both sides have been submitted, they are merged into the
+score of the match, which is then finished.
+
+Concurrency is handled optimistically, without holding row locks between
+reading and writing:
+- Partial scores have a version, incremented by the database on every change.
+  Edits are conditional on the version they were based on, so an edit made on
+  an outdated partial score fails (with StaleVersion) instead of silently
+  overwriting the changes made meanwhile.
+- Scores remember the versions of the partial scores they were merged from,
+  and are only replaced by merges of newer versions (see
+  Score.merged_white_version), so a slow merge never overwrites a newer one.
+  Scores entered or corrected directly forget them, and are never replaced.
+"""
+from functools import partial
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from robocat import data_version, events
+from .models import Match, Score, PartialScore
+from .signals import send_results_changed
+
+class StaleVersion(Exception):
+    """
+    The partial score has been changed since the version being edited
+    """
+
+# Fields of Score for each field of PartialScore, as templates for the side
+PARTIAL_SCORE_FIELDS = {
+    'disqualified': '{side}_disqualified',
+    'stalled': '{side}_stalled',
+    'cubes_on_lower_goal': 'cubes_on_lower_{side}',
+    'cubes_on_upper_goal': 'cubes_on_upper_{side}',
+    'cubes_on_field': 'cubes_on_{side}_field',
+    'adhoc': '{side}_adhoc',
+}
+
+# Attempts to merge, if the score is concurrently created
+MAX_ATTEMPTS = 3
+
+def merged_values(white, black):
+    """
+    Field values of the Score merged from the given partial scores
+    """
+    values = {
+        template.format(side=side): getattr(partial_score, name)
+        for side, partial_score in (('white', white), ('black', black))
+        for name, template in PARTIAL_SCORE_FIELDS.items()
+    }
+    values['notes'] = '\n'.join(notes for notes in (white.notes, black.notes) if notes)
+    values['merged_white_version'] = white.version
+    values['merged_black_version'] = black.version
+    return values
+
+def merge_partial_scores(match_id):
+    """
+    Merge the partial scores of a match into its score, if both have been submitted
+    and they are newer than the ones the score was merged from (if any). The match
+    is then finished. Returns whether the score was merged.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        # Both sides read at once, so their versions are consistent
+        sides = {
+            ('white' if partial_score.match_as_white_id is not None else 'black'): partial_score
+            for partial_score in PartialScore.objects.filter(
+                Q(match_as_white=match_id) | Q(match_as_black=match_id))
+        }
+        if len(sides) < 2:
+            return False
+        values = merged_values(sides['white'], sides['black'])
+        with transaction.atomic():
+            updated = (
+                Score.objects.filter(
+                    match_id=match_id,
+                    merged_white_version__lte=values['merged_white_version'],
+                    merged_black_version__lte=values['merged_black_version'],
+                )
+                .exclude(
+                    merged_white_version=values['merged_white_version'],
+                    merged_black_version=values['merged_black_version'],
+                )
+                .update(**values)
+            )
+            if updated:
+                # Updates bypass the model signals
+                send_results_changed(Score, {match_id})
+            elif Score.objects.filter(match_id=match_id).exists():
+                # Already merged from these (or newer) versions, or entered directly
+                return False
+            else:
+                try:
+                    with transaction.atomic():
+                        Score(match_id=match_id, **values).save(force_insert=True, merged=True)
+                except IntegrityError:
+                    # Created concurrently, retry
+                    continue
+            if Match.objects.filter(id=match_id).exclude(status=Match.Status.FINISHED).update(
+                    status=Match.Status.FINISHED):
+                events.notify('match-status', {match_id})
+            return True
+    return False
+
+def submit_partial_score(match, side, values, version=None):
+    """
+    Create or edit the partial score of the given side ('white' or 'black') of a
+    match, and merge the partial scores if both have been submitted (once the
+    transaction commits). `version` is the version of the partial score being
+    edited, or None if it is being created. Raises StaleVersion if it has been
+    changed (or created) meanwhile. Returns the new version.
+    """
+    field = f'match_as_{side}'
+    if version is None:
+        try:
+            with transaction.atomic():
+                partial_score = PartialScore.objects.create(**{field: match}, **values)
+        except IntegrityError:
+            raise StaleVersion()
+        # Merged by the post_save signal
+        return partial_score.version
+    updated = PartialScore.objects.filter(**{field: match}, version=version).update(
+        version=F('version') + 1, **values)
+    if not updated:
+        raise StaleVersion()
+    # Updates bypass the model signals
+    data_version.bump()
+    transaction.on_commit(partial(merge_partial_scores, match.pk))
+    return version + 1
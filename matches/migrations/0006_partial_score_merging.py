@@ -0,0 +1,28 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0005_auto_20200308_1641'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partialscore',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='version'),
+        ),
+        migrations.AddField(
+            model_name='score',
+            name='merged_black_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='merged black partial score version'),
+        ),
+        migrations.AddField(
+            model_name='score',
+            name='merged_white_version',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='merged white partial score version'),
+        ),
+    ]
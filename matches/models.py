@@ -1,110 +1,86 @@
 import uuid
-import enum
-from django.db import models
+from collections import namedtuple
+from django.db import models, transaction, connections
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _, gettext as e_
-from django.db.models import F, Q, Case, When, ExpressionWrapper, Value
 from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
+from . import scoring
+from .scoring import MatchResult # noqa: F401 (part of the models API)
 
 from teams.models import Team
 
-@enum.unique
-class MatchResult(enum.Enum):
-    WHITE_WINS = 'W'
-    BLACK_WINS = 'B'
-    DRAW = 'D'
-    BOTH_LOSE = 'F'
-
-    @property
-    def description(self):
-        return {
-            self.WHITE_WINS: _('White team wins'),
-            self.BLACK_WINS: _('Black team wins'),
-            self.DRAW: _('Both teams have got the same score'),
-            self.BOTH_LOSE: _('Both teams have been disqualified. Nobody wins')
-        }[self]
-
 class ScoredMatchManager(models.Manager):
-    @staticmethod
-    def gen_expr_for_white_score():
-        score = (
-            F('score__cubes_on_lower_black')
-            + 5 * F('score__cubes_on_upper_black')
-            + Case(
-                When(score__cubes_on_white_field__lt=F('score__cubes_on_black_field'), then=10),
-                default=0
-            )
-            + Case(
-                When(score__white_stalled=False, then=10),
-                default=0
-            )
-        )
-        return Case(
-            When(score__white_disqualified=True, then=0),
-            default=score
-        ) + F('score__white_adhoc')
-
-    @staticmethod
-    def gen_expr_for_black_score():
-        score = (
-            F('score__cubes_on_lower_white')
-            + 5 * F('score__cubes_on_upper_white')
-            + Case(
-                When(score__cubes_on_black_field__lt=F('score__cubes_on_white_field'), then=10),
-                default=0
-            )
-            + Case(
-                When(score__black_stalled=True, then=0),
-                default=10
-            )
+    """
+    Matches annotated with their `white_score`, `black_score`,
+    `white_qualification_points`, `black_qualification_points` and `result`
+    (see matches.scoring). Annotations are NULL for matches without score.
+    """
+    def get_queryset(self):
+        return (
+            super().get_queryset()
+            .annotate(white_score=scoring.score_expression('white', 'score__'))
+            .annotate(black_score=scoring.score_expression('black', 'score__'))
+            .annotate(white_qualification_points=scoring.qualification_points_expression('white', 'score__'))
+            .annotate(black_qualification_points=scoring.qualification_points_expression('black', 'score__'))
+            .annotate(result=scoring.result_expression())
         )
-        return Case(
-            When(score__black_disqualified=True, then=0),
-            default=score
-        ) + F('score__black_adhoc')
 
-    @staticmethod
-    def gen_expr_for_white_qual_points():
-        return Case(
-            When(score__white_disqualified=True, then=0),
-            When(white_score__gt=F('black_score'), then=3),
-            When(white_score=F('black_score'), then=1),
-            When(white_score__lt=F('black_score'), then=0),
-            output_field=models.IntegerField()
-        )
+    def for_teams(self, team_ids):
+        """
+        Matches of the given teams (IDs, or a queryset of them), on either side
+        """
+        if not isinstance(team_ids, models.QuerySet):
+            team_ids = list(team_ids)
+        return self.filter(Q(white_team__in=team_ids) | Q(black_team__in=team_ids))
 
-    @staticmethod
-    def gen_expr_for_black_qual_points():
-        return Case(
-            When(score__black_disqualified=True, then=0),
-            When(black_score__gt=F('white_score'), then=3),
-            When(black_score=F('white_score'), then=1),
-            When(black_score__lt=F('white_score'), then=0),
-            output_field=models.IntegerField()
+    def team_stats(self, team_ids):
+        """
+        Aggregate the results of the given teams over their scored matches, as a
+        dictionary of TeamStats by team ID (zeroed for teams without scored matches).
+        Both sides are folded in a single scan: each match found through the team
+        indexes is joined to the requested teams it was played by.
+        """
+        team_ids = list(team_ids)
+        stats = { team_id: TeamStats(0, 0, 0, 0, 0, 0) for team_id in team_ids }
+        if not team_ids:
+            return stats
+        matches_sql, params = (
+            self.for_teams(team_ids).filter(score__isnull=False).order_by()
+            .values(white_id=F('white_team'), black_id=F('black_team'),
+                white_points=Coalesce('white_score', 0), black_points=Coalesce('black_score', 0),
+                white_qp=F('white_qualification_points'), black_qp=F('black_qualification_points'))
+            .query.sql_with_params()
         )
-
-    @staticmethod
-    def gen_expr_for_result():
-        return Case(
-            When(white_qualification_points=3, black_qualification_points=0,
-                then=Value(MatchResult.WHITE_WINS.value)),
-            When(white_qualification_points=0, black_qualification_points=3,
-                then=Value(MatchResult.BLACK_WINS.value)),
-            When(white_qualification_points=1, black_qualification_points=1,
-                then=Value(MatchResult.DRAW.value)),
-            When(white_qualification_points=0, black_qualification_points=0,
-                then=Value(MatchResult.BOTH_LOSE.value)),
-            output_field=models.CharField()
+        quote_name = connections[self.db].ops.quote_name
+        own = 'CASE WHEN m.white_id = team.id THEN m.white_{0} ELSE m.black_{0} END'
+        other = 'CASE WHEN m.white_id = team.id THEN m.black_{0} ELSE m.white_{0} END'
+        sql = (
+            f'SELECT team.id, COUNT(*), '
+            f'SUM(CASE WHEN {own.format("qp")} = %s THEN 1 ELSE 0 END), '
+            f'SUM(CASE WHEN {own.format("qp")} = %s THEN 1 ELSE 0 END), '
+            f'SUM({own.format("points")}), SUM({other.format("points")}) '
+            f'FROM ({matches_sql}) AS m '
+            f'JOIN {quote_name(Team._meta.db_table)} AS team ON team.id = m.white_id OR team.id = m.black_id '
+            f'WHERE team.id IN ({", ".join(["%s"] * len(team_ids))}) '
+            'GROUP BY team.id'
         )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, (scoring.WIN_POINTS, scoring.DRAW_POINTS, *params, *team_ids))
+            for team_id, played, won, drawn, points_for, points_against in cursor:
+                stats[team_id] = TeamStats(played, won, drawn, played - won - drawn,
+                    points_for, points_against)
+        return stats
+
+class TeamStats(namedtuple('TeamStats', ('played', 'won', 'drawn', 'lost', 'points_for', 'points_against'))):
+    """
+    Results of a team over its scored matches (see ScoredMatchManager.team_stats)
+    """
+    __slots__ = ()
 
-    def get_queryset(self):
-        return (
-            super().get_queryset()
-            .annotate(white_score=self.gen_expr_for_white_score())
-            .annotate(black_score=self.gen_expr_for_black_score())
-            .annotate(white_qualification_points=self.gen_expr_for_white_qual_points())
-            .annotate(black_qualification_points=self.gen_expr_for_black_qual_points())
-            .annotate(result=self.gen_expr_for_result())
-        )
+    @property
+    def average_score(self):
+        return self.points_for / self.played if self.played else None
 
 # Create your models here.
 class Match(models.Model):
@@ -161,6 +137,45 @@ class Match(models.Model):
     # Partial scores: On partial scores, the other team's score is ignored, so it is possible
     # to send the score of the two teams separately.
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+
+    def _remember_loaded_values(self):
+        # Remember the values as stored, so changes can be told apart on save
+        # (e.g. the previous teams of an edited match, or a status transition)
+        self._loaded_values = {
+            name: self.__dict__[name]
+            for name in ('white_team_id', 'black_team_id', 'status')
+            if name in self.__dict__
+        }
+
+    @property
+    def loaded_team_ids(self):
+        """
+        IDs of the teams of this match as they were loaded from the database
+        (empty if the match has not been loaded from the database)
+        """
+        loaded_values = getattr(self, '_loaded_values', {})
+        return tuple(loaded_values[name] for name in ('white_team_id', 'black_team_id')
+            if name in loaded_values)
+
+    @property
+    def loaded_status(self):
+        """
+        Status of this match as it was loaded from the database, or None
+        """
+        return getattr(self, '_loaded_values', {}).get('status')
+
+    def save(self, *args, **kwargs):
+        # Results derived from this match (e.g. standings) are updated on post_save,
+        # which must run in the same transaction as the save itself.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+        self._remember_loaded_values()
+
     def clean(self):
         super().clean()
         errors = []
@@ -262,57 +277,53 @@ class Score(models.Model):
 
     notes = models.TextField(blank=True, default='', verbose_name=_('notes'))
 
+    # Versions of the partial scores this score was merged from (see matches.merging),
+    # or NULL if it was entered directly. Merged scores are only replaced by merges
+    # of newer partial scores; scores entered directly are never replaced. Saving a
+    # score (e.g. correcting it in the admin) counts as entering it directly, unless
+    # saved by the merge itself.
+    merged_white_version = models.PositiveIntegerField(null=True, blank=True, editable=False,
+        verbose_name=_('merged white partial score version'))
+    merged_black_version = models.PositiveIntegerField(null=True, blank=True, editable=False,
+        verbose_name=_('merged black partial score version'))
+
+    def save(self, *args, merged=False, **kwargs):
+        if not merged:
+            self.merged_white_version = self.merged_black_version = None
+        # See Match.save
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     @staticmethod
     def white_score_q():
         """
         Generate a Django Expression that can be used with .annotate()
         to obtain the score of the white team.
         """
-        score = (
-            F('cubes_on_lower_black')
-            + 5 * F('cubes_on_upper_black')
-            + Case(
-                When(cubes_on_white_field__lt=F('cubes_on_black_field'), then=10),
-                default=0
-            )
-            + Case(
-                When(white_stalled=True, then=-10),
-                default=0
-            )
-        )
-        return Case(
-            When(white_disqualified=True, then=0),
-            default=score
-        ) + F('white_adhoc')
+        return scoring.score_expression('white')
+
+    @staticmethod
+    def black_score_q():
+        """
+        Generate a Django Expression that can be used with .annotate()
+        to obtain the score of the black team.
+        """
+        return scoring.score_expression('black')
+
+    @property
+    def result_py(self):
+        """
+        Score of this match, calculated in Python (see matches.scoring.ScoreResult)
+        """
+        return scoring.evaluate_scores((self,))[0]
 
     @property
     def white_score_py(self):
-        score = 0
-        score += self.white_adhoc
-        if self.white_disqualified:
-            return score
-        if not self.white_stalled:
-            score += 10
-        score += self.cubes_on_lower_black or 0
-        score += 5 * (self.cubes_on_upper_black or 0)
-        if (self.cubes_on_white_field or 0) < (self.cubes_on_black_field or 0):
-            score += 10
-        score += self.white_adhoc
-        return score
+        return self.result_py.white_score
 
     @property
     def black_score_py(self):
-        score = 0
-        score += self.black_adhoc
-        if self.black_disqualified:
-            return 0
-        if not self.black_stalled:
-            score += 10
-        score += self.cubes_on_lower_white or 0
-        score += 5 * (self.cubes_on_upper_white or 0)
-        if (self.cubes_on_black_field or 0) < (self.cubes_on_white_field or 0):
-            score += 10
-        return score
+        return self.result_py.black_score
 
     def __str__(self):
         return e_('White: %(white_score)s; Black: %(black_score)s') % {
@@ -353,6 +364,19 @@ class PartialScore(models.Model):
     adhoc = models.IntegerField(default=0, verbose_name=_('ad-hoc points'))
     notes = models.TextField(blank=True, default='', verbose_name=_('notes'))
 
+    # Incremented on every change, so that concurrent edits can be detected
+    # (see matches.merging)
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('version'))
+
+    def save(self, *args, **kwargs):
+        updating = not self._state.adding
+        if updating:
+            # Incremented by the database, so concurrent saves never get the same version
+            self.version = models.F('version') + 1
+        super().save(*args, **kwargs)
+        if updating:
+            self.refresh_from_db(fields=['version'])
+
     def clean(self):
         super().clean()
         if (self.match_as_black is None) == (self.match_as_white is None):
@@ -1,6 +1,13 @@
 import graphene
+from graphene.utils.str_converters import to_camel_case
 from graphene_django import DjangoObjectType
-from .models import Match, MatchResult, Score
+from graphene_django.converter import convert_django_field_with_choices
+from graphene_django.registry import get_global_registry
+from robocat.loaders import get_loaders
+from robocat.reference_data import get_record
+from robocat.pagination import KeysetConnectionField
+from .models import Match, MatchResult, Score, PartialScore
+from .submission import ScoreSubmission, InvalidSubmission, submit_scores
 
 class ScoreType(DjangoObjectType):
     class Meta:
@@ -11,15 +18,48 @@ class ScoreType(DjangoObjectType):
             'cubes_on_white_field', 'cubes_on_black_field',
             'white_adhoc', 'black_adhoc', 'notes']
 
-class MatchType(DjangoObjectType):
+class PartialScoreType(DjangoObjectType):
+    class Meta:
+        model = PartialScore
+        fields = ['disqualified', 'stalled', 'cubes_on_lower_goal',
+            'cubes_on_upper_goal', 'cubes_on_field', 'adhoc', 'notes']
+
+class MatchRelationsMixin:
+    """
+    Resolvers for the related objects of a match, served from the reference data or
+    batched through the request loaders
+    """
+    partial_white_score = graphene.Field(PartialScoreType)
+    partial_black_score = graphene.Field(PartialScoreType)
+
+    def resolve_white_team(self, info, **kwargs):
+        return get_record(info, 'team', self.white_team_id)
+
+    def resolve_black_team(self, info, **kwargs):
+        return get_record(info, 'team', self.black_team_id)
+
+    def resolve_score(self, info, **kwargs):
+        return get_loaders(info).score.load(self.id)
+
+    def resolve_partial_white_score(self, info, **kwargs):
+        return get_loaders(info).partial_white.load(self.id)
+
+    def resolve_partial_black_score(self, info, **kwargs):
+        return get_loaders(info).partial_black.load(self.id)
+
+class MatchType(MatchRelationsMixin, DjangoObjectType):
     class Meta:
         model = Match
         fields = ['id', 'white_team', 'black_team', 'status', 'score']
 
+# Enum generated by graphene-django for Match.status, for use in arguments
+MatchStatusEnum = convert_django_field_with_choices(
+    Match._meta.get_field('status'), get_global_registry()).get_type()
+
 MatchResultEnum = graphene.Enum.from_enum(MatchResult, description=lambda v:
     v.description if v is not None else None)
 
-class ScoredMatchType(DjangoObjectType):
+class ScoredMatchType(MatchRelationsMixin, DjangoObjectType):
     class Meta:
         model = Match
         fields = ['id', 'white_team', 'black_team', 'status', 'score']
@@ -45,10 +85,93 @@ class ScoredMatchType(DjangoObjectType):
     def resolve_result(self, info, **kwargs):
         return self.result
 
+class ScoreInput(graphene.InputObjectType):
+    white_disqualified = graphene.Boolean(default_value=False)
+    black_disqualified = graphene.Boolean(default_value=False)
+    white_stalled = graphene.Boolean(default_value=False)
+    black_stalled = graphene.Boolean(default_value=False)
+    cubes_on_lower_white = graphene.Int(required=True)
+    cubes_on_lower_black = graphene.Int(required=True)
+    cubes_on_upper_white = graphene.Int(required=True)
+    cubes_on_upper_black = graphene.Int(required=True)
+    cubes_on_white_field = graphene.Int(required=True)
+    cubes_on_black_field = graphene.Int(required=True)
+    white_adhoc = graphene.Int(default_value=0)
+    black_adhoc = graphene.Int(default_value=0)
+    notes = graphene.String(default_value='')
+
+class PartialScoreInput(graphene.InputObjectType):
+    disqualified = graphene.Boolean(default_value=False)
+    stalled = graphene.Boolean(default_value=False)
+    cubes_on_lower_goal = graphene.Int(required=True)
+    cubes_on_upper_goal = graphene.Int(required=True)
+    cubes_on_field = graphene.Int(required=True)
+    adhoc = graphene.Int(default_value=0)
+    notes = graphene.String(default_value='')
+
+class MatchScoresInput(graphene.InputObjectType):
+    """
+    Scores of a match. Omitted scores (and status) are left unchanged.
+    """
+    match_id = graphene.UUID(required=True)
+    status = MatchStatusEnum()
+    score = ScoreInput()
+    partial_white_score = PartialScoreInput()
+    partial_black_score = PartialScoreInput()
+
+class ScoreSubmissionError(graphene.ObjectType):
+    index = graphene.Int(required=True, description='Index of the submitted scores with the error')
+    field = graphene.String(description='Path of the field with the error, if any')
+    message = graphene.String(required=True)
+
+def _error_path(field):
+    return '.'.join(map(to_camel_case, field.split('.')))
+
+class SubmitScores(graphene.Mutation):
+    """
+    Submit the scores of many matches at once. Either all of them are saved, or
+    none of them (if any is invalid, see `errors`).
+    """
+    class Arguments:
+        scores = graphene.List(graphene.NonNull(MatchScoresInput), required=True)
+
+    ok = graphene.Boolean(required=True)
+    errors = graphene.List(graphene.NonNull(ScoreSubmissionError), required=True)
+    matches = graphene.List(graphene.NonNull(ScoredMatchType), description='The submitted matches, rescored')
+
+    @staticmethod
+    def mutate(parent, info, scores):
+        if not info.context.user.is_staff:
+            return SubmitScores(ok=False, errors=[])
+        submissions = [
+            ScoreSubmission(
+                match_id=entry.match_id,
+                status=entry.get('status'),
+                score=entry.get('score'),
+                partial_white_score=entry.get('partial_white_score'),
+                partial_black_score=entry.get('partial_black_score'),
+            )
+            for entry in scores
+        ]
+        try:
+            matches = submit_scores(submissions)
+        except InvalidSubmission as e:
+            return SubmitScores(ok=False, errors=[
+                ScoreSubmissionError(index=error.index, field=error.field and _error_path(error.field),
+                    message=error.message)
+                for error in e.errors
+            ])
+        return SubmitScores(ok=True, errors=[], matches=matches)
+
+class Mutation:
+    submit_scores = SubmitScores.Field()
+
 class Query:
     all_matches = graphene.List(graphene.NonNull(MatchType))
     match = graphene.Field(MatchType, matchId=graphene.UUID(required=True))
     all_scored_matches = graphene.List(graphene.NonNull(ScoredMatchType))
+    matches_connection = KeysetConnectionField(MatchType, ordering=('id',))
+    scored_matches_connection = KeysetConnectionField(ScoredMatchType, ordering=('id',))
     scored_match = graphene.Field(ScoredMatchType, matchId=graphene.UUID(required=True))
 
     def resolve_all_matches(self, info, **kwargs):
@@ -60,5 +183,11 @@ class Query:
     def resolve_all_scored_matches(self, info, **kwargs):
         return Match.scored_objects.all()
 
+    def resolve_matches_connection(self, info, **kwargs):
+        return Match.objects.all()
+
+    def resolve_scored_matches_connection(self, info, **kwargs):
+        return Match.scored_objects.all()
+
     def resolve_scored_match(self, info, matchId, **kwargs):
         return Match.scored_objects.filter(id=matchId).first()
@@ -0,0 +1,248 @@
+"""
+Scoring rules of a match, defined once and compiled both to Django ORM
+expressions (used to annotate querysets) and to Python functions (used to
+score batches of rows in memory, e.g. for exports or simulations).
+
+See the comments on `Score` for a description of each field. As on those
+comments, rules are written for the current team (`self`) against its
+adversary (`other`); field names use `{self}` and `{other}` as placeholders
+for 'white' and 'black'.
+"""
+import enum
+from collections import namedtuple
+from django.db import models
+from django.db.models import F, Q, Case, When, Value, ExpressionWrapper
+from django.utils.translation import gettext_lazy as _
+
+@enum.unique
+class MatchResult(enum.Enum):
+    WHITE_WINS = 'W'
+    BLACK_WINS = 'B'
+    DRAW = 'D'
+    BOTH_LOSE = 'F'
+
+    @property
+    def description(self):
+        return {
+            self.WHITE_WINS: _('White team wins'),
+            self.BLACK_WINS: _('Black team wins'),
+            self.DRAW: _('Both teams have got the same score'),
+            self.BOTH_LOSE: _('Both teams have been disqualified. Nobody wins')
+        }[self]
+
+SIDES = ('white', 'black')
+
+def _other(side):
+    return 'black' if side == 'white' else 'white'
+
+def _field(template, side):
+    return template.format(self=side, other=_other(side))
+
+# Conditions
+
+class IsTrue:
+    def __init__(self, field):
+        self.field = field
+
+    def fields(self):
+        return (self.field,)
+
+    def q(self, side, prefix):
+        return Q(**{prefix + _field(self.field, side): True})
+
+    def py(self, side, index):
+        i = index[_field(self.field, side)]
+        return lambda row: bool(row[i])
+
+class IsFalse(IsTrue):
+    def q(self, side, prefix):
+        return Q(**{prefix + _field(self.field, side): False})
+
+    def py(self, side, index):
+        i = index[_field(self.field, side)]
+        return lambda row: not row[i]
+
+class Less:
+    def __init__(self, lhs, rhs):
+        self.lhs = lhs
+        self.rhs = rhs
+
+    def fields(self):
+        return (self.lhs, self.rhs)
+
+    def q(self, side, prefix):
+        return Q(**{prefix + _field(self.lhs, side) + '__lt': F(prefix + _field(self.rhs, side))})
+
+    def py(self, side, index):
+        i, j = index[_field(self.lhs, side)], index[_field(self.rhs, side)]
+        return lambda row: row[i] < row[j]
+
+# Terms
+
+class Points:
+    """`points` for each unit of `field`"""
+    def __init__(self, points, field):
+        self.points = points
+        self.field = field
+
+    def fields(self):
+        return (self.field,)
+
+    def expression(self, side, prefix):
+        expression = F(prefix + _field(self.field, side))
+        return expression if self.points == 1 else self.points * expression
+
+    def py(self, side, index):
+        i, points = index[_field(self.field, side)], self.points
+        return lambda row: points * row[i]
+
+class Bonus:
+    """`points` if `condition` holds"""
+    def __init__(self, points, condition):
+        self.points = points
+        self.condition = condition
+
+    def fields(self):
+        return self.condition.fields()
+
+    def expression(self, side, prefix):
+        return Case(When(self.condition.q(side, prefix), then=Value(self.points)), default=Value(0))
+
+    def py(self, side, index):
+        condition, points = self.condition.py(side, index), self.points
+        return lambda row: points if condition(row) else 0
+
+# The rules. These are the only definition of the scoring: everything else is derived from them.
+
+SCORE_TERMS = (
+    # Cubes on the adversary's lower goal
+    Points(1, 'cubes_on_lower_{other}'),
+    # Cubes on the adversary's upper goal
+    Points(5, 'cubes_on_upper_{other}'),
+    # Less cubes on the own field than on the adversary's
+    Bonus(10, Less('cubes_on_{self}_field', 'cubes_on_{other}_field')),
+    # Not having stalled
+    Bonus(10, IsFalse('{self}_stalled')),
+)
+# A disqualified team does not get any score...
+DISQUALIFIED = IsTrue('{self}_disqualified')
+# ...but ad-hoc points are always awarded
+ADHOC = '{self}_adhoc'
+
+WIN_POINTS = 3
+DRAW_POINTS = 1
+LOSS_POINTS = 0
+
+RESULTS = {
+    (WIN_POINTS, LOSS_POINTS): MatchResult.WHITE_WINS,
+    (LOSS_POINTS, WIN_POINTS): MatchResult.BLACK_WINS,
+    (DRAW_POINTS, DRAW_POINTS): MatchResult.DRAW,
+    (LOSS_POINTS, LOSS_POINTS): MatchResult.BOTH_LOSE,
+}
+
+# Fields of Score used by the rules, in the order expected by the batch evaluator
+FIELDS = tuple(sorted({
+    _field(template, side)
+    for side in SIDES
+    for template in (
+        *(field for term in SCORE_TERMS for field in term.fields()),
+        *DISQUALIFIED.fields(),
+        ADHOC
+    )
+}))
+
+# ORM compiler
+
+def score_expression(side, prefix=''):
+    """
+    Expression for the score of the given side. `prefix` is the path from the
+    model being queried to Score (e.g. 'score__' for Match).
+    """
+    score = sum((term.expression(side, prefix) for term in SCORE_TERMS[1:]),
+        SCORE_TERMS[0].expression(side, prefix))
+    return ExpressionWrapper(
+        Case(When(DISQUALIFIED.q(side, prefix), then=Value(0)), default=score)
+        + F(prefix + _field(ADHOC, side)),
+        output_field=models.IntegerField()
+    )
+
+def qualification_points_expression(side, prefix=''):
+    """
+    Expression for the qualification points of the given side. Requires the scores
+    of both sides to be annotated as `white_score` and `black_score`.
+    """
+    own, other = f'{side}_score', f'{_other(side)}_score'
+    return Case(
+        When(DISQUALIFIED.q(side, prefix), then=Value(LOSS_POINTS)),
+        When(**{f'{own}__gt': F(other)}, then=Value(WIN_POINTS)),
+        When(**{own: F(other)}, then=Value(DRAW_POINTS)),
+        When(**{f'{own}__lt': F(other)}, then=Value(LOSS_POINTS)),
+        output_field=models.IntegerField()
+    )
+
+def result_expression():
+    """
+    Expression for the result of a match. Requires the qualification points of both
+    sides to be annotated as `white_qualification_points` and `black_qualification_points`.
+    """
+    return Case(
+        *(When(white_qualification_points=white, black_qualification_points=black,
+            then=Value(result.value))
+          for (white, black), result in RESULTS.items()),
+        output_field=models.CharField()
+    )
+
+# Batch evaluator
+
+ScoreResult = namedtuple('ScoreResult', ('white_score', 'black_score',
+    'white_qualification_points', 'black_qualification_points', 'result'))
+
+def _compile_side(side):
+    index = { name: i for i, name in enumerate(FIELDS) }
+    terms = tuple(term.py(side, index) for term in SCORE_TERMS)
+    disqualified = DISQUALIFIED.py(side, index)
+    adhoc = index[_field(ADHOC, side)]
+
+    def score(row):
+        base = 0 if disqualified(row) else sum(term(row) for term in terms)
+        return base + row[adhoc]
+
+    return score, disqualified
+
+def _compile():
+    (white_score, white_disqualified), (black_score, black_disqualified) = map(_compile_side, SIDES)
+
+    def qualification_points(own, other, disqualified):
+        if disqualified:
+            return LOSS_POINTS
+        if own > other:
+            return WIN_POINTS
+        if own == other:
+            return DRAW_POINTS
+        return LOSS_POINTS
+
+    def evaluate(row):
+        white, black = white_score(row), black_score(row)
+        white_qp = qualification_points(white, black, white_disqualified(row))
+        black_qp = qualification_points(black, white, black_disqualified(row))
+        result = RESULTS.get((white_qp, black_qp))
+        return ScoreResult(white, black, white_qp, black_qp, result and result.value)
+
+    return evaluate
+
+_evaluate = _compile()
+
+def evaluate_rows(rows):
+    """
+    Score rows of Score fields, in the order of `FIELDS` (e.g. as returned by
+    `Score.objects.values_list(*scoring.FIELDS)`), in a single pass.
+    Returns a list of ScoreResult.
+    """
+    return list(map(_evaluate, rows))
+
+def evaluate_scores(scores):
+    """
+    Score Score instances (or any objects with the fields in `FIELDS`).
+    Returns a list of ScoreResult.
+    """
+    return evaluate_rows(tuple(getattr(score, name) for name in FIELDS) for score in scores)
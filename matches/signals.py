@@ -0,0 +1,89 @@
+from functools import partial
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import Signal, receiver
+from robocat import data_version, events
+from .models import Match, Score, PartialScore
+
+# Sent whenever the result of some matches may have changed, i.e. a score has been
+# created, edited or deleted, or a match has been edited or deleted.
+# Arguments:
+# - match_ids: set of IDs of the affected matches
+# - team_ids: set of IDs of the affected teams, including teams that took part on
+#   an affected match before it was edited
+# Bulk operations (which bypass the model signals) must send it explicitly.
+results_changed = Signal()
+
+def _teams_of_matches(match_ids):
+    team_ids = set()
+    for white_team_id, black_team_id in (Match.objects.filter(id__in=match_ids)
+            .values_list('white_team_id', 'black_team_id')):
+        team_ids.update((white_team_id, black_team_id))
+    team_ids.discard(None)
+    return team_ids
+
+def send_results_changed(sender, match_ids, team_ids=()):
+    """
+    Send `results_changed` for the given matches. Teams currently taking part
+    on the matches are found automatically; `team_ids` is only needed for teams
+    that no longer take part on them.
+    """
+    match_ids = set(match_ids)
+    team_ids = set(team_ids) | _teams_of_matches(match_ids)
+    team_ids.discard(None)
+    results_changed.send(sender=sender, match_ids=match_ids, team_ids=team_ids)
+
+@receiver(post_save, sender=Score)
+@receiver(post_delete, sender=Score)
+def score_changed(sender, instance, **kwargs):
+    send_results_changed(sender, {instance.match_id})
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def match_changed(sender, instance, **kwargs):
+    send_results_changed(
+        sender,
+        {instance.id},
+        {instance.white_team_id, instance.black_team_id, *instance.loaded_team_ids}
+    )
+
+@receiver(post_save, sender=PartialScore)
+def partial_score_changed(sender, instance, **kwargs):
+    from .merging import merge_partial_scores # Imports this module
+    match_id = instance.match_as_white_id or instance.match_as_black_id
+    if match_id is not None:
+        transaction.on_commit(partial(merge_partial_scores, match_id))
+
+@receiver(post_save, sender=Match)
+def match_status_changed(sender, instance, **kwargs):
+    if instance.status != instance.loaded_status:
+        events.notify('match-status', {instance.id})
+
+data_version.track(Match, Score, PartialScore)
+
+@receiver(results_changed)
+def bump_data_version(sender, **kwargs):
+    # Covers the bulk operations, which bypass the model signals
+    data_version.bump()
+
+@receiver(results_changed)
+def notify_scores(sender, match_ids, **kwargs):
+    events.notify('scores', match_ids)
+
+@events.producer('match-status')
+def produce_match_status(match_ids):
+    return list(Match.objects.filter(id__in=match_ids).values('id', 'status'))
+
+@events.producer('scores')
+def produce_scores(match_ids):
+    matches = list(
+        Match.scored_objects.filter(id__in=match_ids)
+        .values('id', 'status', 'white_team__key', 'black_team__key',
+            'white_score', 'black_score', 'white_qualification_points',
+            'black_qualification_points', 'result')
+    )
+    found = { match['id'] for match in matches }
+    return {
+        'matches': matches,
+        'deleted': [match_id for match_id in match_ids if match_id not in found]
+    }
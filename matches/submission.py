@@ -0,0 +1,166 @@
+"""
+Bulk submission of scores: the scores, partial scores and statuses of many
+matches are validated together and written in a single transaction, with a
+fixed number of queries regardless of the number of matches.
+"""
+from collections import namedtuple
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils.translation import gettext as e_
+from robocat import events
+from .merging import merge_partial_scores
+from .models import Match, Score, PartialScore
+from .signals import send_results_changed
+
+# Scores of a match. `score`, `partial_white_score` and `partial_black_score` are dicts of
+# field values of Score and PartialScore (or None to leave them unchanged), and
+# `status` is a Match.Status (or None to leave it unchanged).
+ScoreSubmission = namedtuple('ScoreSubmission',
+    ('match_id', 'status', 'score', 'partial_white_score', 'partial_black_score'))
+
+# Error on the submission at `index`, on `field` (None if not specific to a field)
+SubmissionError = namedtuple('SubmissionError', ('index', 'field', 'message'))
+
+class InvalidSubmission(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+# Including the merged versions, which are cleared: scores submitted directly
+# are never replaced by merges of partial scores (see matches.merging)
+SCORE_FIELDS = tuple(field.name for field in Score._meta.concrete_fields
+    if field.name not in ('id', 'match'))
+PARTIAL_SCORE_FIELDS = tuple(field.name for field in PartialScore._meta.concrete_fields
+    if field.name not in ('id', 'match_as_white', 'match_as_black'))
+
+def _instance_errors(index, prefix, instance, exclude):
+    errors = {}
+    try:
+        instance.clean_fields(exclude=exclude)
+    except ValidationError as e:
+        errors = e.message_dict
+    # Not validated by every database backend
+    for field in instance._meta.concrete_fields:
+        value = getattr(instance, field.attname)
+        if isinstance(field, models.PositiveIntegerField) and value is not None and field.name not in errors:
+            try:
+                MinValueValidator(0)(value)
+            except ValidationError as e:
+                errors[field.name] = e.messages
+    return [
+        SubmissionError(index, f'{prefix}.{field}', message)
+        for field, messages in errors.items()
+        for message in messages
+    ]
+
+def _build(submissions):
+    """
+    Build the unsaved instances of the submissions, and validate them in batch.
+    Returns (matches, scores, partial_scores), or raises InvalidSubmission.
+    """
+    errors = []
+    matches = Match.objects.in_bulk({ submission.match_id for submission in submissions })
+    seen = set()
+    scores, partial_scores = [], []
+    for index, submission in enumerate(submissions):
+        match = matches.get(submission.match_id)
+        if match is None:
+            errors.append(SubmissionError(index, 'match_id', e_('Match not found')))
+            continue
+        if submission.match_id in seen:
+            errors.append(SubmissionError(index, 'match_id', e_('Match submitted more than once')))
+            continue
+        seen.add(submission.match_id)
+        if submission.status is not None and submission.status not in Match.Status.values:
+            errors.append(SubmissionError(index, 'status', e_('Invalid status')))
+        if submission.score is not None:
+            score = Score(match=match, **submission.score)
+            errors += _instance_errors(index, 'score', score, ('match',))
+            scores.append(score)
+        for side in ('white', 'black'):
+            prefix = f'partial_{side}_score'
+            values = getattr(submission, prefix)
+            if values is not None:
+                partial_score = PartialScore(**{f'match_as_{side}': match}, **values)
+                errors += _instance_errors(index, prefix, partial_score,
+                    ('match_as_white', 'match_as_black'))
+                partial_scores.append(partial_score)
+    if errors:
+        raise InvalidSubmission(errors)
+    return matches, scores, partial_scores
+
+def _upsert(model, instances, existing, fields):
+    """
+    Save `instances`, updating those whose key is in `existing` (a dict of
+    key to primary key) and creating the rest. Django has no bulk upsert.
+    """
+    to_update, to_create = [], []
+    for key, instance in instances:
+        instance.pk = existing.get(key)
+        if instance.pk is not None:
+            if 'version' in fields:
+                instance.version = F('version') + 1
+            to_update.append(instance)
+        else:
+            to_create.append(instance)
+    if to_update:
+        model.objects.bulk_update(to_update, fields)
+    if to_create:
+        model.objects.bulk_create(to_create)
+
+def _partial_key(partial_score):
+    if partial_score.match_as_white_id is not None:
+        return ('white', partial_score.match_as_white_id)
+    return ('black', partial_score.match_as_black_id)
+
+def submit_scores(submissions):
+    """
+    Validate and save the given ScoreSubmissions in a single transaction.
+    Partial scores are merged (see matches.merging) into the scores not submitted
+    directly, one match at a time. Returns the submitted matches from
+    Match.scored_objects, in the order of the submissions, or raises
+    InvalidSubmission (and nothing is saved).
+    """
+    with transaction.atomic():
+        matches, scores, partial_scores = _build(submissions)
+        match_ids = [submission.match_id for submission in submissions]
+
+        existing_scores = dict(
+            Score.objects.select_for_update()
+            .filter(match_id__in=[score.match_id for score in scores])
+            .values_list('match_id', 'id')
+        )
+        _upsert(Score, ((score.match_id, score) for score in scores), existing_scores, SCORE_FIELDS)
+
+        partial_match_ids = [match_id for _, match_id in map(_partial_key, partial_scores)]
+        existing_partial_scores = {
+            _partial_key(partial): partial.pk
+            for partial in PartialScore.objects.select_for_update()
+                .filter(Q(match_as_white__in=partial_match_ids) | Q(match_as_black__in=partial_match_ids))
+                .only('id', 'match_as_white', 'match_as_black')
+        }
+        _upsert(PartialScore, ((_partial_key(partial), partial) for partial in partial_scores),
+            existing_partial_scores, PARTIAL_SCORE_FIELDS)
+
+        # One update per status
+        statuses = {}
+        for submission in submissions:
+            if submission.status is not None and submission.status != matches[submission.match_id].status:
+                statuses.setdefault(submission.status, []).append(submission.match_id)
+        for status, ids in statuses.items():
+            Match.objects.filter(id__in=ids).update(status=status)
+
+        # Bulk operations bypass the model signals
+        if statuses:
+            events.notify('match-status', [match_id for ids in statuses.values() for match_id in ids])
+        send_results_changed(Score, match_ids)
+
+        for submission in submissions:
+            if submission.score is None and (submission.partial_white_score is not None
+                    or submission.partial_black_score is not None):
+                merge_partial_scores(submission.match_id)
+
+        results = Match.scored_objects.in_bulk(match_ids)
+        return [results[match_id] for match_id in match_ids]
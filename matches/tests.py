@@ -1,3 +1,823 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from robocat.asgi import application, EVENTS_PATH
+from robocat import data_version, persisted_queries, replicas, tracing
+from robocat.events import get_broker
+from robocat.schema import schema
+from teams.models import Category, Institution, Team
+from . import exporting, scoring
+from .merging import StaleVersion, merge_partial_scores, submit_partial_score
+from .models import Match, Score, PartialScore
+from .signals import send_results_changed
 
-# Create your tests here.
+def make_score(match, **kwargs):
+    fields = {
+        'cubes_on_lower_white': 0, 'cubes_on_lower_black': 0,
+        'cubes_on_upper_white': 0, 'cubes_on_upper_black': 0,
+        'cubes_on_white_field': 0, 'cubes_on_black_field': 0,
+    }
+    fields.update(kwargs)
+    return Score.objects.create(match=match, **fields)
+
+def make_teams(count, categories=1, institutions=1):
+    categories = [
+        Category.objects.create(key=f'cat-{i}', name=f'Category {i}', colour='red')
+        for i in range(categories)
+    ]
+    institutions = [
+        Institution.objects.create(key=f'inst-{i}', name=f'Institution {i}')
+        for i in range(institutions)
+    ]
+    return [
+        Team.objects.create(key=f'team-{i}', name=f'Team {i}',
+            category=categories[i % len(categories)],
+            institution=institutions[i % len(institutions)])
+        for i in range(count)
+    ]
+
+def execute(query, user=None, **variables):
+    context = SimpleNamespace(user=user or AnonymousUser())
+    result = schema.execute(query, context=context, variables=variables)
+    if result.errors:
+        raise result.errors[0]
+    return result.data
+
+class ScoringTests(TestCase):
+    def random_score(self, rng, match):
+        return Score(
+            match=match,
+            white_disqualified=rng.random() < 0.1,
+            black_disqualified=rng.random() < 0.1,
+            white_stalled=rng.random() < 0.3,
+            black_stalled=rng.random() < 0.3,
+            cubes_on_lower_white=rng.randint(0, 6),
+            cubes_on_lower_black=rng.randint(0, 6),
+            cubes_on_upper_white=rng.randint(0, 4),
+            cubes_on_upper_black=rng.randint(0, 4),
+            cubes_on_white_field=rng.randint(0, 5),
+            cubes_on_black_field=rng.randint(0, 5),
+            white_adhoc=rng.choice((0, 0, 0, -5, 5)),
+            black_adhoc=rng.choice((0, 0, 0, -5, 5)),
+        )
+
+    def test_sql_python_parity(self):
+        rng = random.Random(2020)
+        a, b = make_teams(2)
+        matches = Match.objects.bulk_create(Match(white_team=a, black_team=b) for _ in range(500))
+        Score.objects.bulk_create(self.random_score(rng, match) for match in matches)
+
+        sql = {
+            match_id: scoring.ScoreResult(*values)
+            for match_id, *values in Match.scored_objects.values_list('id', 'white_score', 'black_score',
+                'white_qualification_points', 'black_qualification_points', 'result')
+        }
+        rows = Score.objects.values_list('match_id', *scoring.FIELDS)
+        python = dict(zip((row[0] for row in rows), scoring.evaluate_rows(row[1:] for row in rows)))
+        self.assertEqual(python, sql)
+        # All the results are exercised
+        self.assertLessEqual({result.value for result in scoring.MatchResult},
+            {result.result for result in python.values()})
+
+    def test_rules(self):
+        a, b = make_teams(2)
+        score = make_score(Match.objects.create(white_team=a, black_team=b),
+            white_stalled=True, white_adhoc=3, cubes_on_upper_black=1, cubes_on_white_field=2)
+        # Stalling loses the 10 points bonus, ad-hoc points are counted once
+        self.assertEqual((score.white_score_py, score.black_score_py), (8, 20))
+        score.black_disqualified = True
+        self.assertEqual(score.result_py, (8, 0, 3, 0, 'W'))
+
+class LoaderTests(TestCase):
+    QUERY = '''{
+        allScoredMatches {
+            whiteTeam { id institutionName category { id } }
+            blackTeam { id institutionName category { id } }
+            score { notes }
+            partialWhiteScore { adhoc }
+            partialBlackScore { adhoc }
+        }
+    }'''
+
+    def make_matches(self, teams):
+        for white_team, black_team in zip(teams, teams[1:]):
+            match = Match.objects.create(white_team=white_team, black_team=black_team)
+            if white_team.pk % 2:
+                make_score(match)
+
+    def test_bounded_queries(self):
+        teams = make_teams(26, categories=3, institutions=5)
+        self.make_matches(teams[:5])
+        # matches, the reference data (loaded on each request within the test transaction),
+        # scores and both partial scores
+        with self.assertNumQueries(8):
+            execute(self.QUERY)
+        self.make_matches(teams[5:])
+        with self.assertNumQueries(8):
+            data = execute(self.QUERY)
+        self.assertEqual(len(data['allScoredMatches']), 24)
+
+    def test_bye(self):
+        team, = make_teams(1)
+        Match.objects.create(white_team=team)
+        data = execute(self.QUERY)
+        self.assertIsNone(data['allScoredMatches'][0]['blackTeam'])
+        self.assertEqual(data['allScoredMatches'][0]['whiteTeam']['institutionName'], 'Institution 0')
+
+class LiveEventsTests(TransactionTestCase):
+    @staticmethod
+    def in_thread(function):
+        # The ORM may not be used from the event loop
+        def run():
+            try:
+                function()
+            finally:
+                connection.close()
+        return asyncio.get_running_loop().run_in_executor(None, run)
+
+    @staticmethod
+    async def next_event(subscription):
+        message = (await asyncio.wait_for(subscription.get(), 5)).decode()
+        event, data = message.split('\n')[:2]
+        return event[len('event: '):], json.loads(data[len('data: '):])
+
+    def test_events_published_once_per_transaction(self):
+        a, b = make_teams(2)
+        match = Match.objects.create(white_team=a, black_team=b)
+
+        async def scenario():
+            subscription = get_broker().subscribe()
+            try:
+                def play():
+                    with transaction.atomic():
+                        match.status = Match.Status.FINISHED
+                        match.save()
+                        make_score(match, cubes_on_upper_black=1)
+                await self.in_thread(play)
+                events = dict([await self.next_event(subscription) for _ in range(3)])
+                self.assertTrue(subscription.queue.empty())
+            finally:
+                subscription.close()
+            return events
+
+        events = asyncio.run(scenario())
+        self.assertEqual(events['match-status'], [{'id': str(match.id), 'status': 'FI'}])
+        scored, = events['scores']['matches']
+        self.assertEqual((scored['white_score'], scored['result']), (15, 'W'))
+        self.assertEqual(events['ranking'][0]['key'], a.key)
+
+    def test_sse_stream(self):
+        a, b = make_teams(2)
+        match = Match.objects.create(white_team=a, black_team=b)
+
+        async def scenario():
+            received = asyncio.Queue()
+            sent = []
+            async def receive():
+                return await received.get()
+            async def send(message):
+                sent.append(message)
+                if message.get('body'):
+                    await received.put({'type': 'http.disconnect'})
+            scope = {'type': 'http', 'path': EVENTS_PATH, 'query_string': b'events=match-status'}
+            stream = asyncio.ensure_future(application(scope, receive, send))
+            while not get_broker().subscriptions:
+                await asyncio.sleep(0.01)
+            def play():
+                make_score(match)
+                match.status = Match.Status.PLAYING
+                match.save()
+            await self.in_thread(play)
+            await asyncio.wait_for(stream, 5)
+            return sent
+
+        start, body = asyncio.run(scenario())
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertTrue(body['body'].startswith(b'event: match-status\n'))
+        self.assertFalse(get_broker().subscriptions)
+
+@override_settings(GRAPHQL_QUERY_COST={'MAX_COST': 100, 'MAX_DEPTH': 5, 'DEFAULT_LIST_SIZE': 10})
+class QueryCostTests(TestCase):
+    def post(self, query):
+        return self.client.post(reverse('graphql'), {'query': query}, content_type='application/json')
+
+    def test_cost_extension(self):
+        make_teams(2)
+        response = self.post('{ allTeams { id category { id } } }')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['allTeams']), 2)
+        self.assertEqual(response.json()['extensions']['cost'],
+            {'requested': 20, 'maximum': 100, 'depth': 3, 'maximumDepth': 5})
+
+    def test_rejected_before_execution(self):
+        with self.assertNumQueries(0):
+            response = self.post('{ allSchedules { matches { match { whiteTeam { id } } } } allTeams { id } }')
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('data', response.json())
+        self.assertIn('exceeds the maximum cost', response.json()['errors'][0]['message'])
+
+    def test_depth(self):
+        response = self.post('{ allSchedules { matches { match { whiteTeam { category { name } } } } } }')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceeds the maximum depth', response.json()['errors'][0]['message'])
+
+    def test_paginated_fields(self):
+        response = self.post('{ teamsConnection(first: 3) { edges { node { id } } } }')
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 9)
+
+    def test_fragments(self):
+        # Costed once, but counted at every spread
+        response = self.post('{ allTeams { ...F ... on TeamType { ...F } } } '
+            'fragment F on TeamType { category { id } }')
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 30)
+
+    def test_recursive_fragments(self):
+        for query in ('{ allTeams { ...A } } fragment A on TeamType { id ...A }',
+                '{ allTeams { ...A } } fragment A on TeamType { ...B } fragment B on TeamType { id ...A }'):
+            response = self.post(query)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('within itself', response.json()['errors'][0]['message'])
+
+    def test_doubling_fragments(self):
+        # Each fragment spreads the previous one twice: 2 ** 20 categories, costed in linear time
+        fragments = ['fragment F0 on TeamType { category { id } }'] + [
+            'fragment F%d on TeamType { ...F%d ... on TeamType { ...F%d } }' % (i, i - 1, i - 1)
+            for i in range(1, 21)
+        ]
+        with self.assertNumQueries(0):
+            response = self.post('{ allTeams { ...F20 } } ' + ' '.join(fragments))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceeds the maximum cost', response.json()['errors'][0]['message'])
+
+    def test_limited_lists(self):
+        # By the default of their limit (10)
+        response = self.post('{ upNext { table } }')
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 10)
+        response = self.post('{ upNext(limit: 4) { table } }')
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 4)
+        # No longer than expected of the whole list
+        with override_settings(GRAPHQL_QUERY_COST={'MAX_COST': 100, 'LIST_SIZES': {'Query.upNext': 3}}):
+            response = self.post('{ upNext(limit: 50) { table } }')
+        self.assertEqual(response.json()['extensions']['cost']['requested'], 3)
+
+@override_settings(GRAPHQL_RESPONSE_CACHE={'ENABLED': False})
+class PersistedQueryTests(TestCase):
+    QUERY = '{ allTeams { id } }'
+
+    def setUp(self):
+        cache.clear()
+        persisted_queries.document_cache.clear()
+
+    def post(self, query=None, document_hash=None):
+        data = {}
+        if query is not None:
+            data['query'] = query
+        if document_hash is not None:
+            data['extensions'] = {'persistedQuery': {'version': 1, 'sha256Hash': document_hash}}
+        return self.client.post(reverse('graphql'), data, content_type='application/json')
+
+    def test_automatic_registration(self):
+        make_teams(1)
+        document_hash = persisted_queries.document_hash(self.QUERY)
+        response = self.post(document_hash=document_hash)
+        self.assertEqual(response.json()['errors'][0]['message'], 'PersistedQueryNotFound')
+        self.assertEqual(len(self.post(self.QUERY, document_hash).json()['data']['allTeams']), 1)
+        self.assertEqual(len(self.post(document_hash=document_hash).json()['data']['allTeams']), 1)
+        response = self.post(self.QUERY, 'wrong')
+        self.assertEqual(response.json()['errors'][0]['message'], 'Provided sha does not match query')
+
+    def test_invalid_documents_not_registered(self):
+        for query in ('{ allTeams { unknown } }', '{ allTeams {', '{ allSchedules { matches { match { id } } } }'):
+            document_hash = persisted_queries.document_hash(query)
+            self.assertIn('errors', self.post(query, document_hash).json())
+            response = self.post(document_hash=document_hash)
+            self.assertEqual(response.json()['errors'][0]['message'], 'PersistedQueryNotFound')
+
+    def test_registration_timeout(self):
+        with mock.patch('robocat.persisted_queries.cache') as cache_mock:
+            self.post(self.QUERY, persisted_queries.document_hash(self.QUERY))
+        self.assertEqual(cache_mock.set.call_args[0][2], 24 * 60 * 60)
+
+    def test_document_cache(self):
+        with mock.patch('robocat.persisted_queries.validate', wraps=persisted_queries.validate) as validate:
+            self.post(self.QUERY)
+            response = self.post(self.QUERY)
+        self.assertEqual(validate.call_count, 1)
+        self.assertEqual(response.json()['data'], {'allTeams': []})
+        # Invalid documents are not cached
+        with mock.patch('robocat.persisted_queries.validate', wraps=persisted_queries.validate) as validate:
+            self.assertEqual(self.post('{ unknown }').status_code, 400)
+            self.assertEqual(self.post('{ unknown }').status_code, 400)
+        self.assertEqual(validate.call_count, 2)
+
+    def test_bounded_document_cache(self):
+        with override_settings(GRAPHQL_PERSISTED_QUERIES={'DOCUMENT_CACHE_SIZE': 2}):
+            for query in ('{ allTeams { id } }', '{ allTeams { name } }', '{ allMatches { id } }',
+                    '{ allTeams { id } }'):
+                self.post(query)
+            self.assertEqual(list(persisted_queries.document_cache.documents), [
+                persisted_queries.document_hash('{ allMatches { id } }'),
+                persisted_queries.document_hash('{ allTeams { id } }'),
+            ])
+
+    def test_only_persisted(self):
+        other_query = '{ allTeams { name } }'
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as registry:
+            json.dump({persisted_queries.document_hash(self.QUERY): self.QUERY}, registry)
+            registry.flush()
+            with override_settings(GRAPHQL_PERSISTED_QUERIES={'REGISTRY': registry.name, 'ONLY_PERSISTED': True}):
+                self.assertEqual(self.post(self.QUERY).json()['data'], {'allTeams': []})
+                response = self.post(document_hash=persisted_queries.document_hash(self.QUERY))
+                self.assertEqual(response.json()['data'], {'allTeams': []})
+                response = self.post(other_query, persisted_queries.document_hash(other_query))
+                self.assertEqual(response.json()['errors'][0]['message'], 'Only persisted queries are allowed')
+                self.assertIsNone(self.post(other_query).json()['data'])
+                # Staff users may run any document
+                self.client.force_login(User.objects.create(username='staff', is_staff=True))
+                self.assertEqual(self.post(other_query).json()['data'], {'allTeams': []})
+
+# Traced responses are not cached
+@override_settings(GRAPHQL_TRACING={'SAMPLE_RATE': 0})
+class ResponseCacheTests(TransactionTestCase):
+    QUERY = '{ allTeams { name } }'
+
+    def setUp(self):
+        cache.clear()
+        # No replica sync (see ReplicaTests)
+        data_version.get_cache().clear()
+
+    def post(self, query=QUERY, **headers):
+        return self.client.post(reverse('graphql'), {'query': query}, content_type='application/json', **headers)
+
+    def test_not_modified(self):
+        make_teams(2)
+        response = self.post()
+        etag = response['ETag']
+        self.assertEqual(len(response.json()['data']['allTeams']), 2)
+        with self.assertNumQueries(0):
+            response = self.post(HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            # Cached, even without ETag
+            self.assertEqual(len(self.post().json()['data']['allTeams']), 2)
+        response = self.client.get(reverse('graphql'), {'query': self.QUERY}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_by_changes(self):
+        teams = make_teams(2)
+        etag = self.post()['ETag']
+        Team.objects.create(key='new', name='New', category=teams[0].category,
+            institution=teams[0].institution)
+        response = self.post(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['data']['allTeams']), 3)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Bulk operations bump the version through results_changed
+        query = '{ allScoredMatches { whiteScore } }'
+        match = Match.objects.create(white_team=teams[0], black_team=teams[1])
+        make_score(match)
+        etag = self.post(query)['ETag']
+        Score.objects.filter(match=match).update(cubes_on_lower_black=3)
+        send_results_changed(Score, {match.id})
+        response = self.post(query, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['data']['allScoredMatches'], [{'whiteScore': 13}])
+
+    def test_not_cached(self):
+        make_teams(1)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertNotIn('ETag', self.post())
+        self.client.logout()
+        response = self.post('mutation { unfreezeScoreboard { ok } }')
+        self.assertEqual(response.json()['data'], {'unfreezeScoreboard': {'ok': False}})
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('ETag', self.post('{ unknown }'))
+
+class SubmitScoresTests(TestCase):
+    MUTATION = '''
+        mutation ($scores: [MatchScoresInput!]!) {
+            submitScores(scores: $scores) {
+                ok
+                errors { index field message }
+                matches { id status whiteScore blackScore partialWhiteScore { cubesOnField } }
+            }
+        }
+    '''
+
+    def setUp(self):
+        self.teams = make_teams(12)
+        self.staff = User.objects.create(username='staff', is_staff=True)
+        self.matches = [
+            Match.objects.create(white_team=white, black_team=black)
+            for white, black in zip(self.teams[::2], self.teams[1::2])
+        ]
+
+    def submission(self, match, lower_black=0, **kwargs):
+        return {
+            'matchId': str(match.id),
+            'status': 'FI',
+            'score': {
+                'cubesOnLowerWhite': 0, 'cubesOnLowerBlack': lower_black,
+                'cubesOnUpperWhite': 0, 'cubesOnUpperBlack': 0,
+                'cubesOnWhiteField': 0, 'cubesOnBlackField': 0,
+            },
+            **kwargs
+        }
+
+    def submit(self, scores, user=None):
+        return execute(self.MUTATION, user=user or self.staff, scores=scores)['submitScores']
+
+    def test_submit(self):
+        make_score(self.matches[0], cubes_on_lower_black=9)
+        result = self.submit([
+            self.submission(match, lower_black=i,
+                partialWhiteScore={'cubesOnLowerGoal': 1, 'cubesOnUpperGoal': 0, 'cubesOnField': i})
+            for i, match in enumerate(self.matches)
+        ])
+        self.assertTrue(result['ok'])
+        self.assertEqual([match['whiteScore'] for match in result['matches']], [10 + i for i in range(6)])
+        self.assertEqual([match['partialWhiteScore']['cubesOnField'] for match in result['matches']],
+            list(range(6)))
+        self.assertEqual({match['status'] for match in result['matches']}, {'FI'})
+        self.assertEqual(Score.objects.count(), 6)
+        self.assertEqual(Score.objects.get(match=self.matches[0]).cubes_on_lower_black, 0)
+        standing = self.teams[2].standing
+        standing.refresh_from_db()
+        self.assertEqual((standing.qualification_points, standing.total_score), (3, 11))
+
+    def test_constant_queries(self):
+        def count(matches):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertTrue(self.submit([self.submission(match) for match in matches])['ok'])
+            return len(queries)
+        self.assertEqual(count(self.matches[:2]), count(self.matches[2:]))
+
+    def test_validated_in_batch(self):
+        result = self.submit([
+            self.submission(self.matches[0], lower_black=-1),
+            self.submission(self.matches[1]),
+            self.submission(self.matches[1]),
+            {'matchId': '00000000-0000-0000-0000-000000000000'},
+            self.submission(self.matches[2], partialBlackScore={'cubesOnLowerGoal': -2,
+                'cubesOnUpperGoal': 0, 'cubesOnField': 0}),
+        ])
+        self.assertFalse(result['ok'])
+        self.assertIsNone(result['matches'])
+        self.assertEqual([(error['index'], error['field']) for error in result['errors']], [
+            (0, 'score.cubesOnLowerBlack'),
+            (2, 'matchId'),
+            (3, 'matchId'),
+            (4, 'partialBlackScore.cubesOnLowerGoal'),
+        ])
+        self.assertFalse(Score.objects.exists())
+        self.assertFalse(Match.objects.exclude(status=Match.Status.NOT_PLAYED).exists())
+
+    def test_requires_staff(self):
+        result = self.submit([self.submission(self.matches[0])], user=AnonymousUser())
+        self.assertFalse(result['ok'])
+        self.assertFalse(Score.objects.exists())
+
+class PartialScoreMergingTests(TransactionTestCase):
+    def setUp(self):
+        self.teams = make_teams(8)
+        self.match = Match.objects.create(white_team=self.teams[0], black_team=self.teams[1])
+
+    def values(self, lower=0, **kwargs):
+        return {'cubes_on_lower_goal': lower, 'cubes_on_upper_goal': 0, 'cubes_on_field': 0, **kwargs}
+
+    def test_merge(self):
+        submit_partial_score(self.match, 'white', self.values(2, notes='white'))
+        self.assertFalse(Score.objects.exists())
+        submit_partial_score(self.match, 'black', self.values(3, stalled=True, notes='black'))
+        score = Score.objects.get()
+        self.assertEqual((score.cubes_on_lower_white, score.cubes_on_lower_black), (2, 3))
+        self.assertTrue(score.black_stalled)
+        self.assertEqual(score.notes, 'white\nblack')
+        self.assertEqual(Match.objects.get().status, Match.Status.FINISHED)
+        self.assertEqual(self.match.white_team.standing.total_score, 13)
+
+        # Edits are merged again
+        self.assertEqual(submit_partial_score(self.match, 'white', self.values(5), version=0), 1)
+        self.assertEqual(Score.objects.get().cubes_on_lower_white, 5)
+        self.assertEqual(Match.scored_objects.get().black_score, 5)
+
+    def test_stale_version(self):
+        submit_partial_score(self.match, 'white', self.values(1))
+        with self.assertRaises(StaleVersion):
+            submit_partial_score(self.match, 'white', self.values(2))
+        submit_partial_score(self.match, 'white', self.values(2), version=0)
+        with self.assertRaises(StaleVersion):
+            submit_partial_score(self.match, 'white', self.values(3), version=0)
+        self.assertEqual(PartialScore.objects.get().cubes_on_lower_goal, 2)
+
+    def test_not_replacing(self):
+        submit_partial_score(self.match, 'white', self.values(1))
+        submit_partial_score(self.match, 'black', self.values(1))
+        score = Score.objects.get()
+        # Already merged from these versions
+        self.assertFalse(merge_partial_scores(self.match.id))
+        # Scores corrected directly (e.g. in the admin) are kept
+        score.cubes_on_lower_white = 9
+        score.save()
+        self.assertIsNone(Score.objects.get().merged_white_version)
+        submit_partial_score(self.match, 'white', self.values(4), version=0)
+        self.assertEqual(Score.objects.get().cubes_on_lower_white, 9)
+
+    def test_concurrent_submissions(self):
+        teams = self.teams[2:4]
+        matches = [self.match] + [
+            Match.objects.create(white_team=white, black_team=black)
+            for white, black in zip(teams[::2], teams[1::2])
+        ]
+        edits = 4
+        tablets = [(match, side, tablet) for match in matches for side in ('white', 'black')
+            for tablet in range(2)]
+        barrier = threading.Barrier(len(tablets))
+        failures = []
+
+        def attempt(function, *args):
+            # The test database (SQLite in shared cache mode) fails instead of waiting
+            # while a table is being written by another connection
+            while True:
+                try:
+                    return function(*args)
+                except OperationalError:
+                    time.sleep(0.001)
+
+        def current(match, side, field):
+            return (PartialScore.objects.filter(**{f'match_as_{side}': match})
+                .values_list(field, flat=True).first())
+
+        def edit(match, side, cubes):
+            while True:
+                version = attempt(current, match, side, 'version')
+                try:
+                    submit_partial_score(match, side, self.values(cubes), version)
+                    break
+                except StaleVersion:
+                    pass
+                except OperationalError:
+                    pass
+            attempt(merge_partial_scores, match.id)
+
+        def tablet(match, side, number):
+            # Two tablets edit the partial score of each side concurrently
+            try:
+                barrier.wait()
+                for i in range(edits):
+                    edit(match, side, number * 100 + i)
+            except Exception as e:
+                failures.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=tablet, args=args) for args in tablets]
+        # Merged explicitly (and retried) after each submission, to tell apart failures
+        # to submit and failures to merge
+        with mock.patch('matches.merging.merge_partial_scores'):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(failures, [])
+
+        for match in matches:
+            white = PartialScore.objects.get(match_as_white=match)
+            black = PartialScore.objects.get(match_as_black=match)
+            # No edit was lost...
+            self.assertEqual((white.version, black.version), (2 * edits - 1, 2 * edits - 1))
+            self.assertIn(white.cubes_on_lower_goal, (edits - 1, 100 + edits - 1))
+            # ...and the score was merged from the last ones
+            score = Score.objects.get(match=match)
+            self.assertEqual((score.merged_white_version, score.merged_black_version),
+                (white.version, black.version))
+            self.assertEqual((score.cubes_on_lower_white, score.cubes_on_lower_black),
+                (white.cubes_on_lower_goal, black.cubes_on_lower_goal))
+            self.assertEqual(Match.objects.get(id=match.id).status, Match.Status.FINISHED)
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.teams = make_teams(4, categories=2)
+        # Team 2 wins against team 0 (cubes on the lower goal of white count for black); 1 and 3 draw
+        make_score(Match.objects.create(white_team=self.teams[0], black_team=self.teams[2]),
+            cubes_on_lower_white=2)
+        make_score(Match.objects.create(white_team=self.teams[1], black_team=self.teams[3]))
+        Match.objects.create(white_team=self.teams[2], black_team=self.teams[0])
+
+    def test_matches(self):
+        with self.assertNumQueries(1):
+            lines = list(exporting.export('matches', 'csv'))
+        rows = list(csv.DictReader(io.StringIO(''.join(lines))))
+        self.assertEqual(len(rows), 2)
+        lost = next(row for row in rows if row['white_team'] == 'team-0')
+        self.assertEqual((lost['black_team'], lost['black_category'], lost['result']), ('team-2', 'cat-0', 'B'))
+        self.assertEqual(lost['black_score'], '12')
+        rows = [json.loads(line) for line in exporting.export('matches', 'ndjson', category='cat-1')]
+        self.assertEqual([(row['white_team'], row['result']) for row in rows], [('team-1', 'D')])
+
+    def test_ranking(self):
+        rows = [json.loads(line) for line in exporting.export('ranking', 'ndjson')]
+        # Teams 1 and 3 are tied
+        self.assertEqual(sorted((row['position'], row['team']) for row in rows),
+            [(1, 'team-2'), (2, 'team-1'), (2, 'team-3'), (4, 'team-0')])
+        self.assertEqual(rows[0]['qualification_points'], 3)
+        lines = list(exporting.export('ranking', 'csv', category='cat-1'))
+        self.assertEqual(lines[0], 'position,team,name,category,institution,qualification_points,total_score\r\n')
+        self.assertEqual(sorted(line.split(',')[:2] for line in lines[1:]), [['1', 'team-1'], ['1', 'team-3']])
+
+    def test_endpoint(self):
+        url = reverse('export', args=['ranking'])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 4)
+        self.assertEqual(self.client.get(reverse('export', args=['nothing'])).status_code, 404)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as file:
+            call_command('export_results', 'matches', '--output', file.name)
+            self.assertEqual(len(file.readlines()), 3)
+
+class BenchmarkTests(TestCase):
+    # The admin templates need the static files, which are not collected for the tests
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as file:
+            call_command('benchmark', '--sizes', '10', '--repeat', '1', '--output', file.name,
+                '--label', 'test', stdout=io.StringIO())
+            results = json.load(file)
+        self.assertEqual(results['label'], 'test')
+        self.assertEqual({ result['benchmark'] for result in results['results'] }, {
+            'query ranking', 'query allScoredMatches', 'query schedule matches',
+            'admin match changelist', 'score save'})
+        # Rolled back
+        self.assertFalse(Match.objects.exists())
+
+@override_settings(GRAPHQL_TRACING={'SAMPLE_RATE': 0, 'BUFFER_SIZE': 2})
+class TracingTests(TestCase):
+    TRACES_QUERY = '''{
+        recentTraces { id operationName startedAt durationMs queries sqlMs spans { path parentPath calls queries } }
+    }'''
+
+    def post(self, query, **headers):
+        return self.client.post(reverse('graphql'), {'query': query}, content_type='application/json',
+            **headers)
+
+    def test_traced(self):
+        teams = make_teams(4)
+        for white_team, black_team in zip(teams, teams[1:]):
+            make_score(Match.objects.create(white_team=white_team, black_team=black_team))
+        self.assertNotIn('traceId', self.post(LoaderTests.QUERY).json().get('extensions', {}))
+        # Only staff users may request a trace
+        self.assertNotIn('traceId', self.post(LoaderTests.QUERY, HTTP_X_GRAPHQL_TRACE='1').json()['extensions'])
+        self.assertEqual(tracing.recent_traces(), [])
+
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        response = self.post('query Matches ' + LoaderTests.QUERY, HTTP_X_GRAPHQL_TRACE='1')
+        trace_id = response.json()['extensions']['traceId']
+        trace, = self.post(self.TRACES_QUERY).json()['data']['recentTraces']
+        self.assertEqual(trace['id'], trace_id)
+        self.assertEqual(trace['operationName'], 'Matches')
+        self.assertIsNotNone(trace['startedAt'])
+        self.assertGreaterEqual(trace['durationMs'], trace['sqlMs'])
+        spans = { span['path']: span for span in trace['spans'] }
+        self.assertIsNone(spans['']['parentPath'])
+        self.assertEqual(spans['allScoredMatches']['calls'], 1)
+        self.assertEqual(spans['allScoredMatches.whiteTeam']['parentPath'], 'allScoredMatches')
+        self.assertEqual(spans['allScoredMatches.whiteTeam.category.id']['calls'], 3)
+        # The matches are fetched when the list is resolved, the scores by a batched load
+        self.assertGreaterEqual(spans['allScoredMatches']['queries'], 1)
+        self.assertEqual(sum(span['queries'] for span in trace['spans']), trace['queries'])
+
+    def test_sampled(self):
+        with override_settings(GRAPHQL_TRACING={'SAMPLE_RATE': 1, 'BUFFER_SIZE': 2}):
+            for _ in range(3):
+                self.assertIn('traceId', self.post('{ allTeams { id } }').json()['extensions'])
+            self.assertEqual(len(tracing.recent_traces()), 2)
+
+    def test_file(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as file:
+            with override_settings(GRAPHQL_TRACING={'SAMPLE_RATE': 1, 'FILE': file.name}):
+                trace_id = self.post('{ allTeams { id } }').json()['extensions']['traceId']
+            self.assertEqual(json.loads(file.readline())['id'], trace_id)
+
+    def test_staff_only(self):
+        self.assertIsNone(self.post(self.TRACES_QUERY).json()['data']['recentTraces'])
+
+class DebugCursorTests(TestCase):
+    def test_unwrapped(self):
+        response = self.client.post(reverse('graphql'), {'query': '{ allTeams { name } }'},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        # DjangoDebugMiddleware wraps the cursors for every operation, but only unwraps
+        # them when `_debug` is queried: the first operation would record the queries
+        # of all the later ones
+        self.assertFalse(hasattr(connection, '_graphene_cursor'))
+
+@override_settings(GRAPHQL_TRACING={'SAMPLE_RATE': 0})
+class ReplicaTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+    QUERY = '{ allMatches { id } }'
+
+    def setUp(self):
+        cache.clear()
+        # Holds the syncs, which must not outlive the tests
+        data_version.get_cache().clear()
+        self.addCleanup(data_version.get_cache().clear)
+        teams = make_teams(2)
+        Match.objects.create(white_team=teams[0], black_team=teams[1])
+
+    def post(self, query=QUERY):
+        return self.client.post(reverse('graphql'), {'query': query}, content_type='application/json')
+
+    def replica_queries(self, query=QUERY):
+        """
+        Post the query, returning the response and the number of queries run on the replica
+        """
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.post(query)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_fresh_replica(self):
+        # Never synced (a different query, not to have the response cached)
+        self.assertEqual(self.replica_queries('{ allMatches { status } }')[1], 0)
+        replicas.record_sync(time.time() - 60, data_version.get_version())
+        response, queries = self.replica_queries()
+        self.assertEqual(queries, 1)
+        self.assertEqual(len(response.json()['data']['allMatches']), 1)
+        self.assertIn('ETag', response)
+
+    def test_lagging_replica(self):
+        replicas.record_sync(time.time() - 60, data_version.get_version() - 1)
+        self.assertEqual(self.replica_queries('{ allMatches { status } }')[1], 0)
+        # Recent enough, but the response is not cached under the current version
+        replicas.record_sync(time.time(), data_version.get_version() - 1)
+        response, queries = self.replica_queries()
+        self.assertEqual(queries, 1)
+        self.assertNotIn('ETag', response)
+
+    def test_read_your_writes(self):
+        User.objects.create_user('judge', password='secret')
+        replicas.record_sync(time.time(), data_version.get_version())
+        response, queries = self.replica_queries('mutation { login(username: "judge", password: "secret") { ok } }')
+        self.assertEqual(response.json()['data'], {'login': {'ok': True}})
+        self.assertEqual(queries, 0)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        # Pinned to the primary
+        self.assertEqual(self.replica_queries()[1], 0)
+        del self.client.cookies[replicas.PIN_COOKIE]
+        response, queries = self.replica_queries()
+        self.assertEqual(queries, 1)
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_sync(self):
+        with tempfile.NamedTemporaryFile(suffix='.sqlite3') as file:
+            replicas.sync(file.name)
+            with sqlite3.connect(file.name) as replica:
+                self.assertEqual(replica.execute('SELECT COUNT(*) FROM matches_match').fetchone(), (1,))
+
+    def test_sync_while_reading(self):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'replica.sqlite3')
+            replicas.sync(name)
+            reader = sqlite3.connect(name, timeout=0)
+            try:
+                # Keeps a read lock on the replica
+                reader.execute('BEGIN')
+                self.assertEqual(reader.execute('SELECT COUNT(*) FROM matches_match').fetchone(), (1,))
+                Match.objects.create(white_team=Team.objects.first())
+                replicas.sync(name)
+                # Still reading the previous copy
+                self.assertEqual(reader.execute('SELECT COUNT(*) FROM matches_match').fetchone(), (1,))
+            finally:
+                reader.close()
+            with sqlite3.connect(name) as replica:
+                self.assertEqual(replica.execute('SELECT COUNT(*) FROM matches_match').fetchone(), (2,))
+            # No temporary file left
+            self.assertEqual(os.listdir(directory), ['replica.sqlite3'])
+
+    def test_shared_syncs(self):
+        replicas.record_sync(time.time(), data_version.get_version())
+        # Recorded where the other processes (e.g. `sync_replica`) read it
+        self.assertIsNotNone(data_version.get_cache().get(replicas.SYNC_CACHE_KEY))
+        self.assertEqual(replicas.get_replica_state(), ('replica', True))
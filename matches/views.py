@@ -1,3 +1,22 @@
-from django.shortcuts import render
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from .exporting import CONTENT_TYPES, EXPORTS, WRITERS, export
 
-# Create your views here.
+@require_GET
+def export_results(request, name):
+    """
+    Stream an export of the results (see matches.exporting) in the format given by the
+    `format` parameter (CSV by default), optionally of the category given by `category`.
+    Only for staff users.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    if name not in EXPORTS:
+        raise Http404()
+    format = request.GET.get('format', 'csv')
+    if format not in WRITERS:
+        return JsonResponse({'error': 'Unsupported format'}, status=400)
+    response = StreamingHttpResponse(export(name, format, request.GET.get('category')),
+        content_type=CONTENT_TYPES[format])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{format}"'
+    return response
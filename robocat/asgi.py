@@ -3,14 +3,76 @@ ASGI config for robocat project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Besides the Django application, it serves the live events stream
+(see robocat.events) as Server-Sent Events on ``EVENTS_PATH``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'robocat.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from urllib.parse import parse_qs # noqa: E402
+from .events import get_broker # noqa: E402
+
+EVENTS_PATH = '/_/events/'
+
+# Seconds between keep-alive comments, which prevent proxies from closing idle streams
+KEEP_ALIVE_INTERVAL = 15
+
+async def events_application(scope, receive, send):
+    """
+    Stream the live events. The `events` query parameter may be used to
+    subscribe only to some events, e.g. `?events=ranking,match-status`.
+    """
+    query = parse_qs(scope.get('query_string', b'').decode())
+    events = None
+    if 'events' in query:
+        events = { event for value in query['events'] for event in value.split(',') if event }
+
+    subscription = get_broker().subscribe(events)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]
+        })
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            while True:
+                message = asyncio.ensure_future(subscription.get())
+                done, _ = await asyncio.wait((disconnected, message),
+                    timeout=KEEP_ALIVE_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    message.cancel()
+                    if disconnected.result()['type'] == 'http.disconnect':
+                        return
+                    disconnected = asyncio.ensure_future(receive())
+                    continue
+                if message in done:
+                    body = message.result()
+                else:
+                    message.cancel()
+                    body = b':\n\n'
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+    finally:
+        subscription.close()
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+        await events_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
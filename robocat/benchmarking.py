@@ -0,0 +1,32 @@
+"""
+Helpers of the benchmark commands: timing functions and counting their queries.
+"""
+import statistics
+import time
+from collections import namedtuple
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Times in milliseconds; `queries` is the number of queries of each run
+Measurement = namedtuple('Measurement', ('median_ms', 'min_ms', 'queries'))
+
+def measure(function, repeat):
+    """
+    Run `function` `repeat` times, and return its Measurement
+    """
+    times = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+    return Measurement(statistics.median(times) * 1000, min(times) * 1000, len(queries))
+
+def format_measurement(label, measurement):
+    return '  %-44s %9.2f ms (median) %9.2f ms (min) %3d queries' % (
+        label, measurement.median_ms, measurement.min_ms, measurement.queries)
+
+class Rollback(Exception):
+    """
+    Raised to roll back the transaction of a benchmark
+    """
@@ -0,0 +1,97 @@
+"""
+Global data version: a counter bumped whenever public data changes, so that
+anything derived from the data (e.g. cached responses) can be invalidated by
+comparing versions.
+
+Models are tracked with `track`, which bumps the version when their instances
+are saved or deleted. Bulk operations (which bypass the model signals) must
+call `bump` explicitly. The version is bumped once the transaction commits, so
+it never changes before the new data can be read.
+
+Narrower versions (e.g. of the reference data, see robocat.reference_data)
+are kept with their own VersionCounter.
+
+Versions are kept in the cache shared by all the processes (see `get_cache`),
+which must not be local to each process: otherwise changes made by a process
+would never be noticed by the others (see the robocat.W001 check).
+"""
+import time
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+CACHE_KEY = 'data-version'
+SHARED_CACHE_ALIAS = 'shared'
+
+def get_cache():
+    """
+    The cache shared by all the processes: the 'shared' cache, if configured, or
+    the default one
+    """
+    return caches[SHARED_CACHE_ALIAS if SHARED_CACHE_ALIAS in settings.CACHES else DEFAULT_CACHE_ALIAS]
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if isinstance(get_cache(), (LocMemCache, DummyCache)):
+        return [checks.Warning(
+            'The shared cache is local to each process, so data changes and replica syncs '
+            'are not noticed by the other processes.',
+            hint=f"Configure a '{SHARED_CACHE_ALIAS}' cache shared by all the processes, "
+                'e.g. a file-based cache.',
+            id='robocat.W001',
+        )]
+    return []
+
+def _initial_version():
+    # Not reusing the versions of a previous cache
+    return time.time_ns()
+
+class VersionCounter:
+    """
+    Version counter shared by all the processes through the cache
+    """
+    def __init__(self, cache_key):
+        self.cache_key = cache_key
+
+    def get(self):
+        cache = get_cache()
+        version = cache.get(self.cache_key)
+        if version is None:
+            cache.add(self.cache_key, _initial_version(), None)
+            version = cache.get(self.cache_key)
+        return version
+
+    def _bump(self):
+        cache = get_cache()
+        # Not incremented, since incr is not atomic on every backend (e.g. the file-based
+        # one): concurrent bumps must not end up on the same version
+        version = max(time.time_ns(), (cache.get(self.cache_key) or 0) + 1)
+        cache.set(self.cache_key, version, None)
+
+    def bump(self, using=None):
+        """
+        Bump the version once the current transaction (if any) commits
+        """
+        transaction.on_commit(self._bump, using)
+
+    def _instance_changed(self, sender, using=None, **kwargs):
+        self.bump(using)
+
+    def track(self, *models):
+        """
+        Bump the version whenever instances of the given models are saved or deleted
+        """
+        for model in models:
+            dispatch_uid = f'{self.cache_key}.{model._meta.label}'
+            post_save.connect(self._instance_changed, sender=model, weak=False, dispatch_uid=dispatch_uid)
+            post_delete.connect(self._instance_changed, sender=model, weak=False, dispatch_uid=dispatch_uid)
+
+_data_version = VersionCounter(CACHE_KEY)
+
+get_version = _data_version.get
+bump = _data_version.bump
+track = _data_version.track
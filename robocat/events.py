@@ -0,0 +1,138 @@
+"""
+Live events pushed to the clients (scoreboards, team laptops...) instead of
+having them poll the GraphQL API.
+
+Apps report what has changed with `notify(event, ids)`. Changes are collected
+until the current transaction commits, and then each event's producer is
+called once to compute its payload, which is encoded once and handed to the
+broker. The broker fans it out to every subscriber, so the cost of an event
+does not depend on the number of connected clients.
+
+The default broker, `InMemoryBroker`, only reaches the subscribers of the
+current process. Deployments running several workers must use a shared
+broker (see `settings.EVENT_BROKER`) or a single ASGI worker.
+"""
+import asyncio
+import json
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+class Subscription:
+    """
+    Queue of encoded events for a single subscriber. Must be created and
+    consumed from the event loop of the subscriber.
+    """
+    def __init__(self, broker, events=None, max_size=100):
+        self.broker = broker
+        self.events = events
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_size)
+
+    def put(self, message):
+        if self.queue.full():
+            # Slow client: drop the oldest message. Every event carries the full
+            # state of what it describes, so the client will catch up.
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class InMemoryBroker:
+    """
+    Broker for the subscribers of the current process. Thread-safe: events may be
+    published from any thread (e.g. a request thread), while subscribers are served
+    from their event loops.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def subscribe(self, events=None):
+        """
+        Subscribe to the given event names (or all events, if None)
+        """
+        subscription = Subscription(self, events)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, event, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            if subscription.events is not None and event not in subscription.events:
+                continue
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                # The loop of the subscriber has been closed
+                self.unsubscribe(subscription)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'EVENT_BROKER', 'robocat.events.InMemoryBroker'))()
+        return _broker
+
+def encode_event(event, payload):
+    """
+    Encode an event as a Server-Sent Events message
+    """
+    data = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f'event: {event}\ndata: {data}\n\n'.encode()
+
+def publish(event, payload):
+    get_broker().publish(event, encode_event(event, payload))
+
+# Producers: event name -> function(ids) returning the payload of the event
+_producers = {}
+
+def producer(event):
+    """
+    Decorator registering the producer of an event. The producer receives the set of
+    IDs collected with `notify` and returns the payload, or None to skip the event.
+    """
+    def register(function):
+        _producers[event] = function
+        return function
+    return register
+
+_pending = threading.local()
+
+def _flush():
+    pending = getattr(_pending, 'events', None)
+    if not pending:
+        return
+    _pending.events = {}
+    for event, ids in pending.items():
+        payload = _producers[event](ids)
+        if payload is not None:
+            publish(event, payload)
+
+def notify(event, ids=()):
+    """
+    Report that the objects with the given IDs have changed, publishing the event once the
+    current transaction is committed. Events notified several times in a transaction are
+    published once, with all the IDs.
+    """
+    if not hasattr(_pending, 'events'):
+        _pending.events = {}
+    _pending.events.setdefault(event, set()).update(ids)
+    # Changes notified on rolled back transactions stay pending until the next
+    # commit, which only means that their payload is computed again.
+    transaction.on_commit(_flush)
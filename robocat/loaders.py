@@ -0,0 +1,104 @@
+"""
+Request-scoped DataLoaders, used by the GraphQL resolvers to batch the loading
+of related objects: all the objects requested while resolving one level of the
+query are loaded with a single `IN (...)` query.
+
+Usage: `get_loaders(info).team.load(team_id)`, which returns a Promise.
+"""
+from django.utils import timezone
+from promise import Promise
+from promise.dataloader import DataLoader
+
+class ModelLoader(DataLoader):
+    """
+    Load model instances by the value of one of their fields (by default, the
+    primary key). Missing instances are resolved as None.
+    """
+    def __init__(self, queryset, field='pk'):
+        super().__init__()
+        self.queryset = queryset
+        self.field = field
+
+    def batch_load_fn(self, keys):
+        attname = (self.queryset.model._meta.pk if self.field == 'pk'
+            else self.queryset.model._meta.get_field(self.field)).attname
+        objects = {
+            getattr(obj, attname): obj
+            for obj in self.queryset.filter(**{f'{self.field}__in': keys})
+        }
+        return Promise.resolve([objects.get(key) for key in keys])
+
+    def load(self, key):
+        # Nullable foreign keys are common (e.g. byes), so don't bother the database with them
+        if key is None:
+            return Promise.resolve(None)
+        return super().load(key)
+
+class NextMatchLoader(DataLoader):
+    """
+    Load the next scheduled match of teams, by (schedule ID, team ID). The time is
+    fixed when the loader is created, so it is consistent within a request.
+    """
+    def __init__(self):
+        super().__init__()
+        self.now = timezone.now()
+
+    def batch_load_fn(self, keys):
+        from schedules.models import ScheduledMatch
+        team_ids_by_schedule = {}
+        for schedule_id, team_id in keys:
+            team_ids_by_schedule.setdefault(schedule_id, []).append(team_id)
+        next_matches = {
+            (schedule_id, team_id): scheduled_match
+            for schedule_id, team_ids in team_ids_by_schedule.items()
+            for team_id, scheduled_match in
+                ScheduledMatch.objects.next_matches(schedule_id, team_ids, self.now).items()
+        }
+        return Promise.resolve([next_matches.get(key) for key in keys])
+
+class TeamMatchesLoader(DataLoader):
+    """
+    Load the matches of teams (on either side, with their scores), by team ID
+    """
+    def batch_load_fn(self, keys):
+        from matches.models import Match
+        matches = { key: [] for key in keys }
+        for match in Match.scored_objects.for_teams(keys).order_by('id'):
+            for team_id in (match.white_team_id, match.black_team_id):
+                if team_id in matches:
+                    matches[team_id].append(match)
+        return Promise.resolve([matches[key] for key in keys])
+
+class TeamStatsLoader(DataLoader):
+    """
+    Load the TeamStats of teams, by team ID
+    """
+    def batch_load_fn(self, keys):
+        from matches.models import Match
+        stats = Match.scored_objects.team_stats(keys)
+        return Promise.resolve([stats[key] for key in keys])
+
+class Loaders:
+    def __init__(self):
+        from teams.models import Category, Institution, Team
+        from matches.models import Match, Score, PartialScore
+        self.category = ModelLoader(Category.objects.all())
+        self.institution = ModelLoader(Institution.objects.all())
+        self.team = ModelLoader(Team.objects.all())
+        self.match = ModelLoader(Match.objects.all())
+        self.score = ModelLoader(Score.objects.all(), 'match')
+        self.partial_white = ModelLoader(PartialScore.objects.all(), 'match_as_white')
+        self.partial_black = ModelLoader(PartialScore.objects.all(), 'match_as_black')
+        self.next_match = NextMatchLoader()
+        self.team_matches = TeamMatchesLoader()
+        self.team_stats = TeamStatsLoader()
+
+def get_loaders(info):
+    """
+    Get the loaders of the current request, creating them if needed.
+    """
+    context = info.context
+    loaders = getattr(context, 'loaders', None)
+    if loaders is None:
+        loaders = context.loaders = Loaders()
+    return loaders
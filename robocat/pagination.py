@@ -0,0 +1,114 @@
+"""
+Relay-style connections paginated by keyset: the cursor of an item holds the
+values of the ordering fields of that item, and the next page is fetched by
+filtering on them, so every page costs the same regardless of its depth
+(as long as an index covers the ordering).
+"""
+import base64
+import binascii
+import datetime
+import json
+from functools import partial
+import graphene
+from graphene import relay
+from graphql import GraphQLError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+# Page size if `first` is not given, and maximum page size
+MAX_PAGE_SIZE = 100
+
+_connections = {}
+
+def connection_for(node_type):
+    """
+    Get the Connection type of the given node type, creating it if needed
+    """
+    connection = _connections.get(node_type)
+    if connection is None:
+        connection = _connections[node_type] = relay.Connection.create_type(
+            f'{node_type._meta.name}Connection', node=node_type)
+    return connection
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates them to milliseconds, which would match the last
+        # item of the page again
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+def decode_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        values = None
+    if not isinstance(values, list) or len(values) != length:
+        raise GraphQLError('Invalid cursor')
+    return values
+
+def keyset_filter(ordering, values):
+    """
+    Filter for the items after the item with the given values of the ordering fields
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        equal = { name.lstrip('-'): value for name, value in zip(ordering[:i], values[:i]) }
+        if field.startswith('-'):
+            after = { f'{field[1:]}__lt': values[i] }
+        else:
+            after = { f'{field}__gt': values[i] }
+        condition |= Q(**equal, **after)
+    return condition
+
+class KeysetConnectionField(graphene.Field):
+    """
+    Connection field paginated by keyset. Its resolver must return a queryset, which is
+    ordered by `ordering` (whose last field must be unique, e.g. the primary key).
+    Only forward pagination (`first` and `after`) is supported.
+    """
+    def __init__(self, node_type, ordering, **kwargs):
+        kwargs.setdefault('first', graphene.Int(
+            description=f'Number of items to return (at most {MAX_PAGE_SIZE})'))
+        kwargs.setdefault('after', graphene.String(
+            description='Return the items after this cursor'))
+        super().__init__(connection_for(node_type), **kwargs)
+        self.ordering = tuple(ordering)
+
+    def resolve_connection(self, resolver, root, info, first=None, after=None, **kwargs):
+        if first is None or first > MAX_PAGE_SIZE:
+            first = MAX_PAGE_SIZE
+        elif first < 0:
+            raise GraphQLError('first must be non-negative')
+        queryset = resolver(root, info, **kwargs).order_by(*self.ordering)
+        if after is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, decode_cursor(after, len(self.ordering))))
+        # Fetch an extra item to know whether there is a next page
+        items = list(queryset[:first + 1])
+        has_next_page = len(items) > first
+        items = items[:first]
+
+        field_names = [field.lstrip('-') for field in self.ordering]
+        connection_type = self.type
+        edges = [
+            connection_type.Edge(node=item,
+                cursor=encode_cursor([getattr(item, name) for name in field_names]))
+            for item in items
+        ]
+        return connection_type(
+            edges=edges,
+            page_info=relay.PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=after is not None,
+                has_next_page=has_next_page
+            )
+        )
+
+    def get_resolver(self, parent_resolver):
+        resolver = super().get_resolver(parent_resolver)
+        return partial(self.resolve_connection, resolver)
@@ -0,0 +1,211 @@
+"""
+Persisted GraphQL queries and cache of parsed documents.
+
+Documents are identified by the SHA-256 hash of their text. Clients may send
+the hash instead of the document (in the `persistedQuery` extension, as done by
+Apollo's automatic persisted queries):
+- documents of the registry (a JSON file mapping hashes to documents, usually
+  generated when building the frontend) are always available;
+- unknown documents are registered when sent along with their hash (once they
+  are known to be valid, and for TIMEOUT seconds), unless `ONLY_PERSISTED` is
+  set. In that case, only documents of the registry are accepted (from non-staff
+  users), whether sent by hash or in full.
+
+Parsed and validated documents are kept in a LRU cache, so frequent documents
+are neither parsed nor validated again.
+
+Configured with `settings.GRAPHQL_PERSISTED_QUERIES` (see DEFAULTS).
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from graphql import GraphQLError, parse, validate
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import execute
+from . import query_cost
+
+DEFAULTS = {
+    # Path of the registry file, if any
+    'REGISTRY': None,
+    # Register unknown documents sent with their hash
+    'AUTOMATIC': True,
+    # Seconds the automatically registered documents are kept
+    'TIMEOUT': 24 * 60 * 60,
+    # Reject documents not in the registry (except from staff users)
+    'ONLY_PERSISTED': False,
+    # Number of parsed documents kept in memory
+    'DOCUMENT_CACHE_SIZE': 256,
+}
+
+CACHE_KEY_PREFIX = 'graphql-persisted-query:'
+
+class PersistedQueryError(GraphQLError):
+    def __init__(self, message, code):
+        super().__init__(message, extensions={'code': code})
+
+def get_config():
+    return { **DEFAULTS, **getattr(settings, 'GRAPHQL_PERSISTED_QUERIES', {}) }
+
+def document_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry():
+    """
+    Get the registry of persisted documents, as {hash: document}
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            path = get_config()['REGISTRY']
+            registry = {}
+            if path is not None:
+                with open(path, encoding='utf-8') as registry_file:
+                    registry = json.load(registry_file)
+                for key, query in registry.items():
+                    if document_hash(query) != key:
+                        raise ValueError(f'Wrong hash for persisted document {key}')
+            _registry = registry
+        return _registry
+
+def _get_extension(request, data):
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            raise PersistedQueryError('Extensions are invalid JSON', 'BAD_REQUEST')
+    if not isinstance(extensions, dict):
+        return None
+    return extensions.get('persistedQuery')
+
+def requested_hash(request, data, query):
+    """
+    Get the hash of the document requested, without checking whether it is
+    allowed. None if the request is invalid.
+    """
+    try:
+        extension = _get_extension(request, data)
+    except PersistedQueryError:
+        return None
+    key = extension.get('sha256Hash') if isinstance(extension, dict) else None
+    if query is not None:
+        return document_hash(query) if key is None or key == document_hash(query) else None
+    return key if isinstance(key, str) else None
+
+def resolve_query(request, data, query):
+    """
+    Get the document to execute, its hash and whether it must be registered (see
+    `register`) from the document (`query`) and the persisted query extension of a
+    request. Raises PersistedQueryError if the document is unknown or not allowed.
+    """
+    config = get_config()
+    registry = get_registry()
+    only_persisted = config['ONLY_PERSISTED'] and not request.user.is_staff
+    extension = _get_extension(request, data)
+    if extension is None:
+        if query is None:
+            return None, None, False
+        key = document_hash(query)
+        if only_persisted and key not in registry:
+            raise PersistedQueryError('Only persisted queries are allowed', 'PERSISTED_QUERY_NOT_ALLOWED')
+        return query, key, False
+
+    key = extension.get('sha256Hash') if isinstance(extension, dict) else None
+    if not isinstance(key, str):
+        raise PersistedQueryError('Invalid persisted query', 'BAD_REQUEST')
+    if query is None:
+        query = registry.get(key)
+        if query is None and not only_persisted:
+            query = cache.get(CACHE_KEY_PREFIX + key)
+        if query is None:
+            raise PersistedQueryError('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+        return query, key, False
+
+    if document_hash(query) != key:
+        raise PersistedQueryError('Provided sha does not match query', 'BAD_REQUEST')
+    if key in registry:
+        return query, key, False
+    if only_persisted:
+        raise PersistedQueryError('Only persisted queries are allowed', 'PERSISTED_QUERY_NOT_ALLOWED')
+    if not config['AUTOMATIC']:
+        raise PersistedQueryError('PersistedQueryNotSupported', 'PERSISTED_QUERY_NOT_SUPPORTED')
+    return query, key, True
+
+def register(key, query):
+    """
+    Register a document sent along with its hash. Only for documents known to be
+    valid, so that the cache cannot be filled with garbage.
+    """
+    cache.set(CACHE_KEY_PREFIX + key, query, get_config()['TIMEOUT'])
+
+class DocumentCache:
+    """
+    Thread-safe LRU cache of parsed and validated documents
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.documents = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+            return document
+
+    def put(self, key, document):
+        max_size = get_config()['DOCUMENT_CACHE_SIZE']
+        with self.lock:
+            self.documents[key] = document
+            self.documents.move_to_end(key)
+            while len(self.documents) > max_size:
+                self.documents.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+
+document_cache = DocumentCache()
+
+def get_document(schema, query, key):
+    """
+    Get the parsed and validated document of `query`, whose hash is `key`. Raises
+    the GraphQLError of parsing or, for invalid documents, returns a list of
+    validation errors instead of the document.
+    """
+    document = document_cache.get(key)
+    if document is not None:
+        return document
+    document_ast = parse(query)
+    cycle = query_cost.find_fragment_cycle(document_ast)
+    if cycle is not None:
+        return [GraphQLError(f'Cannot spread fragment "{cycle}" within itself')]
+    errors = validate(schema, document_ast)
+    if errors:
+        return errors
+    document = GraphQLDocument(
+        schema=schema,
+        document_string=query,
+        document_ast=document_ast,
+        # Already validated
+        execute=partial(execute, schema, document_ast)
+    )
+    document_cache.put(key, document)
+    return document
+
+@receiver(setting_changed)
+def reset(setting, **kwargs):
+    global _registry
+    if setting == 'GRAPHQL_PERSISTED_QUERIES':
+        with _registry_lock:
+            _registry = None
+        document_cache.clear()
@@ -0,0 +1,257 @@
+"""
+Static cost analysis of GraphQL documents, so that expensive queries can be
+rejected before being executed.
+
+The cost of a field is the cost of resolving it (0 unless configured) plus, for
+each item it is expected to return, 1 (if the item is an object) and the cost of
+its subfields. The number of items is the `first` argument of paginated fields
+(or the `limit` argument of limited lists, or their defaults), an estimated size
+for plain lists (also when they are not limited), or 1. Introspection fields are free.
+
+Named fragments are costed once per type they are spread on, and the analysis
+stops as soon as the cost goes over the budget, so that it takes time linear
+in the size of the document.
+
+Configured with `settings.GRAPHQL_QUERY_COST` (see DEFAULTS).
+"""
+from collections import namedtuple
+from django.conf import settings
+from graphql.language import ast
+from graphql.type.definition import (GraphQLList, GraphQLNonNull, get_named_type,
+    is_composite_type)
+from .pagination import MAX_PAGE_SIZE
+
+DEFAULTS = {
+    # Documents above these limits are rejected
+    'MAX_COST': 5000,
+    'MAX_DEPTH': 10,
+    # Expected size of lists, unless overridden in LIST_SIZES
+    'DEFAULT_LIST_SIZE': 50,
+    # Expected size of specific lists, as {'Type.field': size}
+    'LIST_SIZES': {},
+    # Cost of resolving specific fields, as {'Type.field': cost}
+    'FIELD_COSTS': {},
+}
+
+QueryCost = namedtuple('QueryCost', ('cost', 'depth'))
+
+class QueryCostError(Exception):
+    def __init__(self, message, query_cost):
+        super().__init__(message)
+        self.query_cost = query_cost
+
+def get_config():
+    return { **DEFAULTS, **getattr(settings, 'GRAPHQL_QUERY_COST', {}) }
+
+def _is_list(type_):
+    if isinstance(type_, GraphQLNonNull):
+        type_ = type_.of_type
+    return isinstance(type_, GraphQLList)
+
+def _is_connection(type_):
+    fields = getattr(type_, 'fields', {})
+    return 'edges' in fields and 'pageInfo' in fields
+
+class _Analyzer:
+    def __init__(self, schema, fragments, variables, config):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables or {}
+        self.config = config
+        # Costs of the named fragments, by (name, type)
+        self.fragment_costs = {}
+        # Named fragments being walked, to stop at cycles
+        self.visiting = set()
+
+    def argument(self, field, name):
+        for argument in field.arguments or ():
+            if argument.name.value == name:
+                value = argument.value
+                if isinstance(value, ast.Variable):
+                    return self.variables.get(value.name.value)
+                if isinstance(value, ast.IntValue):
+                    return int(value.value)
+        return None
+
+    def multiplier(self, parent_type, field_def, field):
+        key = f'{parent_type.name}.{field.name.value}'
+        is_list = _is_list(field_def.type)
+        if is_list and _is_connection(parent_type):
+            # Already counted by the paginated field
+            return 1
+        for name in ('first', 'limit'):
+            if name in field_def.args:
+                size = self.argument(field, name)
+                if size is None:
+                    size = field_def.args[name].default_value
+                if isinstance(size, int) and size >= 0:
+                    # Limited lists are no longer than expected of the whole list
+                    maximum = self.config['LIST_SIZES'].get(key, MAX_PAGE_SIZE) if is_list else MAX_PAGE_SIZE
+                    return min(size, maximum)
+                if not is_list:
+                    return MAX_PAGE_SIZE
+        if is_list:
+            return self.config['LIST_SIZES'].get(key, self.config['DEFAULT_LIST_SIZE'])
+        return 1
+
+    def selections(self, parent_type, selection_set, depth, budget=None):
+        """
+        Returns the cost and depth of a selection set. Stops as soon as the cost
+        goes over the budget, if any (the cost is then only a lower bound).
+        """
+        cost, max_depth = 0, depth
+        if depth > self.config['MAX_DEPTH']:
+            # Deep enough to be rejected
+            return cost, depth
+        for selection in selection_set.selections:
+            if budget is not None and cost > budget:
+                break
+            remaining = budget - cost if budget is not None else None
+            if isinstance(selection, ast.Field):
+                name = selection.name.value
+                if name.startswith('__'):
+                    continue
+                field_def = getattr(parent_type, 'fields', {}).get(name)
+                if field_def is None:
+                    # Invalid field, reported by validation
+                    continue
+                field_type = get_named_type(field_def.type)
+                field_cost = self.config['FIELD_COSTS'].get(f'{parent_type.name}.{name}', 0)
+                multiplier = self.multiplier(parent_type, field_def, selection)
+                item_cost, sub_depth = 0, depth + 1
+                if selection.selection_set is not None:
+                    item_budget = None
+                    if remaining is not None and multiplier > 0:
+                        item_budget = (remaining - field_cost) // multiplier
+                    item_cost, sub_depth = self.selections(field_type, selection.selection_set,
+                        depth + 1, item_budget)
+                if is_composite_type(field_type):
+                    item_cost += 1
+                cost += field_cost + multiplier * item_cost
+                max_depth = max(max_depth, sub_depth)
+            elif isinstance(selection, ast.FragmentSpread):
+                fragment_cost, fragment_depth = self.fragment_spread(selection.name.value,
+                    parent_type, remaining)
+                cost += fragment_cost
+                max_depth = max(max_depth, depth + fragment_depth)
+            else:
+                fragment_cost, fragment_depth = self.selections(self.fragment_type(selection, parent_type),
+                    selection.selection_set, depth, remaining)
+                cost += fragment_cost
+                max_depth = max(max_depth, fragment_depth)
+        return cost, max_depth
+
+    def fragment_type(self, fragment, parent_type):
+        if fragment.type_condition is None:
+            return parent_type
+        return self.schema.get_type(fragment.type_condition.name.value) or parent_type
+
+    def fragment_spread(self, name, parent_type, budget):
+        """
+        Returns the cost and depth (relative to the spread) of a named fragment, computed
+        once for each parent type, however many times it is spread
+        """
+        fragment = self.fragments.get(name)
+        if fragment is None:
+            # Unknown fragment, reported by validation
+            return 0, 0
+        fragment_type = self.fragment_type(fragment, parent_type)
+        key = (name, fragment_type.name)
+        if key in self.fragment_costs:
+            return self.fragment_costs[key]
+        if name in self.visiting:
+            raise QueryCostError(f'Cannot spread fragment "{name}" within itself', QueryCost(0, 0))
+        self.visiting.add(name)
+        try:
+            result = self.selections(fragment_type, fragment.selection_set, 0, budget)
+        finally:
+            self.visiting.discard(name)
+        if budget is None or result[0] <= budget:
+            # Only complete costs are reused
+            self.fragment_costs[key] = result
+        return result
+
+def find_fragment_cycle(document_ast):
+    """
+    Get the name of a fragment of the document that spreads itself (directly or
+    through other fragments), or None. Such documents are invalid, but must be
+    rejected before validation, which never ends on them.
+    """
+    spreads = {}
+
+    def collect(selection_set, names):
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                names.add(selection.name.value)
+            elif selection.selection_set is not None:
+                collect(selection.selection_set, names)
+        return names
+
+    for definition in document_ast.definitions:
+        if isinstance(definition, ast.FragmentDefinition):
+            spreads[definition.name.value] = collect(definition.selection_set, set())
+    # Depth-first search, iterative so that long chains of fragments do not recurse
+    done = set()
+    for start in spreads:
+        if start in done:
+            continue
+        visiting = {start}
+        stack = [(start, iter(spreads[start]))]
+        while stack:
+            name, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                visiting.discard(name)
+                done.add(name)
+            elif child in visiting:
+                return child
+            elif child in spreads and child not in done:
+                visiting.add(child)
+                stack.append((child, iter(spreads[child])))
+    return None
+
+def analyze(schema, document_ast, operation_name=None, variables=None, config=None):
+    """
+    Compute the cost of the operation of a document that would be executed,
+    stopping once it goes over MAX_COST. Raises QueryCostError on fragment cycles.
+    """
+    config = config or get_config()
+    fragments = {}
+    operations = []
+    for definition in document_ast.definitions:
+        if isinstance(definition, ast.FragmentDefinition):
+            fragments[definition.name.value] = definition
+        elif isinstance(definition, ast.OperationDefinition):
+            operations.append(definition)
+    if operation_name is not None:
+        operations = [operation for operation in operations
+            if operation.name is not None and operation.name.value == operation_name]
+    if len(operations) != 1:
+        # Unknown or ambiguous operation, reported on execution
+        return QueryCost(0, 0)
+    operation = operations[0]
+    root_type = {
+        'query': schema.get_query_type,
+        'mutation': schema.get_mutation_type,
+        'subscription': schema.get_subscription_type,
+    }[operation.operation]()
+    if root_type is None:
+        return QueryCost(0, 0)
+    cost, depth = _Analyzer(schema, fragments, variables, config).selections(
+        root_type, operation.selection_set, 0, config['MAX_COST'])
+    return QueryCost(cost, depth)
+
+def check(schema, document_ast, operation_name=None, variables=None):
+    """
+    Compute the cost of an operation, raising QueryCostError if it exceeds the limits
+    """
+    config = get_config()
+    query_cost = analyze(schema, document_ast, operation_name, variables, config)
+    if query_cost.depth > config['MAX_DEPTH']:
+        raise QueryCostError(f"Query depth {query_cost.depth} exceeds the maximum depth "
+            f"of {config['MAX_DEPTH']}", query_cost)
+    if query_cost.cost > config['MAX_COST']:
+        raise QueryCostError(f"Query cost {query_cost.cost} exceeds the maximum cost "
+            f"of {config['MAX_COST']}", query_cost)
+    return query_cost
@@ -0,0 +1,169 @@
+"""
+Per-process read model of the reference data: categories, institutions, teams
+and the active schedule. They change rarely but are read by almost every
+query, so they are loaded once into compact records indexed by ID and by key,
+and served from memory afterwards.
+
+The read model is tagged with the version of the reference data (a
+VersionCounter shared through the cache) it was loaded from. It is reloaded
+when the version changes, which is checked once per request. Tracked models
+(see `track`) bump the version when their instances are saved or deleted, and
+also drop the read model of the current process right away. Bulk operations,
+which bypass the model signals, must call `invalidate`.
+
+Inside transactions, uncommitted changes may be visible (and may be rolled
+back), so the read model is loaded just for the request and not shared.
+
+Other processes notice a new version on their next request, but objects created
+meanwhile may still be missing from a read model loaded just before: lookups by
+ID should use `get_record`, which falls back to the request loaders for them.
+
+Usage: `get_reference_data(info).teams_by_key.get(key)`.
+"""
+import threading
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.models.signals import post_save, post_delete
+from .data_version import VersionCounter
+from .loaders import get_loaders
+
+version = VersionCounter('reference-data-version')
+
+class CategoryRecord:
+    __slots__ = ('id', 'key', 'name', 'colour')
+
+    def __init__(self, id, key, name, colour):
+        self.id = id
+        self.key = key
+        self.name = name
+        self.colour = colour
+
+class InstitutionRecord:
+    __slots__ = ('id', 'key', 'name')
+
+    def __init__(self, id, key, name):
+        self.id = id
+        self.key = key
+        self.name = name
+
+class TeamRecord:
+    __slots__ = ('id', 'key', 'name', 'raffle', 'category_id', 'institution_id')
+
+    def __init__(self, id, key, name, raffle, category_id, institution_id):
+        self.id = id
+        self.key = key
+        self.name = name
+        self.raffle = raffle
+        self.category_id = category_id
+        self.institution_id = institution_id
+
+class ScheduleRecord:
+    __slots__ = ('id', 'active', 'desc')
+
+    def __init__(self, id, active, desc):
+        self.id = id
+        self.active = active
+        self.desc = desc
+
+class ReferenceData:
+    """
+    Snapshot of the reference data. Lists are ordered by ID.
+    """
+    def __init__(self, version, categories, institutions, teams, active_schedule):
+        self.version = version
+        self.categories = categories
+        self.categories_by_id = { category.id: category for category in categories }
+        self.categories_by_key = { category.key: category for category in categories }
+        self.institutions_by_id = { institution.id: institution for institution in institutions }
+        self.teams = teams
+        self.teams_by_id = { team.id: team for team in teams }
+        self.teams_by_key = { team.key: team for team in teams }
+        self.active_schedule = active_schedule
+
+def _load(loaded_version):
+    from teams.models import Category, Institution, Team
+    from schedules.models import Schedule
+    # Shared by the requests, so not loaded from a lagging replica (see robocat.replicas)
+    db = DEFAULT_DB_ALIAS
+    active_schedule = (
+        Schedule.objects.using(db).filter(active=True).order_by('id')
+        .values_list('id', 'active', 'desc').first()
+    )
+    return ReferenceData(
+        loaded_version,
+        [CategoryRecord(*values) for values in
+            Category.objects.using(db).order_by('id').values_list('id', 'key', 'name', 'colour')],
+        [InstitutionRecord(*values) for values in
+            Institution.objects.using(db).order_by('id').values_list('id', 'key', 'name')],
+        [TeamRecord(*values) for values in
+            Team.objects.using(db).order_by('id').values_list('id', 'key', 'name', 'raffle', 'category_id',
+                'institution_id')],
+        ScheduleRecord(*active_schedule) if active_schedule is not None else None,
+    )
+
+_lock = threading.Lock()
+_current = None
+
+def load():
+    """
+    Get the read model, reloading it if outdated
+    """
+    global _current
+    if connection.in_atomic_block:
+        return _load(None)
+    # Read before loading: changes committed while loading bump it again
+    current_version = version.get()
+    with _lock:
+        current = _current
+        if current is None or current.version != current_version:
+            current = _current = _load(current_version)
+        return current
+
+def get_reference_data(info):
+    """
+    Get the read model for the current request, checking its version only once per request
+    """
+    context = info.context
+    reference_data = getattr(context, 'reference_data', None)
+    if reference_data is None:
+        reference_data = context.reference_data = load()
+    return reference_data
+
+_INDEXES_BY_ID = {
+    'category': 'categories_by_id',
+    'institution': 'institutions_by_id',
+    'team': 'teams_by_id',
+}
+
+def get_record(info, kind, object_id):
+    """
+    Get the category, institution or team (`kind`) with the given ID from the read
+    model, or load it (see robocat.loaders) if it is newer than the read model, in
+    which case a Promise is returned. None if `object_id` is None.
+    """
+    if object_id is None:
+        return None
+    record = getattr(get_reference_data(info), _INDEXES_BY_ID[kind]).get(object_id)
+    if record is None:
+        return getattr(get_loaders(info), kind).load(object_id)
+    return record
+
+def invalidate(using=None):
+    """
+    Drop the read model of this process, and have the other processes reload theirs
+    once the current transaction (if any) commits
+    """
+    global _current
+    _current = None
+    version.bump(using)
+
+def _instance_changed(sender, using=None, **kwargs):
+    invalidate(using)
+
+def track(*models):
+    """
+    Invalidate the read model whenever instances of the given models are saved or deleted
+    """
+    for model in models:
+        dispatch_uid = f'reference-data.{model._meta.label}'
+        post_save.connect(_instance_changed, sender=model, dispatch_uid=dispatch_uid)
+        post_delete.connect(_instance_changed, sender=model, dispatch_uid=dispatch_uid)
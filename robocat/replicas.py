@@ -0,0 +1,177 @@
+"""
+Routing of reads to a read replica, so that the spectators' queries do not
+compete with the score writes.
+
+The reads of GraphQL query operations are routed to the replica (the database
+alias ALIAS) by GraphQLView, through `read_from_replica`; everything else
+(mutations, the admin, sessions) reads and writes the primary database.
+
+The replica is kept in sync by copying the primary to it (`sync`, run
+periodically by the `sync_replica` command), which records when the copy
+started and the data version (see robocat.data_version) it contains in the
+cache shared by all the processes (see data_version.get_cache). The copy is
+written to a temporary file, then renamed over the replica, so the queries
+reading the replica are never locked out by the sync: they keep reading the
+previous copy until they reconnect.
+The replica is used only while it is fresh: either it has the current data
+version, or it was synced at most MAX_LAG seconds ago, in which case responses
+are not cached, since they may be older than the data version of their key.
+Otherwise reads fall back to the primary.
+
+Clients that write (any request with an unsafe method, except GraphQL query
+operations) are pinned to the primary for MAX_LAG seconds with a cookie (see
+ReadYourWritesMiddleware), so they read their own writes: past that time, a
+fresh replica was synced after the write.
+
+Configured with `settings.DATABASE_REPLICAS` (see DEFAULTS).
+"""
+import contextlib
+import contextvars
+import math
+import os
+import sqlite3
+import tempfile
+import time
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from . import data_version, response_cache
+
+DEFAULTS = {
+    # Database alias of the replica, if it is in settings.DATABASES
+    'ALIAS': 'replica',
+    # Maximum age (in seconds) of the last sync of an outdated replica for it to be used
+    'MAX_LAG': 5,
+}
+
+PIN_COOKIE = 'robocat_primary'
+SYNC_CACHE_KEY = 'replica-sync'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+# Alias the reads of the current context are routed to (None for the default routing)
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+
+def get_config():
+    return { **DEFAULTS, **getattr(settings, 'DATABASE_REPLICAS', {}) }
+
+def get_alias():
+    """
+    Alias of the replica, or None if there is none
+    """
+    alias = get_config()['ALIAS']
+    return alias if alias in settings.DATABASES else None
+
+def record_sync(started_at, version):
+    data_version.get_cache().set(SYNC_CACHE_KEY, (started_at, version), None)
+
+def sync(name=None):
+    """
+    Copy the primary database to the replica (or to the SQLite file `name`).
+    Only for SQLite databases; other databases have their own replication.
+    """
+    alias = get_alias()
+    if name is None:
+        if alias is None:
+            raise ValueError('No replica is configured')
+        name = connections[alias].settings_dict['NAME']
+    source = connections[DEFAULT_DB_ALIAS]
+    if source.vendor != 'sqlite':
+        raise ValueError('Only SQLite databases can be synced')
+    # Read before copying: the copy has at least the changes committed before
+    started_at = time.time()
+    version = data_version.get_version()
+    source.ensure_connection()
+    # Copied aside, since the backup locks the target for its whole duration
+    fd, temp_name = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(name)))
+    os.close(fd)
+    try:
+        target = sqlite3.connect(temp_name)
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
+        os.replace(temp_name, name)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    if alias is not None:
+        record_sync(started_at, version)
+
+def get_replica_state():
+    """
+    Get whether the replica is usable and whether it has the current data version,
+    as (alias, current), or None if the reads must go to the primary
+    """
+    alias = get_alias()
+    if alias is None:
+        return None
+    synced = data_version.get_cache().get(SYNC_CACHE_KEY)
+    if synced is None:
+        return None
+    started_at, version = synced
+    if version == data_version.get_version():
+        return alias, True
+    if time.time() - started_at <= get_config()['MAX_LAG']:
+        return alias, False
+    return None
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+@contextlib.contextmanager
+def read_from_replica(request):
+    """
+    Route the reads of the context to the replica, unless it is outdated or the
+    client is pinned to the primary
+    """
+    state = None if is_pinned(request) else get_replica_state()
+    if state is None:
+        yield
+        return
+    alias, current = state
+    if not current:
+        response_cache.never_cache(request)
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+class ReadYourWritesMiddleware:
+    """
+    Pin the clients that may have written to the primary. Views may set
+    `request.replica_pin` to override the default (pinning unsafe methods).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if get_alias() is not None and getattr(request, 'replica_pin', request.method not in SAFE_METHODS):
+            response.set_cookie(PIN_COOKIE, '1', max_age=math.ceil(get_config()['MAX_LAG']),
+                httponly=True, samesite='Lax')
+        return response
+
+class ReplicaRouter:
+    """
+    Database router sending the reads to the replica inside `read_from_replica`,
+    and everything else to the primary
+    """
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Instances read from the replica are saved to the primary too
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = { DEFAULT_DB_ALIAS, get_config()['ALIAS'] }
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica is a copy of the primary
+        if db == get_config()['ALIAS']:
+            return False
+        return None
@@ -0,0 +1,73 @@
+"""
+Cache of the responses of anonymous GraphQL queries.
+
+Responses are cached by document hash, variables, operation name and data
+version (see robocat.data_version), so they are invalidated whenever the data
+changes. They are served with a strong ETag (the hash of their content), so
+clients that already have the response get a 304 Not Modified without the
+query being executed.
+
+Only anonymous requests are cached: the responses of authenticated users may
+depend on their permissions (e.g. fields only shown to staff users). Responses
+with fields that depend on something else than the data (e.g. the current time)
+are not cached either: their resolvers call `never_cache`.
+
+Configured with `settings.GRAPHQL_RESPONSE_CACHE` (see DEFAULTS).
+"""
+import hashlib
+import json
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from . import data_version, persisted_queries
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Seconds a response is kept (it is invalidated anyway when the data changes)
+    'TIMEOUT': 300,
+}
+
+CACHE_KEY_PREFIX = 'graphql-response:'
+
+CachedResponse = namedtuple('CachedResponse', ('etag', 'content'))
+
+def get_config():
+    return { **DEFAULTS, **getattr(settings, 'GRAPHQL_RESPONSE_CACHE', {}) }
+
+def get_key(request, data, query, variables, operation_name):
+    """
+    Get the cache key of the response of a request, or None if it must not be cached
+    """
+    if not get_config()['ENABLED'] or request.user.is_authenticated:
+        return None
+    document_hash = persisted_queries.requested_hash(request, data, query)
+    if document_hash is None:
+        return None
+    request_hash = hashlib.sha256(json.dumps(
+        [document_hash, variables, operation_name],
+        sort_keys=True, separators=(',', ':')
+    ).encode()).hexdigest()
+    return f'{CACHE_KEY_PREFIX}{data_version.get_version()}:{request_hash}'
+
+def never_cache(context):
+    """
+    Prevent the response of the current request from being cached
+    """
+    context.graphql_uncacheable = True
+
+def get(key):
+    return cache.get(key)
+
+def put(key, content):
+    response = CachedResponse(f'"{hashlib.sha256(content).hexdigest()}"', content)
+    cache.set(key, response, get_config()['TIMEOUT'])
+    return response
+
+def etag_matches(request, etag):
+    """
+    Whether the request has the given ETag in If-None-Match. Weak ETags match too,
+    as GZipMiddleware weakens the ETags of the responses it compresses.
+    """
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in etags or etag in etags or f'W/{etag}' in etags
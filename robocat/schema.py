@@ -2,15 +2,16 @@ from graphene import ObjectType, String, Schema, Field
 from graphene_django.debug import DjangoDebug
 
 from .api_auth import Query as AuthQuery, Mutation as AuthMutation
+from .tracing import Query as TracingQuery
 
-from teams.schema import Query as TeamsQuery
-from matches.schema import Query as MatchesQuery
-from schedules.schema import Query as SchedulesQuery
+from teams.schema import Query as TeamsQuery, Mutation as TeamsMutation
+from matches.schema import Query as MatchesQuery, Mutation as MatchesMutation
+from schedules.schema import Query as SchedulesQuery, Mutation as SchedulesMutation
 
-class Query(ObjectType, AuthQuery, TeamsQuery, MatchesQuery, SchedulesQuery):
+class Query(ObjectType, AuthQuery, TracingQuery, TeamsQuery, MatchesQuery, SchedulesQuery):
     debug = Field(DjangoDebug, name='_debug')
 
-class Mutation(ObjectType, AuthMutation):
+class Mutation(ObjectType, AuthMutation, TeamsMutation, MatchesMutation, SchedulesMutation):
     pass
 
 schema = Schema(query=Query, mutation=Mutation)
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'robocat.replicas.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # If a cache is added, htmlmin must be reordered. Check its PyPI page.
@@ -90,7 +91,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Read replica (see robocat.replicas), kept in sync with `manage.py sync_replica`
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica.sqlite3'),
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['robocat.replicas.ReplicaRouter']
+
+DATABASE_REPLICAS = {
+    'ALIAS': 'replica',
+    'MAX_LAG': 5,
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# The shared cache holds the data versions (see robocat.data_version) and the replica
+# syncs (see robocat.replicas), so it must be shared by all the processes (the web
+# workers and `manage.py sync_replica`): a file-based cache on a single host, or
+# Memcached for several hosts. The default cache (responses, persisted queries) may
+# be local to each process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
 }
 
 
@@ -136,7 +171,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static-root')
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
-_graphene_middleware = []
+_graphene_middleware = ['robocat.tracing.TracingMiddleware']
 
 if DEBUG:
     _graphene_middleware.append('graphene_django.debug.DjangoDebugMiddleware')
@@ -148,6 +183,65 @@ GRAPHENE = {
     'MIDDLEWARE': _graphene_middleware
 }
 
+# GraphQL query cost limits (see robocat.query_cost)
+GRAPHQL_QUERY_COST = {
+    'MAX_COST': 5000,
+    'MAX_DEPTH': 10,
+    'DEFAULT_LIST_SIZE': 50,
+    # Lists expected to be larger than the default
+    'LIST_SIZES': {
+        'Query.allTeams': 300,
+        'Query.ranking': 300,
+        'Query.allMatches': 500,
+        'Query.allScoredMatches': 500,
+        'ScheduleType.matches': 500,
+        # Lists expected to be smaller than the default
+        'TeamType.matches': 10,
+        'RankedTeamType.matches': 10,
+    },
+    # Fields computed by expensive queries
+    'FIELD_COSTS': {
+        'Query.ranking': 20,
+        'Query.allScoredMatches': 10,
+    },
+}
+
+# Persisted GraphQL queries (see robocat.persisted_queries)
+GRAPHQL_PERSISTED_QUERIES = {
+    # JSON file mapping the SHA-256 hashes of the frontend documents to them
+    'REGISTRY': None,
+    'AUTOMATIC': True,
+    # Seconds the automatically registered documents are kept
+    'TIMEOUT': 24 * 60 * 60,
+    # Once the registry is set, only its documents should be accepted in production
+    'ONLY_PERSISTED': False,
+    'DOCUMENT_CACHE_SIZE': 256,
+}
+
+# Cache of the responses of anonymous queries (see robocat.response_cache)
+GRAPHQL_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'TIMEOUT': 300,
+}
+
+# Sampled tracing of GraphQL operations (see robocat.tracing)
+GRAPHQL_TRACING = {
+    'SAMPLE_RATE': 0.01,
+    'BUFFER_SIZE': 100,
+    # JSON Lines file the traces are also written to
+    'FILE': None,
+}
+
+# Ranking tie-breakers (see teams.tiebreakers). Run `manage.py rebuild_standings` after changing them.
+RANKING = {
+    # Others may be added after it: 'head_to_head', 'buchholz', 'wins'
+    'TIEBREAKERS': ['total_score'],
+}
+
+# Live events (see robocat.events)
+# The in-memory broker only reaches the clients connected to the same process.
+EVENT_BROKER = 'robocat.events.InMemoryBroker'
+
 # CORS
 # CORS may need to be disabled during development to test frontend and backend
 # separately, but in production they run from the same server, so CORS should
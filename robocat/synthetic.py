@@ -0,0 +1,119 @@
+"""
+Generator of synthetic tournaments, used by the benchmarks.
+
+Everything is created with bulk_create (bypassing the model signals), and the
+standings are rebuilt, the data version is bumped and the reference data is
+invalidated at the end.
+"""
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from . import data_version, reference_data
+from teams.models import Category, Institution, Team, TeamStanding
+from matches.models import Match, Score
+from schedules.models import Schedule, ScheduledMatch
+
+# `schedule` is None unless requested
+Tournament = namedtuple('Tournament', ('categories', 'institutions', 'teams', 'matches', 'schedule'))
+
+# Start of the synthetic schedules, fixed so that they are reproducible
+SCHEDULE_START = datetime(2020, 3, 7, 9, tzinfo=timezone.utc)
+SCHEDULE_SLOT = timedelta(minutes=10)
+
+def random_score(rng, match):
+    return Score(
+        match=match,
+        white_disqualified=rng.random() < 0.02,
+        black_disqualified=rng.random() < 0.02,
+        white_stalled=rng.random() < 0.2,
+        black_stalled=rng.random() < 0.2,
+        cubes_on_lower_white=rng.randint(0, 6),
+        cubes_on_lower_black=rng.randint(0, 6),
+        cubes_on_upper_white=rng.randint(0, 4),
+        cubes_on_upper_black=rng.randint(0, 4),
+        cubes_on_white_field=rng.randint(0, 5),
+        cubes_on_black_field=rng.randint(0, 5),
+    )
+
+def generate_tournament(teams, categories=4, institutions=None, rounds=6, seed=0,
+        played_rounds=None, tables=None):
+    """
+    Generate a tournament with the given number of teams, evenly spread among
+    categories and institutions (by default, one institution per 5 teams), and
+    `rounds` rounds of matches between random teams of the same category, the
+    first `played_rounds` (by default, all of them) finished and scored.
+    Categories with an odd number of teams get a bye each round. If `tables`
+    is given, the rounds are laid out on that many tables on a new schedule,
+    one after another (see SCHEDULE_START and SCHEDULE_SLOT), which is made
+    active unless there is already an active one.
+    """
+    rng = random.Random(seed)
+    if institutions is None:
+        institutions = max(1, teams // 5)
+
+    Category.objects.bulk_create(
+        Category(key=f'synthetic-{i}', name=f'Category {i}', colour=f'#{rng.randrange(0x1000000):06x}')
+        for i in range(categories)
+    )
+    Institution.objects.bulk_create(
+        Institution(key=f'synthetic-{i}', name=f'Institution {i}')
+        for i in range(institutions)
+    )
+    # IDs are not returned by bulk_create on every database
+    category_list = list(Category.objects.filter(key__startswith='synthetic-').order_by('id'))
+    institution_list = list(Institution.objects.filter(key__startswith='synthetic-').order_by('id'))
+    Team.objects.bulk_create(
+        Team(key=f'synthetic-{i}', name=f'Team {i}', raffle=rng.randrange(2_147_483_647),
+            category=category_list[i % categories],
+            institution=institution_list[rng.randrange(institutions)])
+        for i in range(teams)
+    )
+    team_list = list(Team.objects.filter(key__startswith='synthetic-').order_by('id'))
+
+    if played_rounds is None:
+        played_rounds = rounds
+    rounds_matches = [[] for _ in range(rounds)]
+    for category in category_list:
+        category_teams = [team for team in team_list if team.category_id == category.id]
+        for round_number, round_matches in enumerate(rounds_matches):
+            status = Match.Status.FINISHED if round_number < played_rounds else Match.Status.NOT_PLAYED
+            rng.shuffle(category_teams)
+            for white_team, black_team in zip(category_teams[::2], category_teams[1::2]):
+                round_matches.append(Match(white_team=white_team, black_team=black_team, status=status))
+            if len(category_teams) % 2:
+                round_matches.append(Match(white_team=category_teams[-1], status=status))
+    matches = [match for round_matches in rounds_matches for match in round_matches]
+    Match.objects.bulk_create(matches, batch_size=500)
+    # Byes are left without score
+    Score.objects.bulk_create(
+        (random_score(rng, match) for match in matches
+            if match.black_team is not None and match.status == Match.Status.FINISHED),
+        batch_size=500
+    )
+    schedule = None
+    if tables is not None:
+        schedule = _generate_schedule(rounds_matches, tables)
+    TeamStanding.objects.rebuild()
+    data_version.bump()
+    reference_data.invalidate()
+    return Tournament(category_list, institution_list, team_list, matches, schedule)
+
+def _generate_schedule(rounds_matches, tables):
+    schedule = Schedule.objects.create(desc='Synthetic',
+        active=not Schedule.objects.filter(active=True).exists())
+    scheduled_matches = []
+    round_start = SCHEDULE_START
+    for round_number, round_matches in enumerate(rounds_matches, 1):
+        played = [match for match in round_matches if match.black_team is not None]
+        for index, match in enumerate(played):
+            start_time = round_start + (index // tables) * SCHEDULE_SLOT
+            scheduled_matches.append(ScheduledMatch(schedule=schedule, match=match, round=round_number,
+                table=index % tables + 1, start_time=start_time, end_time=start_time + SCHEDULE_SLOT))
+        scheduled_matches += [
+            ScheduledMatch(schedule=schedule, match=match, round=round_number,
+                table=ScheduledMatch.BYE_TABLE, start_time=round_start, end_time=round_start + SCHEDULE_SLOT)
+            for match in round_matches if match.black_team is None
+        ]
+        round_start += max(-(-len(played) // tables), 1) * SCHEDULE_SLOT
+    ScheduledMatch.objects.bulk_create(scheduled_matches, batch_size=500)
+    return schedule
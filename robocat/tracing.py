@@ -0,0 +1,295 @@
+"""
+Sampled tracing of GraphQL operations, light enough for production.
+
+A sample of the operations (see SAMPLE_RATE; staff users may also request a
+trace with the `X-GraphQL-Trace: 1` header) is traced by GraphQLView: every
+resolver call is timed by TracingMiddleware, and every SQL query (through a
+database execute wrapper) is counted and timed. Queries are attributed to the
+last resolver started before them, which is exact for resolvers querying the
+database themselves or returning querysets, and approximate for batched loads
+(see robocat.loaders), which are attributed to a field of the same level.
+
+Calls are aggregated by field path (without list indices), so traces are span
+trees of the fields of the document, with the number of calls, the total time
+and the SQL queries of each one. Queries outside any resolver are attributed
+to the root span (the operation).
+
+Finished traces are kept in an in-memory ring buffer of each process (queried
+by staff users through `recentTraces`), and logged as JSON to the
+`robocat.tracing` logger, and to a rotating file if FILE is set.
+
+Configured with `settings.GRAPHQL_TRACING` (see DEFAULTS).
+"""
+import contextlib
+import json
+import logging
+import logging.handlers
+import random
+import threading
+import time
+import uuid
+from collections import deque
+import graphene
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils import timezone
+from graphql.utils.get_operation_ast import get_operation_ast
+from promise import Promise, is_thenable
+
+DEFAULTS = {
+    # Fraction of the operations traced
+    'SAMPLE_RATE': 0.0,
+    # Traces kept in memory by each process
+    'BUFFER_SIZE': 100,
+    # JSON Lines file the traces are written to, if any, rotated once it reaches
+    # FILE_MAX_BYTES, keeping FILE_BACKUPS old files
+    'FILE': None,
+    'FILE_MAX_BYTES': 10 * 1024 * 1024,
+    'FILE_BACKUPS': 3,
+}
+
+TRACE_HEADER = 'HTTP_X_GRAPHQL_TRACE'
+
+logger = logging.getLogger('robocat.tracing')
+
+def get_config():
+    return { **DEFAULTS, **getattr(settings, 'GRAPHQL_TRACING', {}) }
+
+class Span:
+    __slots__ = ('field', 'parent_type', 'calls', 'duration', 'queries', 'sql_duration', 'children')
+
+    def __init__(self, field=None, parent_type=None):
+        self.field = field
+        self.parent_type = parent_type
+        self.calls = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_duration = 0.0
+        self.children = []
+
+    def as_dict(self):
+        return {
+            'field': self.field,
+            'parentType': self.parent_type,
+            'calls': self.calls,
+            'durationMs': round(self.duration * 1000, 3),
+            'queries': self.queries,
+            'sqlMs': round(self.sql_duration * 1000, 3),
+            'children': [child.as_dict() for child in self.children],
+        }
+
+class Trace:
+    """
+    Trace of an operation being executed
+    """
+    def __init__(self, operation_name=None):
+        self.id = uuid.uuid4().hex
+        self.operation_name = operation_name
+        self.started_at = timezone.now()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.root = Span()
+        self.spans = {}
+        # Span the queries are attributed to
+        self.current = self.root
+
+    def enter(self, info):
+        """
+        Get the span of the field being resolved, making it the current one
+        """
+        path = tuple(key for key in info.path if not isinstance(key, int))
+        span = self.spans.get(path)
+        if span is None:
+            span = self.spans[path] = Span(info.field_name, str(info.parent_type))
+            self.spans.get(path[:-1], self.root).children.append(span)
+        span.calls += 1
+        self.current = span
+        return span
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            span = self.current
+            span.queries += 1
+            span.sql_duration += time.perf_counter() - start
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def as_dict(self):
+        spans = [self.root, *self.spans.values()]
+        return {
+            'id': self.id,
+            'operationName': self.operation_name,
+            'startedAt': self.started_at.isoformat(),
+            'durationMs': round(self.duration * 1000, 3),
+            'queries': sum(span.queries for span in spans),
+            'sqlMs': round(sum(span.sql_duration for span in spans) * 1000, 3),
+            'root': self.root.as_dict(),
+        }
+
+def start_trace(request, document_ast, operation_name=None):
+    """
+    Start tracing the operation of a request, if sampled. Returns the Trace or None.
+    """
+    forced = request.user.is_staff and request.META.get(TRACE_HEADER) == '1'
+    if not forced and random.random() >= get_config()['SAMPLE_RATE']:
+        return None
+    operation = get_operation_ast(document_ast, operation_name)
+    return Trace(operation.name.value if operation and operation.name else None)
+
+@contextlib.contextmanager
+def capture_sql(trace):
+    """
+    Attribute the SQL queries run in the context to the current span of the trace
+    """
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(trace.execute_wrapper))
+        yield
+
+class TracingMiddleware:
+    """
+    Graphene middleware timing the resolvers of traced operations
+    """
+    def resolve(self, next, root, info, **args):
+        trace = getattr(info.context, 'graphql_trace', None)
+        if trace is None:
+            return next(root, info, **args)
+        span = trace.enter(info)
+        start = time.perf_counter()
+        result = next(root, info, **args)
+        if not is_thenable(result):
+            span.duration += time.perf_counter() - start
+            return result
+
+        def finish(value):
+            span.duration += time.perf_counter() - start
+            return value
+
+        def fail(error):
+            finish(None)
+            raise error
+
+        return Promise.resolve(result).then(finish, fail)
+
+_lock = threading.Lock()
+_buffer = None
+_file_handler = None
+
+def _get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = deque(maxlen=get_config()['BUFFER_SIZE'])
+    return _buffer
+
+def _write_file(line):
+    global _file_handler
+    config = get_config()
+    if config['FILE'] is None:
+        return
+    if _file_handler is None:
+        _file_handler = logging.handlers.RotatingFileHandler(config['FILE'],
+            maxBytes=config['FILE_MAX_BYTES'], backupCount=config['FILE_BACKUPS'], encoding='utf-8')
+        _file_handler.setFormatter(logging.Formatter('%(message)s'))
+    _file_handler.emit(logging.makeLogRecord({'msg': line, 'levelno': logging.INFO}))
+
+def record(trace):
+    """
+    Store a finished trace
+    """
+    trace.finish()
+    data = trace.as_dict()
+    line = json.dumps(data, separators=(',', ':'))
+    with _lock:
+        _get_buffer().append(data)
+        _write_file(line)
+    logger.info(line)
+
+def recent_traces(limit=None):
+    """
+    Traces kept in memory, the most recent first
+    """
+    with _lock:
+        traces = list(reversed(_get_buffer()))
+    return traces[:limit] if limit is not None else traces
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs):
+    global _buffer, _file_handler
+    if setting == 'GRAPHQL_TRACING':
+        with _lock:
+            _buffer = None
+            if _file_handler is not None:
+                _file_handler.close()
+                _file_handler = None
+
+class SpanType(graphene.ObjectType):
+    """
+    Resolver calls of a field, aggregated over the items of the lists containing it
+    """
+    path = graphene.String(required=True, description='Path of the field, without list indices')
+    parent_path = graphene.String(description='Path of the parent span (null for the root span)')
+    parent_type = graphene.String()
+    calls = graphene.Int(required=True)
+    duration_ms = graphene.Float(required=True, description='Total time of the calls, with their '
+        'promises, including their children')
+    queries = graphene.Int(required=True)
+    sql_ms = graphene.Float(required=True)
+
+class TraceType(graphene.ObjectType):
+    id = graphene.ID(required=True)
+    operation_name = graphene.String()
+    started_at = graphene.DateTime(required=True)
+    duration_ms = graphene.Float(required=True)
+    queries = graphene.Int(required=True)
+    sql_ms = graphene.Float(required=True)
+    spans = graphene.List(graphene.NonNull(SpanType), required=True,
+        description='Span tree, flattened depth first; the root span (path "") is the operation')
+
+    # Traces are the dicts of Trace.as_dict
+    def resolve_id(self, info, **kwargs):
+        return self['id']
+
+    def resolve_operation_name(self, info, **kwargs):
+        return self['operationName']
+
+    def resolve_started_at(self, info, **kwargs):
+        return timezone.datetime.fromisoformat(self['startedAt'])
+
+    def resolve_duration_ms(self, info, **kwargs):
+        return self['durationMs']
+
+    def resolve_queries(self, info, **kwargs):
+        return self['queries']
+
+    def resolve_sql_ms(self, info, **kwargs):
+        return self['sqlMs']
+
+    def resolve_spans(self, info, **kwargs):
+        spans = []
+
+        def visit(span, parent_path, path):
+            spans.append(SpanType(path=path, parent_path=parent_path, parent_type=span['parentType'],
+                calls=span['calls'], duration_ms=span['durationMs'], queries=span['queries'],
+                sql_ms=span['sqlMs']))
+            for child in span['children']:
+                visit(child, path, f"{path}.{child['field']}" if path else child['field'])
+
+        visit(self['root'], None, '')
+        return spans
+
+class Query:
+    recent_traces = graphene.List(graphene.NonNull(TraceType),
+        limit=graphene.Int(default_value=20),
+        description='Recent traces of this process, the most recent first (only for staff users)')
+
+    @staticmethod
+    def resolve_recent_traces(parent, info, limit, **kwargs):
+        if not info.context.user.is_staff:
+            return None
+        return recent_traces(max(limit, 0))
@@ -15,13 +15,16 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from graphene_django.views import GraphQLView
 from django.views.decorators.csrf import csrf_exempt
-from .views import favicon_redirect
+from matches.views import export_results
+from teams.views import import_teams
+from .views import favicon_redirect, GraphQLView
 
 urlpatterns = [
     path('favicon.ico', favicon_redirect),
     path('_/admin/', admin.site.urls),
     # TODO: Implement CSRF protection?
     path('_/graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True)), name='graphql'),
+    path('_/import/', import_teams, name='import'),
+    path('_/export/<str:name>/', export_results, name='export'),
 ]
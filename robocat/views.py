@@ -1,5 +1,155 @@
+import contextlib
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.http.response import HttpResponseBadRequest
 from django.shortcuts import redirect
 from django.templatetags.static import static
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from graphene_django.debug.sql.tracking import unwrap_cursor
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql import GraphQLError
+from graphql.execution import ExecutionResult
+from . import persisted_queries, query_cost, replicas, response_cache, tracing
 
 def favicon_redirect(request):
     return redirect(static('favicon.ico'), permanent=True)
+
+class GraphQLView(BaseGraphQLView):
+    """
+    GraphQL view that supports persisted queries and caches parsed documents (see
+    robocat.persisted_queries), and rejects documents whose cost exceeds the limits
+    (see robocat.query_cost) before executing them. The cost is returned in the `cost`
+    response extension. Responses of anonymous queries are cached and served with
+    ETags (see robocat.response_cache). A sample of the operations is traced (see
+    robocat.tracing), and their trace ID returned in the `traceId` extension. Queries
+    read from the replica when it is fresh (see robocat.replicas).
+    """
+    def get_cache_key(self, request):
+        if request.method.lower() not in ('get', 'post') or self.batch:
+            return None
+        try:
+            data = self.parse_body(request)
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return None
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        except HttpError:
+            return None
+        return response_cache.get_key(request, data, query, variables, operation_name)
+
+    @method_decorator(ensure_csrf_cookie)
+    def dispatch(self, request, *args, **kwargs):
+        cache_key = self.get_cache_key(request)
+        if cache_key is None:
+            return super().dispatch(request, *args, **kwargs)
+        cached = response_cache.get(cache_key)
+        if cached is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or not getattr(request, 'graphql_cacheable', False):
+                return response
+            cached = response_cache.put(cache_key, response.content)
+        if response_cache.etag_matches(request, cached.etag):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(content=cached.content, content_type='application/json')
+        response['ETag'] = cached.etag
+        # Clients must revalidate their copy, since it changes with the data
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def get_document(self, request, query, document_hash):
+        return persisted_queries.get_document(self.schema, query, document_hash)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        try:
+            query, document_hash, register = persisted_queries.resolve_query(request, data, query)
+        except persisted_queries.PersistedQueryError as e:
+            return ExecutionResult(errors=[e])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        try:
+            document = self.get_document(request, query, document_hash)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        if isinstance(document, list):
+            # Validation errors
+            return ExecutionResult(errors=document, invalid=True)
+
+        if request.method.lower() == "get":
+            operation_type = document.get_operation_type(operation_name)
+            if operation_type and operation_type != "query":
+                if show_graphiql:
+                    return None
+                raise HttpError(HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(operation_type)
+                ))
+
+        try:
+            request.graphql_cost = query_cost.check(self.schema, document.document_ast,
+                operation_name, variables)
+        except query_cost.QueryCostError as e:
+            request.graphql_cost = e.query_cost
+            return ExecutionResult(errors=[GraphQLError(str(e))], invalid=True)
+        if register:
+            # Only valid documents within the limits are registered
+            persisted_queries.register(document_hash, query)
+
+        is_query = document.get_operation_type(operation_name) == 'query'
+        # Only the clients that may have written are pinned to the primary
+        request.replica_pin = not is_query
+
+        trace = request.graphql_trace = tracing.start_trace(request, document.document_ast, operation_name)
+        if trace:
+            # The trace ID is returned with the response
+            response_cache.never_cache(request)
+        try:
+            extra_options = {}
+            if self.executor:
+                extra_options["executor"] = self.executor
+            with contextlib.ExitStack() as stack:
+                if trace:
+                    stack.enter_context(tracing.capture_sql(trace))
+                if is_query:
+                    stack.enter_context(replicas.read_from_replica(request))
+                result = document.execute(
+                    root=self.get_root_value(request),
+                    variables=variables,
+                    operation_name=operation_name,
+                    context=self.get_context(request),
+                    middleware=self.get_middleware(request),
+                    **extra_options
+                )
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        finally:
+            if trace:
+                tracing.record(trace)
+            # DjangoDebugMiddleware only unwraps the cursors when `_debug` is queried,
+            # otherwise they would record the queries of every later request
+            for connection in connections.all():
+                unwrap_cursor(connection)
+        # Only successful queries may be cached (see response_cache.never_cache)
+        request.graphql_cacheable = (is_query and not result.errors
+            and not getattr(request, 'graphql_uncacheable', False))
+        return result
+
+    def json_encode(self, request, d, pretty=False):
+        cost = getattr(request, 'graphql_cost', None)
+        if cost is not None and ('data' in d or 'errors' in d):
+            config = query_cost.get_config()
+            d = { **d, 'extensions': { **d.get('extensions', {}), 'cost': {
+                'requested': cost.cost,
+                'maximum': config['MAX_COST'],
+                'depth': cost.depth,
+                'maximumDepth': config['MAX_DEPTH'],
+            }}}
+        trace = getattr(request, 'graphql_trace', None)
+        if trace is not None and ('data' in d or 'errors' in d):
+            d = { **d, 'extensions': { **d.get('extensions', {}), 'traceId': trace.id }}
+        return super().json_encode(request, d, pretty)
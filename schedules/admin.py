@@ -4,6 +4,8 @@ from django.contrib import messages
 from django.core.exceptions import MultipleObjectsReturned
 from django.http import HttpResponseRedirect
 from django.db import transaction
+from robocat import data_version, reference_data
+from .conflicts import ConflictKind, schedule_conflicts
 from .models import Schedule, ScheduledMatch
 
 class ScheduledMatchInline(admin.TabularInline):
@@ -24,6 +26,41 @@ class ScheduleAdmin(admin.ModelAdmin):
 
     actions = ['mark_as_active', 'mark_as_not_active']
 
+    # Conflicts reported individually on save; the rest are only counted
+    MAX_REPORTED_CONFLICTS = 10
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        conflicts = schedule_conflicts(form.instance)
+        if not conflicts:
+            return
+        scheduled_matches = ScheduledMatch.objects.select_related(
+            'match__white_team', 'match__black_team').in_bulk(
+            { conflict.first for conflict in conflicts[:self.MAX_REPORTED_CONFLICTS] }
+            | { conflict.second for conflict in conflicts[:self.MAX_REPORTED_CONFLICTS] })
+        for conflict in conflicts[:self.MAX_REPORTED_CONFLICTS]:
+            first, second = scheduled_matches[conflict.first], scheduled_matches[conflict.second]
+            if conflict.kind == ConflictKind.TABLE:
+                message = _('Table %(table)d is booked by overlapping matches: %(first)s and %(second)s')
+            else:
+                message = _('A team is booked on overlapping matches: %(first)s and %(second)s')
+            self.message_user(
+                request,
+                message % {'table': conflict.resource, 'first': first.match, 'second': second.match},
+                messages.WARNING
+            )
+        if len(conflicts) > self.MAX_REPORTED_CONFLICTS:
+            remaining = len(conflicts) - self.MAX_REPORTED_CONFLICTS
+            self.message_user(
+                request,
+                ngettext(
+                    'There is %d more conflict on this schedule.',
+                    'There are %d more conflicts on this schedule.',
+                    remaining
+                ) % (remaining,),
+                messages.WARNING
+            )
+
     def mark_as_active(self, request, queryset):
         try:
             to_activate = queryset.get()
@@ -59,6 +96,9 @@ class ScheduleAdmin(admin.ModelAdmin):
 
     def mark_as_not_active(self, request, queryset):
         updated = queryset.update(active=False)
+        # Updates bypass the model signals
+        reference_data.invalidate()
+        data_version.bump()
         self.message_user(
             request,
             ngettext(
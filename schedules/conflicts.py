@@ -0,0 +1,71 @@
+"""
+Detection of conflicts on schedules: two matches overlapping in time on the
+same table, or a team booked on two overlapping matches.
+
+The scheduled matches are indexed by table and by team, and each index is
+swept in chronological order, keeping the matches still being played in a heap
+ordered by end time. Each match is only compared with the matches it overlaps,
+so finding all the k conflicts of n scheduled matches takes O(n log n + k).
+Matches that end when another one starts do not overlap.
+"""
+import enum
+import heapq
+from collections import namedtuple
+from .models import ScheduledMatch
+
+@enum.unique
+class ConflictKind(enum.Enum):
+    TABLE = 'table'
+    TEAM = 'team'
+
+# Two scheduled matches (`first` starting before or with `second`) overlapping on
+# `resource` (a table number or a team ID, depending on `kind`). Matches are given
+# by the IDs of the scheduled matches.
+ScheduleConflict = namedtuple('ScheduleConflict', ('kind', 'resource', 'first', 'second'))
+
+# Scheduled match, as needed to find conflicts
+Slot = namedtuple('Slot', ('id', 'table', 'start_time', 'end_time', 'white_team_id', 'black_team_id'))
+
+def _overlaps(slots):
+    """
+    Pairs of overlapping slots, from slots sorted by start time
+    """
+    playing = []
+    for slot in slots:
+        # Slots ended by now
+        while playing and playing[0][0] <= slot.start_time:
+            heapq.heappop(playing)
+        for _, _, other in playing:
+            yield other, slot
+        heapq.heappush(playing, (slot.end_time, slot.id, slot))
+
+def find_conflicts(slots):
+    """
+    Find the conflicts among the given Slots. Returns a list of ScheduleConflict,
+    sorted by the start time of their matches.
+    """
+    by_table, by_team = {}, {}
+    for slot in sorted(slots, key=lambda slot: (slot.start_time, slot.id)):
+        if slot.table != ScheduledMatch.BYE_TABLE:
+            by_table.setdefault(slot.table, []).append(slot)
+        for team_id in { slot.white_team_id, slot.black_team_id } - { None }:
+            by_team.setdefault(team_id, []).append(slot)
+    conflicts = [
+        ScheduleConflict(kind, resource, first, second)
+        for kind, index in ((ConflictKind.TABLE, by_table), (ConflictKind.TEAM, by_team))
+        for resource, resource_slots in index.items()
+        for first, second in _overlaps(resource_slots)
+    ]
+    conflicts.sort(key=lambda conflict: (conflict.first.start_time, conflict.second.start_time,
+        conflict.kind.value, conflict.resource))
+    return [conflict._replace(first=conflict.first.id, second=conflict.second.id) for conflict in conflicts]
+
+def schedule_conflicts(schedule):
+    """
+    Find the conflicts among the matches of a schedule. Returns a list of ScheduleConflict.
+    """
+    return find_conflicts(
+        Slot(*values) for values in
+        ScheduledMatch.objects.filter(schedule=schedule)
+        .values_list('id', 'table', 'start_time', 'end_time', 'match__white_team_id', 'match__black_team_id')
+    )
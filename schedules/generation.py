@@ -0,0 +1,263 @@
+"""
+Generator of schedules: pairs the teams of each category in rounds, and lays
+the rounds out on the tables, one round after another.
+
+Two pairing systems are supported:
+- Round robin (circle method): every team plays every other team of its
+  category once, in `teams - 1` rounds (or `teams` if odd), or as many of them
+  as requested.
+- Swiss: each round pairs teams with similar standings that have not played
+  each other yet. As the results of the rounds being generated are not known,
+  Swiss rounds should usually be generated one at a time, once the previous
+  one has been scored; generating more only avoids repeated pairings.
+
+With an odd number of teams, a team gets a bye on each round: a match without
+adversary (see Match), scheduled on ScheduledMatch.BYE_TABLE.
+
+Matches and scheduled matches are written with bulk_create.
+"""
+import enum
+import random
+from collections import Counter, namedtuple
+from django.db import transaction
+from django.db.models import Max, Q
+from matches.models import Match
+from robocat import data_version
+from teams.models import Team
+from .conflicts import schedule_conflicts
+from .models import ScheduledMatch
+
+@enum.unique
+class PairingSystem(enum.Enum):
+    ROUND_ROBIN = 'round-robin'
+    SWISS = 'swiss'
+
+# `conflicts` are the conflicts of the whole schedule afterwards (see schedules.conflicts),
+# e.g. because of overlaps with the rounds already on it
+GeneratedSchedule = namedtuple('GeneratedSchedule', ('matches', 'scheduled_matches', 'conflicts'))
+
+def round_robin_pairings(teams, rounds=None):
+    """
+    Pairings of the given teams on each round, as lists of (white, black) tuples
+    (one of them None for byes). Colours alternate between rounds.
+    """
+    teams = list(teams)
+    if len(teams) % 2:
+        teams.append(None)
+    count = len(teams)
+    if count < 2:
+        return []
+    total_rounds = count - 1
+    if rounds is not None:
+        total_rounds = min(rounds, total_rounds)
+    pairings = []
+    # Circle method: the first team stays, the rest rotate
+    fixed, rotating = teams[0], teams[1:]
+    for round_number in range(total_rounds):
+        circle = [fixed] + rotating
+        pairs = [(circle[i], circle[count - 1 - i]) for i in range(count // 2)]
+        if round_number % 2:
+            pairs = [(black, white) for white, black in pairs]
+        pairings.append([_bye_last(pair) for pair in pairs if pair != (None, None)])
+        rotating = rotating[-1:] + rotating[:-1]
+    return pairings
+
+def _bye_last(pair):
+    # Byes are always on the white side
+    white, black = pair
+    return (black, None) if white is None else pair
+
+# Maximum number of pairings tried before allowing repeated pairings
+MAX_PAIRING_STEPS = 10000
+
+def _pair_rounds(round_teams, played):
+    """
+    Pairings of the teams of each round without repeating pairs, neither played nor
+    between rounds, in order of preference (each team, in order, with the highest
+    ranked possible team). Searched depth-first with an explicit stack (one frame per
+    pair), backtracking across rounds if needed; returns None if not possible, or
+    once MAX_PAIRING_STEPS pairs have been tried.
+    """
+    played = set(played)
+    paired = [[False] * len(teams) for teams in round_teams]
+
+    def next_team(round_index, position):
+        # First team left to pair, from `position` of the round on
+        while round_index < len(round_teams):
+            flags = paired[round_index]
+            while position < len(flags) and flags[position]:
+                position += 1
+            if position < len(flags):
+                return round_index, position
+            round_index, position = round_index + 1, 0
+        return None
+
+    first = next_team(0, 0)
+    if first is None:
+        return [[] for _ in round_teams]
+    # Frames are [round, position of the team, next position to try, position of its pair]
+    stack = [[*first, first[1] + 1, None]]
+    steps = 0
+    while stack:
+        frame = stack[-1]
+        round_index, position, candidate, partner = frame
+        teams, flags = round_teams[round_index], paired[round_index]
+        team = teams[position]
+        if partner is not None:
+            # Backtracking: undo the current pair
+            flags[partner] = False
+            played.discard(frozenset((team, teams[partner])))
+        while candidate < len(teams):
+            if not flags[candidate]:
+                steps += 1
+                if steps > MAX_PAIRING_STEPS:
+                    return None
+                if frozenset((team, teams[candidate])) not in played:
+                    break
+            candidate += 1
+        if candidate == len(teams):
+            flags[position] = False
+            stack.pop()
+            continue
+        flags[position] = flags[candidate] = True
+        played.add(frozenset((team, teams[candidate])))
+        frame[2:] = [candidate + 1, candidate]
+        following = next_team(round_index, position + 1)
+        if following is None:
+            pairings = [[] for _ in round_teams]
+            for round_index, position, _, partner in stack:
+                teams = round_teams[round_index]
+                pairings[round_index].append((teams[position], teams[partner]))
+            return pairings
+        stack.append([*following, following[1] + 1, None])
+    return None
+
+def _greedy_pairings(teams, played):
+    """
+    Pairings of the teams, each team (in order) with the highest ranked team it has
+    not played yet, or with the next team if it played them all
+    """
+    pending = list(teams)
+    pairs = []
+    while pending:
+        team = pending.pop(0)
+        index = next((i for i, other in enumerate(pending) if frozenset((team, other)) not in played), 0)
+        pairs.append((team, pending.pop(index)))
+    return pairs
+
+def swiss_pairings(teams, rounds=1, previous=()):
+    """
+    Pairings of the given teams (in ranking order) on each round, as lists of
+    (white, black) tuples (black is None for byes). `previous` are the (white, black)
+    pairs already played, which are not repeated if possible. Teams get white
+    and black alternately, as much as possible.
+    """
+    teams = list(teams)
+    if len(teams) < 2:
+        return []
+    played = { frozenset(pair) for pair in previous }
+    byes = { white if black is None else black for white, black in previous if None in (white, black) }
+    whites = Counter(white for white, black in previous if black is not None)
+    round_teams, round_byes = [], []
+    for _ in range(rounds):
+        pending = list(teams)
+        bye = None
+        if len(pending) % 2:
+            # The lowest ranked team without a bye yet (or the lowest ranked team)
+            bye = next((team for team in reversed(pending) if team not in byes), pending[-1])
+            pending.remove(bye)
+            byes.add(bye)
+        round_teams.append(pending)
+        round_byes.append(bye)
+    round_pairs = _pair_rounds(round_teams, played)
+    if round_pairs is None:
+        # Repeat as few pairings as possible, round by round
+        round_pairs = []
+        for pending in round_teams:
+            pairs = _pair_rounds([pending], played)
+            if pairs is not None:
+                pairs = pairs[0]
+            else:
+                # Whichever repeats fewer pairs: the greedy pairing, or adjacent teams
+                pairs = min((_greedy_pairings(pending, played), list(zip(pending[::2], pending[1::2]))),
+                    key=lambda pairs: sum(frozenset(pair) in played for pair in pairs))
+            played |= { frozenset(pair) for pair in pairs }
+            round_pairs.append(pairs)
+    pairings = []
+    for pairs, bye in zip(round_pairs, round_byes):
+        coloured = []
+        for team, other in pairs:
+            if whites[team] > whites[other]:
+                team, other = other, team
+            whites[team] += 1
+            coloured.append((team, other))
+        if bye is not None:
+            coloured.append((bye, None))
+        pairings.append(coloured)
+    return pairings
+
+def _previous_pairs(category_id):
+    return list(
+        Match.objects.filter(Q(white_team__category=category_id) | Q(black_team__category=category_id))
+        .values_list('white_team_id', 'black_team_id')
+    )
+
+def generate_schedule(schedule, system, start_time, slot, tables, rounds=None,
+        categories=None, seed=None):
+    """
+    Generate `rounds` rounds (all of them for round robin, if None) of matches between
+    the teams of each category (or the given categories), and add them to `schedule`
+    after its last round. Each match lasts `slot` (a timedelta), and the matches of
+    each round are laid out on `tables` tables, starting at `start_time`. Teams are
+    shuffled with `seed` for round robin, and ordered by their ranking for Swiss.
+    Returns a GeneratedSchedule.
+    """
+    system = PairingSystem(system)
+    if tables < 1:
+        raise ValueError('At least one table is needed')
+    if system == PairingSystem.SWISS and rounds is None:
+        rounds = 1
+    teams = Team.ranked_objects.ranking() if system == PairingSystem.SWISS else Team.objects.order_by('id')
+    if categories is not None:
+        teams = teams.filter(category__in=categories)
+    teams_by_category = {}
+    for team in teams.only('id', 'category_id'):
+        teams_by_category.setdefault(team.category_id, []).append(team.id)
+
+    rng = random.Random(seed)
+    category_pairings = []
+    for category_id, team_ids in sorted(teams_by_category.items()):
+        if system == PairingSystem.ROUND_ROBIN:
+            rng.shuffle(team_ids)
+            category_pairings.append(round_robin_pairings(team_ids, rounds))
+        else:
+            category_pairings.append(swiss_pairings(team_ids, rounds, _previous_pairs(category_id)))
+
+    first_round = (schedule.matches.aggregate(last_round=Max('round'))['last_round'] or 0) + 1
+    matches, scheduled_matches = [], []
+    round_start = start_time
+    for offset in range(max(map(len, category_pairings), default=0)):
+        # All the categories play each round at the same time, sharing the tables
+        pairs = [pair for pairings in category_pairings if offset < len(pairings) for pair in pairings[offset]]
+        played = [pair for pair in pairs if pair[1] is not None]
+        byes = [pair for pair in pairs if pair[1] is None]
+        for index, (white_id, black_id) in enumerate(played + byes):
+            match = Match(white_team_id=white_id, black_team_id=black_id)
+            if black_id is None:
+                table, slot_start = ScheduledMatch.BYE_TABLE, round_start
+            else:
+                table, slot_start = index % tables + 1, round_start + (index // tables) * slot
+            matches.append(match)
+            scheduled_matches.append(ScheduledMatch(schedule=schedule, match=match,
+                round=first_round + offset, table=table,
+                start_time=slot_start, end_time=slot_start + slot))
+        slots = -(-len(played) // tables)
+        round_start += max(slots, 1) * slot
+
+    with transaction.atomic():
+        # Match IDs are generated in Python, so they are known before being created
+        Match.objects.bulk_create(matches, batch_size=500)
+        ScheduledMatch.objects.bulk_create(scheduled_matches, batch_size=500)
+        # Bulk operations bypass the model signals. Unplayed matches do not change any results.
+        data_version.bump()
+    return GeneratedSchedule(matches, scheduled_matches, schedule_conflicts(schedule))
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0002_auto_20200707_1213'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduledmatch',
+            index=models.Index(fields=['schedule', 'start_time', 'table', 'id'], name='schedules_s_schedul_5eb986_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedules', '0003_scheduledmatch_time_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scheduledmatch',
+            index=models.Index(fields=['schedule', 'table', 'start_time'], name='schedules_s_schedul_2f3eb6_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models
-from django.db.models import Q, F
+from django.db.models import Q, F, OuterRef, Subquery
 from django.utils.translation import (gettext_lazy as _, pgettext_lazy, gettext)
 from matches.models import Match
+from teams.models import Team
 
 class Schedule(models.Model):
     class Meta:
@@ -24,7 +25,67 @@ class Schedule(models.Model):
         else:
             return gettext('Schedule %d') % (self.id,)
 
+class ScheduledMatchManager(models.Manager):
+    """
+    Lookups of the matches being played or about to be played on a schedule, each
+    one a range scan of an index. Byes are not played, so they are never included.
+    """
+    def now_playing(self, schedule, table, now):
+        """
+        The match being played on `table` at `now`, if any
+        """
+        if table == ScheduledMatch.BYE_TABLE:
+            return None
+        # Matches do not overlap on a table (see schedules.conflicts), so only the
+        # last one started may still be playing
+        latest = (
+            self.filter(schedule=schedule, table=table, start_time__lte=now)
+            .order_by('-start_time', '-id').first()
+        )
+        return latest if latest is not None and latest.end_time > now else None
+
+    def up_next(self, schedule, now, table=None):
+        """
+        Matches starting after `now` (on `table`, if given), in chronological order
+        """
+        matches = self.filter(schedule=schedule, start_time__gt=now)
+        if table is not None:
+            matches = matches.filter(table=table)
+        return matches.exclude(table=ScheduledMatch.BYE_TABLE).order_by('start_time', 'table', 'id')
+
+    def next_matches(self, schedule, team_ids, now):
+        """
+        Next match (being played, or the first one to start) after `now` of each
+        of the given teams. Returns a dictionary by team ID.
+        """
+        team_ids = set(team_ids)
+        # The first match of each team is picked by the database, so only those are loaded
+        first_match = (
+            self.filter(schedule=schedule, end_time__gt=now)
+            .filter(Q(match__white_team=OuterRef('pk')) | Q(match__black_team=OuterRef('pk')))
+            .exclude(table=ScheduledMatch.BYE_TABLE)
+            .order_by('start_time', 'table', 'id')
+            .values('id')[:1]
+        )
+        first_match_ids = Team.objects.filter(id__in=team_ids).annotate(
+            first_match=Subquery(first_match)).values('first_match')
+        scheduled_matches = (
+            self.filter(id__in=first_match_ids)
+            .select_related('match')
+            .order_by('start_time', 'table', 'id')
+        )
+        next_matches = {}
+        for scheduled_match in scheduled_matches:
+            # The first match of a team may also be a later one of its opponent,
+            # which already got its own
+            for team_id in (scheduled_match.match.white_team_id, scheduled_match.match.black_team_id):
+                if team_id in team_ids:
+                    next_matches.setdefault(team_id, scheduled_match)
+        return next_matches
+
 class ScheduledMatch(models.Model):
+    BYE_TABLE = 0
+
     class Meta:
         verbose_name = _('scheduled match')
         verbose_name_plural = _('scheduled matches')
@@ -32,6 +93,14 @@ class ScheduledMatch(models.Model):
             models.CheckConstraint(check=Q(end_time__gte=F('start_time')), name='coherent_time'),
             models.UniqueConstraint(fields=('schedule', 'match'), name='no_match_repetition')
         ]
+        indexes = [
+            # Matches of a schedule in chronological order (also used by keyset pagination)
+            models.Index(fields=('schedule', 'start_time', 'table', 'id')),
+            # Matches of each table in chronological order
+            models.Index(fields=('schedule', 'table', 'start_time')),
+        ]
+
+    objects = ScheduledMatchManager()
 
     schedule = models.ForeignKey(
         Schedule,
@@ -48,6 +117,8 @@ class ScheduledMatch(models.Model):
         help_text=_("Related match, or empty for 'to-be-decided'")
     )
     round = models.PositiveIntegerField(default=None, null=True, verbose_name=_('round'))
+    # Byes (matches with a single team, see Match) are not played on any table,
+    # and are scheduled on BYE_TABLE
     table = models.PositiveIntegerField(default=1, verbose_name=pgettext_lazy('competition field', 'table'))
     start_time = models.DateTimeField(verbose_name=_('start time'))
     end_time = models.DateTimeField(verbose_name=_('end time'))
@@ -1,5 +1,16 @@
+from datetime import timedelta
 import graphene
+from django.db import transaction
+from django.utils import timezone
 from graphene_django import DjangoObjectType
+from robocat import response_cache
+from robocat.loaders import get_loaders
+from robocat.pagination import KeysetConnectionField, MAX_PAGE_SIZE
+from robocat.reference_data import ScheduleRecord, get_reference_data
+from teams.models import Category
+from teams.schema import TeamType
+from .conflicts import ConflictKind, schedule_conflicts
+from .generation import PairingSystem, generate_schedule
 from .models import Schedule, ScheduledMatch
 
 class ScheduledMatchType(DjangoObjectType):
@@ -7,6 +18,9 @@ class ScheduledMatchType(DjangoObjectType):
         model = ScheduledMatch
         fields = ['schedule', 'match', 'round', 'table', 'start_time', 'end_time']
 
+    def resolve_match(self, info, **kwargs):
+        return get_loaders(info).match.load(self.match_id)
+
 class ScheduleType(DjangoObjectType):
     class Meta:
         model = Schedule
@@ -15,6 +29,12 @@ class ScheduleType(DjangoObjectType):
     id = graphene.ID()
     desc = graphene.String()
     matches = graphene.NonNull(graphene.List(graphene.NonNull(ScheduledMatchType)))
+    matches_connection = KeysetConnectionField(ScheduledMatchType, ordering=('start_time', 'table', 'id'))
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        # The active schedule is usually served from the reference data
+        return isinstance(root, ScheduleRecord) or super().is_type_of(root, info)
 
     def resolve_id(self, info, **kwargs):
         if info.context.user.is_staff:
@@ -29,15 +49,106 @@ class ScheduleType(DjangoObjectType):
             return None
 
     def resolve_matches(self, info, **kwargs):
-        return ScheduledMatch.objects.filter(schedule=self)
+        return ScheduledMatch.objects.filter(schedule_id=self.id)
+
+    def resolve_matches_connection(self, info, **kwargs):
+        return ScheduledMatch.objects.filter(schedule_id=self.id)
+
+PairingSystemEnum = graphene.Enum.from_enum(PairingSystem)
+ConflictKindEnum = graphene.Enum.from_enum(ConflictKind)
+
+class ScheduleConflictType(graphene.ObjectType):
+    """
+    Two matches overlapping on the same table, or with the same team
+    """
+    kind = ConflictKindEnum(required=True)
+    table = graphene.Int(description='Table of both matches, for table conflicts')
+    team = graphene.Field(TeamType, description='Team of both matches, for team conflicts')
+    first = graphene.Field(ScheduledMatchType, required=True)
+    second = graphene.Field(ScheduledMatchType, required=True)
+
+def resolve_conflicts(info, conflicts):
+    """
+    ScheduleConflictTypes of the given ScheduleConflicts
+    """
+    scheduled_matches = ScheduledMatch.objects.in_bulk(
+        { conflict.first for conflict in conflicts } | { conflict.second for conflict in conflicts })
+    teams = get_reference_data(info).teams_by_id
+    return [
+        ScheduleConflictType(
+            kind=conflict.kind.value,
+            table=conflict.resource if conflict.kind == ConflictKind.TABLE else None,
+            team=teams.get(conflict.resource) if conflict.kind == ConflictKind.TEAM else None,
+            first=scheduled_matches[conflict.first],
+            second=scheduled_matches[conflict.second],
+        )
+        for conflict in conflicts
+    ]
+
+class GenerateSchedule(graphene.Mutation):
+    """
+    Generate rounds of matches between the teams of each category (see
+    schedules.generation), on a new inactive schedule or after the last round
+    of an existing one.
+    """
+    class Arguments:
+        system = PairingSystemEnum(required=True)
+        start_time = graphene.DateTime(required=True)
+        slot_minutes = graphene.Int(required=True, description='Duration of each match')
+        tables = graphene.Int(required=True)
+        rounds = graphene.Int(description='Number of rounds (by default, all of them for round robin, '
+            'and one for Swiss)')
+        category_ids = graphene.List(graphene.NonNull(graphene.String),
+            description='Categories to schedule (by default, all of them)')
+        schedule_id = graphene.ID(description='Schedule to extend (by default, a new one)')
+        desc = graphene.String(description='Description of the new schedule')
+
+    ok = graphene.Boolean(required=True)
+    schedule = graphene.Field(lambda: ScheduleType)
+    conflicts = graphene.List(graphene.NonNull(ScheduleConflictType),
+        description='Conflicts on the schedule, once generated')
+
+    @staticmethod
+    def mutate(parent, info, system, start_time, slot_minutes, tables, rounds=None,
+            category_ids=None, schedule_id=None, desc=''):
+        if not info.context.user.is_staff or slot_minutes <= 0 or tables <= 0:
+            return GenerateSchedule(ok=False)
+        categories = None
+        if category_ids is not None:
+            categories = list(Category.objects.filter(key__in=category_ids))
+            if len(categories) != len(set(category_ids)):
+                return GenerateSchedule(ok=False)
+        with transaction.atomic():
+            if schedule_id is None:
+                schedule = Schedule.objects.create(desc=desc)
+            else:
+                schedule = Schedule.objects.filter(id=schedule_id).first()
+                if schedule is None:
+                    return GenerateSchedule(ok=False)
+            generated = generate_schedule(schedule, system, start_time, timedelta(minutes=slot_minutes),
+                tables, rounds, categories)
+        return GenerateSchedule(ok=True, schedule=schedule, conflicts=resolve_conflicts(info, generated.conflicts))
+
+class Mutation:
+    generate_schedule = GenerateSchedule.Field()
 
 class Query:
     schedule = graphene.Field(ScheduleType, scheduleId=graphene.ID(required=False))
     all_schedules = graphene.NonNull(graphene.List(graphene.NonNull(ScheduleType)))
+    schedule_conflicts = graphene.List(graphene.NonNull(ScheduleConflictType),
+        scheduleId=graphene.ID(required=True),
+        description='Overlapping matches on a schedule (only for staff users)')
+    now_playing = graphene.Field(ScheduledMatchType, table=graphene.Int(required=True),
+        description='Match being played on a table of the active schedule')
+    up_next = graphene.List(graphene.NonNull(ScheduledMatchType),
+        limit=graphene.Int(default_value=10, description=f'At most {MAX_PAGE_SIZE}'),
+        table=graphene.Int(),
+        description='Next matches to start on the active schedule (or on one of its tables), '
+            'in chronological order')
 
     def resolve_schedule(self, info, scheduleId=None, **kwargs):
         if scheduleId is None:
-            return Schedule.objects.filter(active=True).first()
+            return get_reference_data(info).active_schedule
         elif not info.context.user.is_staff:
             return None
         else:
@@ -47,4 +158,28 @@ class Query:
         if info.context.user.is_staff:
             return Schedule.objects.all()
         else:
-            return Schedule.objects.filter(active=True)
+            active_schedule = get_reference_data(info).active_schedule
+            return [active_schedule] if active_schedule is not None else []
+
+    def resolve_schedule_conflicts(self, info, scheduleId, **kwargs):
+        if not info.context.user.is_staff:
+            return None
+        schedule = Schedule.objects.filter(id=scheduleId).first()
+        if schedule is None:
+            return None
+        return resolve_conflicts(info, schedule_conflicts(schedule))
+
+    def resolve_now_playing(self, info, table, **kwargs):
+        # Changes with the time, not only with the data
+        response_cache.never_cache(info.context)
+        schedule = get_reference_data(info).active_schedule
+        if schedule is None:
+            return None
+        return ScheduledMatch.objects.now_playing(schedule.id, table, timezone.now())
+
+    def resolve_up_next(self, info, limit, table=None, **kwargs):
+        response_cache.never_cache(info.context)
+        schedule = get_reference_data(info).active_schedule
+        if schedule is None or limit <= 0:
+            return []
+        return ScheduledMatch.objects.up_next(schedule.id, timezone.now(), table)[:min(limit, MAX_PAGE_SIZE)]
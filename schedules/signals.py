@@ -0,0 +1,5 @@
+from robocat import data_version, reference_data
+from .models import Schedule, ScheduledMatch
+
+data_version.track(Schedule, ScheduledMatch)
+reference_data.track(Schedule)
@@ -1,3 +1,305 @@
-from django.test import TestCase
+import itertools
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from matches.models import Match
+from matches.tests import execute, make_teams
+from robocat.schema import schema
+from robocat.synthetic import generate_tournament
+from .conflicts import ConflictKind, ScheduleConflict, Slot, find_conflicts, schedule_conflicts
+from .generation import PairingSystem, generate_schedule, swiss_pairings
+from .models import Schedule, ScheduledMatch
 
-# Create your tests here.
+class ScheduleMatchesConnectionTests(TestCase):
+    QUERY = '''query ($after: String) {
+        schedule {
+            matchesConnection(first: 3, after: $after) {
+                edges { node { table startTime match { whiteTeam { id } } } }
+                pageInfo { hasNextPage endCursor }
+            }
+        }
+    }'''
+
+    def test_pages(self):
+        teams = make_teams(8)
+        schedule = Schedule.objects.create(active=True)
+        # Cursors keep the microseconds
+        start = timezone.now().replace(microsecond=123456)
+        for slot in range(2):
+            for table in (2, 1, 3, 4):
+                ScheduledMatch.objects.create(
+                    schedule=schedule,
+                    match=Match.objects.create(white_team=teams[table], black_team=teams[table + 1]),
+                    table=table,
+                    start_time=start + timedelta(minutes=10 * slot),
+                    end_time=start + timedelta(minutes=10 * slot + 5)
+                )
+        seen, after = [], None
+        # Bounded, in case a page repeats the previous one
+        for _ in range(4):
+            page = execute(self.QUERY, after=after)['schedule']['matchesConnection']
+            seen += [(edge['node']['startTime'], edge['node']['table']) for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        self.assertEqual(len(seen), 8)
+        self.assertEqual(seen, sorted(seen))
+
+class ScheduleGenerationTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+
+    def generate(self, system, rounds=None, tables=2):
+        schedule = Schedule.objects.create()
+        generate_schedule(schedule, system, self.start, timedelta(minutes=10), tables, rounds, seed=1)
+        return list(schedule.matches.select_related('match').order_by('round', 'start_time', 'table'))
+
+    def assertConsistent(self, scheduled_matches):
+        booked = Counter()
+        for scheduled in scheduled_matches:
+            match = scheduled.match
+            for team_id in (match.white_team_id, match.black_team_id):
+                booked[(scheduled.round, team_id)] += 1
+            if match.black_team_id is None:
+                self.assertEqual(scheduled.table, ScheduledMatch.BYE_TABLE)
+            else:
+                booked[(scheduled.start_time, scheduled.table)] += 1
+        self.assertEqual([key for key, count in booked.items() if count > 1 and None not in key], [])
+
+    def test_round_robin(self):
+        teams = make_teams(7)
+        scheduled_matches = self.generate(PairingSystem.ROUND_ROBIN)
+        self.assertConsistent(scheduled_matches)
+        self.assertEqual(max(scheduled.round for scheduled in scheduled_matches), 7)
+        pairs = Counter(frozenset((scheduled.match.white_team_id, scheduled.match.black_team_id))
+            for scheduled in scheduled_matches)
+        self.assertEqual(len(pairs), 21 + 7)
+        self.assertEqual(set(pairs.values()), {1})
+        byes = [scheduled.match.white_team_id for scheduled in scheduled_matches
+            if scheduled.match.black_team_id is None]
+        self.assertEqual(sorted(byes), sorted(team.id for team in teams))
+        # 3 matches on 2 tables take 2 slots per round
+        self.assertEqual(scheduled_matches[-1].end_time, self.start + timedelta(minutes=7 * 20))
+
+    def test_swiss(self):
+        teams = make_teams(6)
+        Match.objects.create(white_team=teams[0], black_team=teams[1])
+        scheduled_matches = self.generate(PairingSystem.SWISS, rounds=4, tables=3)
+        self.assertConsistent(scheduled_matches)
+        pairs = [frozenset((scheduled.match.white_team_id, scheduled.match.black_team_id))
+            for scheduled in scheduled_matches]
+        self.assertEqual(len(pairs), 12)
+        self.assertEqual(len(set(pairs) | {frozenset((teams[0].id, teams[1].id))}), 13)
+        # Rounds continue after the last one
+        schedule = scheduled_matches[0].schedule
+        generated = generate_schedule(schedule, PairingSystem.SWISS, self.start, timedelta(minutes=10), 3)
+        self.assertEqual(schedule.matches.filter(round=5).count(), 3)
+        # Starting at the same time as the first round
+        self.assertIn(ConflictKind.TEAM, { conflict.kind for conflict in generated.conflicts })
+
+    def test_large_schedule(self):
+        generate_tournament(200, categories=4, rounds=0)
+        for system in PairingSystem:
+            started = time.perf_counter()
+            scheduled_matches = self.generate(system, rounds=8, tables=20)
+            self.assertLess(time.perf_counter() - started, 1)
+            self.assertEqual(len(scheduled_matches), 800)
+            self.assertConsistent(scheduled_matches)
+
+    def test_large_swiss_category(self):
+        # Thousands of pairs deep, and more pairs tried than MAX_PAIRING_STEPS across the
+        # rounds, so they are paired round by round
+        previous = [(team, team + 1) for team in range(0, 5000, 2)]
+        pairings = swiss_pairings(range(5000), 5, previous)
+        self.assertEqual([len(pairs) for pairs in pairings], [2500] * 5)
+        played = { frozenset(pair) for pair in previous }
+        for pairs in pairings:
+            self.assertEqual(len({ team for pair in pairs for team in pair }), 5000)
+            self.assertFalse(played & { frozenset(pair) for pair in pairs })
+            played |= { frozenset(pair) for pair in pairs }
+
+    def test_repeated_pairings(self):
+        # Team 0 played everybody, so only its pair is repeated
+        pairs, = swiss_pairings(range(4), 1, [(0, 1), (0, 2), (0, 3)])
+        self.assertEqual({ frozenset(pair) for pair in pairs }, {frozenset((0, 1)), frozenset((2, 3))})
+
+    def test_mutation(self):
+        make_teams(4, categories=2)
+        mutation = '''mutation ($start: DateTime!) {
+            generateSchedule(system: ROUND_ROBIN, startTime: $start, slotMinutes: 5, tables: 1,
+                    categoryIds: ["cat-0"], desc: "Draft") {
+                ok
+                schedule { desc active matches { round table match { whiteTeam { id } } } }
+            }
+        }'''
+        result = execute(mutation, start=self.start.isoformat())['generateSchedule']
+        self.assertFalse(result['ok'])
+        staff = User.objects.create(username='staff', is_staff=True)
+        result = execute(mutation, user=staff, start=self.start.isoformat())['generateSchedule']
+        self.assertTrue(result['ok'])
+        self.assertEqual(result['schedule']['desc'], 'Draft')
+        self.assertFalse(result['schedule']['active'])
+        self.assertEqual([match['round'] for match in result['schedule']['matches']], [1])
+
+class ScheduleConflictTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now().replace(microsecond=0)
+        self.teams = make_teams(6)
+        self.schedule = Schedule.objects.create()
+
+    def add(self, table, start, end, white=None, black=None):
+        match = Match.objects.create(white_team=white, black_team=black) if white or black else None
+        return ScheduledMatch.objects.create(schedule=self.schedule, match=match, table=table,
+            start_time=self.start + timedelta(minutes=start), end_time=self.start + timedelta(minutes=end))
+
+    def test_conflicts(self):
+        a, b, c, d, e, f = self.teams
+        first = self.add(1, 0, 10, a, b)
+        # Same table, overlapping
+        second = self.add(1, 5, 15, c, d)
+        # Same team, overlapping
+        third = self.add(2, 8, 12, a, e)
+        # Touching, on the same table and with the same team
+        self.add(1, 15, 20, c, f)
+        # Byes do not take tables
+        self.add(ScheduledMatch.BYE_TABLE, 0, 10, f)
+        self.add(ScheduledMatch.BYE_TABLE, 0, 10, e)
+        self.assertEqual(schedule_conflicts(self.schedule), [
+            ScheduleConflict(ConflictKind.TABLE, 1, first.id, second.id),
+            ScheduleConflict(ConflictKind.TEAM, a.id, first.id, third.id),
+            ScheduleConflict(ConflictKind.TEAM, e.id, ScheduledMatch.objects.get(table=0, match__white_team=e).id,
+                third.id),
+        ])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        slots = []
+        for i in range(300):
+            start = rng.randrange(0, 500)
+            white, black = rng.sample(range(20), 2)
+            slots.append(Slot(i, rng.randrange(0, 6), start, start + rng.randrange(1, 30), white, black))
+        expected = set()
+        for first, second in itertools.combinations(slots, 2):
+            if first.start_time < second.end_time and second.start_time < first.end_time:
+                if first.table == second.table and first.table != ScheduledMatch.BYE_TABLE:
+                    expected.add((ConflictKind.TABLE, first.table, frozenset((first.id, second.id))))
+                for team in { first.white_team_id, first.black_team_id } & { second.white_team_id, second.black_team_id }:
+                    expected.add((ConflictKind.TEAM, team, frozenset((first.id, second.id))))
+        conflicts = find_conflicts(slots)
+        self.assertEqual(len(conflicts), len(expected))
+        self.assertEqual({ (kind, resource, frozenset((first, second))) for kind, resource, first, second in conflicts },
+            expected)
+
+    def test_query(self):
+        a, b, c, _, _, _ = self.teams
+        self.add(1, 0, 10, a, b)
+        self.add(2, 5, 10, b, c)
+        query = '''query ($id: ID!) {
+            scheduleConflicts(scheduleId: $id) { kind table team { id } first { table } second { table } }
+        }'''
+        self.assertIsNone(execute(query, id=self.schedule.id)['scheduleConflicts'])
+        staff = User.objects.create(username='staff', is_staff=True)
+        self.assertEqual(execute(query, user=staff, id=self.schedule.id)['scheduleConflicts'], [
+            {'kind': 'TEAM', 'table': None, 'team': {'id': b.key}, 'first': {'table': 1}, 'second': {'table': 2}},
+        ])
+
+class SyntheticScheduleTests(TestCase):
+    def test_schedule(self):
+        tournament = generate_tournament(25, categories=2, rounds=4, played_rounds=2, tables=3, seed=1)
+        schedule = tournament.schedule
+        self.assertTrue(schedule.active)
+        self.assertEqual(schedule.matches.count(), len(tournament.matches))
+        self.assertEqual(schedule_conflicts(schedule), [])
+        self.assertEqual(Match.objects.filter(status=Match.Status.FINISHED).count(), len(tournament.matches) // 2)
+        self.assertEqual(Match.objects.filter(score__isnull=False).count(),
+            Match.objects.filter(status=Match.Status.FINISHED, black_team__isnull=False).count())
+
+class NowPlayingTests(TestCase):
+    def setUp(self):
+        self.teams = make_teams(5)
+        self.schedule = Schedule.objects.create(active=True)
+        self.now = timezone.now()
+        # Rounds of 10 minutes on 2 tables, the second one being played now
+        rounds = [
+            [(0, 1), (3, 4), (2, None)],
+            [(0, 2), (3, None)],
+            [(1, 2), (4, 0), (3, None)],
+        ]
+        for round_number, pairs in enumerate(rounds):
+            start = self.now + timedelta(minutes=10 * (round_number - 1) - 5)
+            for table, (white, black) in enumerate(pairs, 1):
+                if black is None:
+                    table = ScheduledMatch.BYE_TABLE
+                match = Match.objects.create(white_team=self.teams[white],
+                    black_team=self.teams[black] if black is not None else None)
+                ScheduledMatch.objects.create(schedule=self.schedule, round=round_number + 1, match=match,
+                    table=table, start_time=start, end_time=start + timedelta(minutes=10))
+
+    def test_now_playing(self):
+        data = execute('''{
+            one: nowPlaying(table: 1) { round match { blackTeam { id } } }
+            two: nowPlaying(table: 2) { round }
+            bye: nowPlaying(table: 0) { round }
+        }''')
+        self.assertEqual(data['one'], {'round': 2, 'match': {'blackTeam': {'id': 'team-2'}}})
+        self.assertIsNone(data['two'])
+        self.assertIsNone(data['bye'])
+
+    def test_up_next(self):
+        data = execute('''{
+            upNext { round table }
+            first: upNext(limit: 1) { table }
+            table: upNext(table: 2) { round }
+        }''')
+        self.assertEqual(data['upNext'], [{'round': 3, 'table': 1}, {'round': 3, 'table': 2}])
+        self.assertEqual(data['first'], [{'table': 1}])
+        self.assertEqual(data['table'], [{'round': 3}])
+
+    def test_next_match(self):
+        with self.assertNumQueries(5):
+            # The reference data, and the next matches of all the teams at once
+            data = execute('{ allTeams { id nextMatch { round table } } }')
+        next_matches = { team['id']: team['nextMatch'] for team in data['allTeams'] }
+        self.assertEqual(next_matches, {
+            'team-0': {'round': 2, 'table': 1},
+            'team-1': {'round': 3, 'table': 1},
+            'team-2': {'round': 2, 'table': 1},
+            # Byes are skipped
+            'team-3': None,
+            'team-4': {'round': 3, 'table': 2},
+        })
+
+    def test_inactive_schedule(self):
+        self.schedule.active = False
+        self.schedule.save()
+        data = execute('{ nowPlaying(table: 1) { round } upNext { round } team(teamId: "team-0") { nextMatch { round } } }')
+        self.assertEqual(data, {'nowPlaying': None, 'upNext': [], 'team': {'nextMatch': None}})
+
+    def test_never_cached(self):
+        context = SimpleNamespace(user=AnonymousUser())
+        schema.execute('{ allTeams { id } }', context=context)
+        self.assertFalse(hasattr(context, 'graphql_uncacheable'))
+        schema.execute('{ upNext { round } }', context=context)
+        self.assertTrue(context.graphql_uncacheable)
+
+class ScheduleAdminTests(TestCase):
+    # The admin templates need the static files, which are not collected for the tests
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_mark_as_not_active(self):
+        schedule = Schedule.objects.create(active=True)
+        self.client.force_login(User.objects.create_superuser('admin'))
+        # Bumped on commit, which the test transaction never does
+        with mock.patch('robocat.data_version.bump') as bump:
+            response = self.client.post(reverse('admin:schedules_schedule_changelist'), {
+                'action': 'mark_as_not_active', '_selected_action': [schedule.id]})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Schedule.objects.get().active)
+        # Updated in bulk, so the cached responses of every process must be dropped
+        bump.assert_called_once()
@@ -0,0 +1,289 @@
+"""
+Bulk import of categories, institutions, teams and team members from CSV or
+JSON Lines, used by the `import_teams` command and the import endpoint.
+
+Each record has a `type` (one of RECORD_FIELDS) and the fields of that type.
+Objects are identified by key (by username, for members), and related objects
+must exist or be imported earlier (or in the same chunk). Existing objects are
+updated, and the users of members are created without password if they do
+not exist.
+
+Records are streamed and written in chunks with bulk_create/bulk_update,
+resolving keys with in-memory maps, so importing takes a fixed number of
+queries per chunk and memory does not grow with the size of the input (apart
+from the maps of keys). Everything is imported in a single transaction, which is
+rolled back if any record is invalid, or on dry runs: either everything is
+imported, or nothing is.
+"""
+import csv
+import itertools
+import json
+from collections import Counter, namedtuple
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.translation import gettext as e_
+from robocat import data_version, reference_data
+from .models import Category, Institution, Team, TeamMembership
+
+# Fields of each type of record (the first one identifies it), with whether they are required
+RECORD_FIELDS = {
+    'category': {'key': True, 'name': True, 'colour': True},
+    'institution': {'key': True, 'name': True, 'contact_info': False},
+    'team': {'key': True, 'name': True, 'category': True, 'institution': True},
+    'member': {'username': True, 'team': True},
+}
+
+# Records written at once
+CHUNK_SIZE = 500
+# Errors reported, at most (the rest are only counted)
+MAX_ERRORS = 100
+
+# Error on the record at `line` of the input, on `field` (None if not specific to a field)
+RecordError = namedtuple('RecordError', ('line', 'field', 'message'))
+
+class ImportReport:
+    """
+    Counts of the objects created and updated of each type, and the errors found
+    """
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.records = 0
+        self.created = Counter()
+        self.updated = Counter()
+        self.errors = []
+        self.error_count = 0
+
+    @property
+    def ok(self):
+        return self.error_count == 0
+
+    def add_error(self, line, field, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(RecordError(line, field, str(message)))
+
+    def as_dict(self):
+        return {
+            'ok': self.ok,
+            'dryRun': self.dry_run,
+            'records': self.records,
+            'created': dict(self.created),
+            'updated': dict(self.updated),
+            'errorCount': self.error_count,
+            'errors': [error._asdict() for error in self.errors],
+        }
+
+def read_csv(stream):
+    """
+    Records of a CSV stream with a header, as (line, dict) tuples
+    """
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, { name: value for name, value in row.items() if name is not None }
+
+def read_jsonl(stream):
+    """
+    Records of a JSON Lines stream, as (line, dict) tuples (None for invalid lines)
+    """
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            record = json.loads(text)
+        except ValueError:
+            record = None
+        yield line, record if isinstance(record, dict) else None
+
+READERS = {
+    'csv': read_csv,
+    'jsonl': read_jsonl,
+}
+
+class _Importer:
+    def __init__(self, report):
+        self.report = report
+        self.category_ids = dict(Category.objects.values_list('key', 'id'))
+        self.institution_ids = dict(Institution.objects.values_list('key', 'id'))
+        self.team_ids = dict(Team.objects.values_list('key', 'id'))
+        # Keys (or usernames) imported so far of each type of record
+        self.imported = { record_type: set() for record_type in RECORD_FIELDS }
+
+    def parse(self, record_type, records):
+        """
+        Values of the fields of the records (blank optional fields omitted), as
+        (line, values) tuples. Records missing required fields, or imported more
+        than once, are reported and skipped.
+        """
+        parsed = []
+        fields = RECORD_FIELDS[record_type]
+        lookup = next(iter(fields))
+        for line, record in records:
+            values, valid = {}, True
+            for field, required in fields.items():
+                value = record.get(field)
+                value = '' if value is None else str(value).strip()
+                if value:
+                    values[field] = value
+                elif required:
+                    self.report.add_error(line, field, e_('This field is required.'))
+                    valid = False
+            if not valid:
+                continue
+            if values[lookup] in self.imported[record_type]:
+                self.report.add_error(line, lookup, e_('Imported more than once'))
+                continue
+            self.imported[record_type].add(values[lookup])
+            parsed.append((line, values))
+        return parsed
+
+    def resolve(self, line, values, field, ids):
+        object_id = ids.get(values[field])
+        if object_id is None:
+            self.report.add_error(line, field, e_('Unknown key: %s') % (values[field],))
+        return object_id
+
+    def validate(self, line, instance):
+        try:
+            # Related objects are resolved through the key maps instead of being
+            # checked one by one
+            instance.clean_fields(exclude=[field.name for field in instance._meta.concrete_fields
+                if field.is_relation])
+        except ValidationError as e:
+            for field, messages in e.message_dict.items():
+                for message in messages:
+                    self.report.add_error(line, field, message)
+            return False
+        return True
+
+    def upsert(self, model, record_type, records, ids, build):
+        """
+        Create or update the instances of `model` of the records, by key, and add
+        the created ones to `ids`. `build` sets the fields of an instance from the
+        values of a record, returning False if they are invalid.
+        """
+        records = self.parse(record_type, records)
+        existing = model.objects.in_bulk({ values['key'] for _, values in records }, field_name='key')
+        created, updated = [], []
+        for line, values in records:
+            instance = existing.get(values['key'])
+            adding = instance is None
+            if adding:
+                instance = model(key=values['key'])
+            if build(line, instance, values) and self.validate(line, instance):
+                (created if adding else updated).append(instance)
+        # Written even if there are errors (they are rolled back anyway), so that the
+        # keys of valid records resolve, and only actual errors are reported
+        model.objects.bulk_create(created, batch_size=CHUNK_SIZE)
+        fields = [field for field in RECORD_FIELDS[record_type] if field != 'key']
+        model.objects.bulk_update(updated, fields, batch_size=CHUNK_SIZE)
+        if created:
+            # IDs are not returned by bulk_create on every database
+            ids.update(model.objects.filter(key__in=[instance.key for instance in created])
+                .values_list('key', 'id'))
+        self.report.created[record_type] += len(created)
+        self.report.updated[record_type] += len(updated)
+
+    def build_category(self, line, category, values):
+        category.name, category.colour = values['name'], values['colour']
+        return True
+
+    def build_institution(self, line, institution, values):
+        institution.name = values['name']
+        institution.contact_info = values.get('contact_info', '')
+        return True
+
+    def build_team(self, line, team, values):
+        team.name = values['name']
+        category_id = self.resolve(line, values, 'category', self.category_ids)
+        institution_id = self.resolve(line, values, 'institution', self.institution_ids)
+        if category_id is None or institution_id is None:
+            return False
+        team.category_id, team.institution_id = category_id, institution_id
+        return True
+
+    def import_members(self, records):
+        members = []
+        for line, values in self.parse('member', records):
+            team_id = self.resolve(line, values, 'team', self.team_ids)
+            if team_id is not None:
+                members.append((line, values['username'], team_id))
+        users = User.objects.in_bulk({ username for _, username, _ in members }, field_name='username')
+        # Missing users are created without password
+        new_users = []
+        for line, username, _ in members:
+            if username not in users:
+                user = User(username=username, password=make_password(None))
+                if self.validate(line, user):
+                    new_users.append(user)
+        User.objects.bulk_create(new_users, batch_size=CHUNK_SIZE)
+        users.update(User.objects.in_bulk([user.username for user in new_users], field_name='username'))
+        self.report.created['user'] += len(new_users)
+
+        memberships = {
+            membership.user_id: membership for membership in
+            TeamMembership.objects.filter(user__in=[user.id for user in users.values()])
+        }
+        created, updated = [], []
+        for line, username, team_id in members:
+            user = users.get(username)
+            if user is None:
+                # Invalid username, already reported
+                continue
+            membership = memberships.get(user.id)
+            if membership is None:
+                created.append(TeamMembership(user=user, team_id=team_id))
+            elif membership.team_id != team_id:
+                membership.team_id = team_id
+                updated.append(membership)
+        TeamMembership.objects.bulk_create(created, batch_size=CHUNK_SIZE)
+        TeamMembership.objects.bulk_update(updated, ['team'], batch_size=CHUNK_SIZE)
+        self.report.created['member'] += len(created)
+        self.report.updated['member'] += len(updated)
+
+    def import_chunk(self, chunk):
+        by_type = { record_type: [] for record_type in RECORD_FIELDS }
+        for line, record in chunk:
+            self.report.records += 1
+            if record is None:
+                self.report.add_error(line, None, e_('Invalid record'))
+            elif record.get('type') not in by_type:
+                self.report.add_error(line, 'type', e_('Unknown type: %s') % (record.get('type'),))
+            else:
+                by_type[record['type']].append((line, record))
+        # Related objects first, so they may be imported in the same chunk
+        self.upsert(Category, 'category', by_type['category'], self.category_ids, self.build_category)
+        self.upsert(Institution, 'institution', by_type['institution'], self.institution_ids,
+            self.build_institution)
+        self.upsert(Team, 'team', by_type['team'], self.team_ids, self.build_team)
+        self.import_members(by_type['member'])
+
+def import_records(records, dry_run=False):
+    """
+    Import the given records, as (line, dict) tuples (see read_csv and read_jsonl).
+    Nothing is imported if any record is invalid, or if `dry_run`. Returns an
+    ImportReport.
+    """
+    report = ImportReport(dry_run)
+    records = iter(records)
+    with transaction.atomic():
+        importer = _Importer(report)
+        while True:
+            chunk = list(itertools.islice(records, CHUNK_SIZE))
+            if not chunk:
+                break
+            importer.import_chunk(chunk)
+        if dry_run or not report.ok:
+            transaction.set_rollback(True)
+        else:
+            # Bulk operations bypass the model signals
+            data_version.bump()
+            reference_data.invalidate()
+    return report
+
+def import_stream(stream, format, dry_run=False):
+    """
+    Import the records of a text stream in the given format (one of READERS)
+    """
+    return import_records(READERS[format](stream), dry_run)
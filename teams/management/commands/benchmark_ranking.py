@@ -0,0 +1,79 @@
+import itertools
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from robocat.benchmarking import Rollback, format_measurement, measure
+from robocat.synthetic import generate_tournament
+from matches.models import Match, Score
+from teams.models import Team, TeamStanding
+
+class Command(BaseCommand):
+    help = ('Time the ranking queries on synthetic tournaments of several sizes. '
+        'The synthetic data is created inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[50, 500, 5000],
+            help='Number of teams of each tournament')
+        parser.add_argument('--rounds', type=int, default=6, help='Rounds played by each team')
+        parser.add_argument('--repeat', type=int, default=5, help='Times each query is timed')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--tie-group', type=int, default=1000,
+            help='Number of teams of a tournament where every match is a draw (0 to skip it)')
+
+    def time(self, label, function, repeat):
+        self.stdout.write(format_measurement(label, measure(function, repeat)))
+
+    def benchmark(self, size, rounds, repeat, seed):
+        tournament = generate_tournament(size, rounds=rounds, seed=seed)
+        category = tournament.categories[0]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            '%d teams, %d matches' % (size, len(tournament.matches))))
+        self.time('ranking (standings)', lambda: list(Team.ranked_objects.ranking()), repeat)
+        self.time('ranking of a category (standings)',
+            lambda: list(Team.ranked_objects.ranking(category)), repeat)
+        self.time('ranking (from matches)', lambda: list(Team.ranked_objects.live_ranking()), repeat)
+        self.time('ranking of a category (from matches)',
+            lambda: list(Team.ranked_objects.live_ranking(category)), repeat)
+        self.time('ranking of finished matches (from matches)',
+            lambda: list(Team.ranked_objects.live_ranking(statuses=[Match.Status.FINISHED])), repeat)
+        self.time('rebuild standings', TeamStanding.objects.rebuild, repeat)
+
+    def benchmark_tie_group(self, size, rounds, repeat, seed):
+        # An even number of teams in a single category, so nobody gets a bye
+        size += size % 2
+        tournament = generate_tournament(size, categories=1, rounds=rounds, seed=seed)
+        Score.objects.update(white_disqualified=False, black_disqualified=False,
+            white_stalled=F('black_stalled'), cubes_on_lower_white=F('cubes_on_lower_black'),
+            cubes_on_upper_white=F('cubes_on_upper_black'),
+            cubes_on_white_field=F('cubes_on_black_field'), white_adhoc=F('black_adhoc'))
+        TeamStanding.objects.rebuild()
+        match = next(match for match in tournament.matches if match.status == Match.Status.FINISHED)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            'Tie group of %d teams, %d matches' % (size, len(tournament.matches))))
+        self.time('tie-breakers of all the groups', TeamStanding.objects.refresh_tiebreaks, repeat)
+        team_ids = [match.white_team_id, match.black_team_id]
+        self.time('standings of a match (unchanged results)',
+            lambda: TeamStanding.objects.refresh(team_ids), repeat)
+
+        # Alternately lost by white and drawn, so the teams change tie groups
+        disqualified = itertools.cycle((True, False))
+
+        def change_result():
+            Score.objects.filter(match=match).update(white_disqualified=next(disqualified))
+            TeamStanding.objects.refresh(team_ids)
+        self.time('standings of a match (with its tie groups)', change_result, repeat)
+        self.time('ranking (standings)', lambda: list(Team.ranked_objects.ranking()), repeat)
+
+    def run(self, benchmark, *args):
+        try:
+            with transaction.atomic():
+                benchmark(*args)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def handle(self, *args, sizes, rounds, repeat, seed, tie_group, **options):
+        for size in sizes:
+            self.run(self.benchmark, size, rounds, repeat, seed)
+        if tie_group:
+            self.run(self.benchmark_tie_group, tie_group, rounds, repeat, seed)
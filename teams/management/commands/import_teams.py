@@ -0,0 +1,38 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from teams.importing import READERS, import_stream
+
+class Command(BaseCommand):
+    help = ('Import categories, institutions, teams and team members from a CSV or JSON Lines '
+        'file (see teams.importing). Nothing is imported if any record is invalid.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for the standard input')
+        parser.add_argument('--format', choices=sorted(READERS),
+            help='Format of the file (by default, from its extension)')
+        parser.add_argument('--dry-run', action='store_true',
+            help='Only validate the records, without importing them')
+
+    def handle(self, *args, path, format, dry_run, **options):
+        if format is None:
+            format = 'csv' if path.endswith('.csv') else 'jsonl'
+        if path == '-':
+            report = import_stream(sys.stdin, format, dry_run)
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                report = import_stream(stream, format, dry_run)
+        for error in report.errors:
+            self.stderr.write('Line %d%s: %s' % (
+                error.line, f' ({error.field})' if error.field else '', error.message))
+        if report.error_count > len(report.errors):
+            self.stderr.write('... and %d more errors' % (report.error_count - len(report.errors),))
+        if not report.ok:
+            raise CommandError('%d invalid records, nothing was imported' % (report.error_count,))
+        summary = ', '.join(
+            '%s: %d created, %d updated' % (record_type, report.created[record_type], report.updated[record_type])
+            for record_type in sorted(set(report.created) | set(report.updated))
+        ) or 'nothing to import'
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('Valid records (dry run, nothing was imported): %s' % (summary,)))
+        else:
+            self.stdout.write(self.style.SUCCESS('Imported %d records (%s)' % (report.records, summary)))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from robocat import data_version
+from teams.models import TeamStanding
+
+class Command(BaseCommand):
+    help = ('Rebuild the standings of all teams from their scored matches. '
+        'Standings are kept up to date automatically; this is only needed after '
+        'changing the results without the ORM (e.g. loading a database dump).')
+
+    def handle(self, *args, **options):
+        count = TeamStanding.objects.rebuild()
+        data_version.bump()
+        self.stdout.write(self.style.SUCCESS('Rebuilt the standings of %d teams' % (count,)))
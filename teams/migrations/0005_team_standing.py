@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0004_team_membership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamStanding',
+            fields=[
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='standing', serialize=False, to='teams.team', verbose_name='team')),
+                ('qualification_points', models.IntegerField(default=0, verbose_name='qualification points')),
+                ('total_score', models.IntegerField(default=0, verbose_name='total score')),
+                ('matches_played', models.PositiveIntegerField(default=0, verbose_name='matches played')),
+                ('wins', models.PositiveIntegerField(default=0, verbose_name='wins')),
+                ('draws', models.PositiveIntegerField(default=0, verbose_name='draws')),
+                ('losses', models.PositiveIntegerField(default=0, verbose_name='losses')),
+            ],
+            options={
+                'verbose_name': 'team standing',
+                'verbose_name_plural': 'team standings',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='teamstanding',
+            index=models.Index(fields=['-qualification_points', '-total_score'], name='teams_teams_qualifi_67df54_idx'),
+        ),
+    ]
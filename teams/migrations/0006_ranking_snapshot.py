@@ -0,0 +1,50 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0005_team_standing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingSnapshot',
+            fields=[
+                ('version', models.AutoField(primary_key=True, serialize=False, verbose_name='version')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('frozen', models.BooleanField(default=False, verbose_name='frozen')),
+                ('category', models.ForeignKey(blank=True, help_text='Category of the ranking, or empty for the overall ranking', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ranking_snapshots', to='teams.category', verbose_name='category')),
+            ],
+            options={
+                'verbose_name': 'ranking snapshot',
+                'verbose_name_plural': 'ranking snapshots',
+            },
+        ),
+        migrations.CreateModel(
+            name='RankingSnapshotEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='position')),
+                ('qualification_points', models.IntegerField(verbose_name='qualification points')),
+                ('total_score', models.IntegerField(verbose_name='total score')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='teams.rankingsnapshot', verbose_name='snapshot')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranking_entries', to='teams.team', verbose_name='team')),
+            ],
+            options={
+                'verbose_name': 'ranking snapshot entry',
+                'verbose_name_plural': 'ranking snapshot entries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='rankingsnapshotentry',
+            constraint=models.UniqueConstraint(fields=('snapshot', 'position'), name='unique_snapshot_position'),
+        ),
+        migrations.AddIndex(
+            model_name='rankingsnapshot',
+            index=models.Index(fields=['category', 'frozen'], name='teams_ranki_categor_9022fc_idx'),
+        ),
+    ]
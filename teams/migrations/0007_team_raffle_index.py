@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-17 23:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0006_ranking_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['raffle', 'id'], name='teams_team_raffle_950022_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:28
+
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import DenseRank
+
+
+def backfill_tiebreaks(apps, schema_editor):
+    """
+    Tiebreaks of the existing standings and snapshot entries by the default
+    tie-breaker (see teams.tiebreakers): the dense rank of the total score among
+    the teams with the same qualification points. Rankings configured with other
+    tie-breakers are recomputed by `manage.py rebuild_standings`.
+    """
+    db_alias = schema_editor.connection.alias
+    TeamStanding = apps.get_model('teams', 'TeamStanding')
+    RankingSnapshotEntry = apps.get_model('teams', 'RankingSnapshotEntry')
+    for model, partition_by in (
+            (TeamStanding, [F('qualification_points')]),
+            (RankingSnapshotEntry, [F('snapshot'), F('qualification_points')])):
+        rows = model.objects.using(db_alias).annotate(dense_rank=Window(
+            DenseRank(), partition_by=partition_by, order_by=F('total_score').desc()))
+        instances = [model(pk=pk, tiebreak=tiebreak)
+            for pk, tiebreak in rows.values_list('pk', 'dense_rank')]
+        model.objects.using(db_alias).bulk_update(instances, ['tiebreak'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0007_team_raffle_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingsnapshotentry',
+            name='tiebreak',
+            field=models.PositiveIntegerField(null=True, verbose_name='tiebreak'),
+        ),
+        migrations.AddField(
+            model_name='teamstanding',
+            name='tiebreak',
+            field=models.PositiveIntegerField(help_text='Rank of the team among those with the same qualification points, by the tie-breakers', null=True, verbose_name='tiebreak'),
+        ),
+        migrations.RunPython(backfill_tiebreaks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-18 00:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0008_tiebreaks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Finalist',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(help_text='Position of the team in the ranking it was chosen from', verbose_name='position')),
+                ('qualification_points', models.IntegerField(verbose_name='qualification points')),
+                ('total_score', models.IntegerField(verbose_name='total score')),
+                ('published', models.BooleanField(default=False, verbose_name='published')),
+                ('selected_at', models.DateTimeField(auto_now_add=True, verbose_name='selected at')),
+                ('category', models.ForeignKey(blank=True, help_text='Category the team was chosen from, or empty if chosen from the overall ranking', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='finalists', to='teams.category', verbose_name='category')),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='finalist', to='teams.team', verbose_name='team')),
+            ],
+            options={
+                'verbose_name': 'finalist',
+                'verbose_name_plural': 'finalists',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='finalist',
+            index=models.Index(fields=['published', 'category', 'position'], name='teams_final_publish_4d0967_idx'),
+        ),
+    ]
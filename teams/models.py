@@ -1,9 +1,12 @@
-from django.db import models
-from django.db.models.functions import Coalesce
-from django.db.models import OuterRef, Sum
+from django.db import models, transaction, connections
+from django.db.models.functions import Coalesce, Rank, RowNumber
+from django.db.models import F, Q, Case, When, Value, Count, Window
+from django.db.models.query import RawQuerySet
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _, gettext
 import random
+from robocat import data_version
+from . import tiebreakers
 
 # Create your models here.
 class Category(models.Model):
@@ -31,44 +34,184 @@ class Institution(models.Model):
     def __str__(self):
         return self.name
 
-class RankedTeamManager(models.Manager):
-    @staticmethod
-    def gen_qual_points_as_white():
-        from matches.models import Match
-        return Match.scored_objects.filter(white_team__id=OuterRef('id')).annotate(
-            qp=Sum(Coalesce('white_qualification_points', 0))
-        ).values('qp')
+def team_results_sql(team_ids=None, statuses=None):
+    """
+    SQL (and its params) aggregating the results of each team over its scored matches
+    (optionally, only those with one of the given statuses) as a single GROUP BY over
+    the union of the white and black sides. Selects `team_id`, `qualification_points`,
+    `total_score`, `matches_played`, `wins` and `draws`.
+    """
+    from matches.models import Match
+    from matches import scoring
+    matches = Match.scored_objects.filter(score__isnull=False)
+    if statuses is not None:
+        matches = matches.filter(status__in=statuses)
+    sides = []
+    for side in ('white', 'black'):
+        qualification_points = f'{side}_qualification_points'
+        results = matches.filter(**{f'{side}_team__isnull': False})
+        if team_ids is not None:
+            results = results.filter(**{f'{side}_team__in': team_ids})
+        sides.append(results.order_by().values(
+            team_id=F(f'{side}_team'),
+            qp=Coalesce(qualification_points, 0),
+            points=Coalesce(f'{side}_score', 0),
+            won=Case(When(**{qualification_points: scoring.WIN_POINTS}, then=Value(1)),
+                default=Value(0), output_field=models.IntegerField()),
+            drawn=Case(When(**{qualification_points: scoring.DRAW_POINTS}, then=Value(1)),
+                default=Value(0), output_field=models.IntegerField())
+        ))
+    sql, params = sides[0].union(sides[1], all=True).query.sql_with_params()
+    return (
+        'SELECT team_id, SUM(qp) AS qualification_points, SUM(points) AS total_score, '
+        'COUNT(*) AS matches_played, SUM(won) AS wins, SUM(drawn) AS draws '
+        f'FROM ({sql}) AS side_results GROUP BY team_id'
+    ), params
 
-    @staticmethod
-    def gen_qual_points_as_black():
-        from matches.models import Match
-        return Match.scored_objects.filter(black_team__id=OuterRef('id')).annotate(
-            qp=Sum(Coalesce('black_qualification_points', 0))
-        ).values('qp')
+# Teams without standings (nor tiebreak) go last in their tie group
+TIEBREAK_ORDER = F('tiebreak').asc(nulls_last=True)
 
-    @staticmethod
-    def gen_score_as_white():
-        from matches.models import Match
-        return Match.scored_objects.filter(white_team__id=OuterRef('id')).annotate(
-            s=Sum(Coalesce('white_score', 0))
-        ).values('s')
+# Order of the live rankings, as that of the stored ones (see `with_positions`). Teams
+# whose live results differ from their standings have no `tiebreak`, and are only
+# tie-broken by their total score.
+_LIVE_TIE_SQL = 'tiebreak IS NULL, tiebreak, CASE WHEN tiebreak IS NULL THEN total_score END'
+_LIVE_SCORE_ORDER_SQL = (
+    'qualification_points DESC, tiebreak IS NULL, tiebreak, '
+    'CASE WHEN tiebreak IS NULL THEN total_score END DESC'
+)
 
-    @staticmethod
-    def gen_score_as_black():
-        from matches.models import Match
-        return Match.scored_objects.filter(white_team__id=OuterRef('id')).annotate(
-            s=Sum(Coalesce('white_score', 0))
-        ).values('s')
+# Columns added by the window functions of the live rankings (see `with_positions`)
+POSITION_COLUMNS_SQL = (
+    f'RANK() OVER (ORDER BY {_LIVE_SCORE_ORDER_SQL}) AS position, '
+    f'RANK() OVER (PARTITION BY category_id ORDER BY {_LIVE_SCORE_ORDER_SQL}) AS category_position, '
+    f'COUNT(*) OVER (PARTITION BY category_id, qualification_points, {_LIVE_TIE_SQL}) - 1 AS tied_with, '
+    f'ROW_NUMBER() OVER (ORDER BY {_LIVE_SCORE_ORDER_SQL}, raffle) AS ranking_row'
+)
+
+def _row_order(ranking):
+    """
+    Order of a ranking as expressions, for window functions
+    """
+    return [
+        field if not isinstance(field, str)
+        else F(field[1:]).desc() if field.startswith('-') else F(field).asc()
+        for field in ranking.query.order_by
+    ]
+
+def with_positions(ranking):
+    """
+    Annotate a ranking (teams annotated with their `qualification_points` and
+    `tiebreak`, in ranking order) with window functions computed by the database:
+    `position` (shared by tied teams, as in 1, 1, 3), `category_position` (the same,
+    among the teams of the category), `tied_with` (number of other teams of the
+    category with the same position) and `ranking_row` (1-based number of the row in
+    the ranking order). Positions are taken after filtering, so those of a category
+    ranking are within it.
+    """
+    score_order = [F('qualification_points').desc(), TIEBREAK_ORDER]
+    return ranking.annotate(
+        position=Window(Rank(), order_by=score_order),
+        category_position=Window(Rank(), partition_by=[F('category')], order_by=score_order),
+        tied_with=Window(Count('pk'),
+            partition_by=[F('category'), F('qualification_points'), F('tiebreak')]) - 1,
+        ranking_row=Window(RowNumber(), order_by=_row_order(ranking)),
+    )
+
+def ranking_around(ranking, team_key, radius):
+    """
+    Teams of a ranking with positions (see `with_positions`; or a live ranking) at
+    most `radius` rows before or after the team with the given key, selected by the
+    database. Returns a RawQuerySet, empty if the team is not in the ranking.
+    """
+    if isinstance(ranking, RawQuerySet):
+        sql, params = ranking.raw_query, tuple(ranking.params)
+    else:
+        sql, params = ranking.query.sql_with_params()
+    key = connections[ranking.db].ops.quote_name('key')
+    return Team.objects.raw(
+        f'WITH ranked AS ({sql}) '
+        'SELECT * FROM ranked WHERE ranking_row BETWEEN '
+        f'(SELECT ranking_row - %s FROM ranked WHERE {key} = %s) AND '
+        f'(SELECT ranking_row + %s FROM ranked WHERE {key} = %s) '
+        'ORDER BY ranking_row',
+        (*params, radius, team_key, radius, team_key)
+    )
+
+def ranking_top(ranking, count, per_category=False):
+    """
+    First `count` teams of a ranking (in ranking order), or of each of its categories
+    (by category, then in ranking order), selected by the database, annotated with
+    their 1-based `ranking_row` (within their category, if `per_category`). Teams
+    tied at the cut are decided by the ranking order, as everywhere else. Returns a
+    RawQuerySet.
+    """
+    ranking = ranking.annotate(ranking_row=Window(RowNumber(),
+        partition_by=[F('category')] if per_category else None, order_by=_row_order(ranking)))
+    sql, params = ranking.query.sql_with_params()
+    order_by = 'category_id, ranking_row' if per_category else 'ranking_row'
+    return Team.objects.raw(
+        f'WITH ranked AS ({sql}) '
+        f'SELECT * FROM ranked WHERE ranking_row <= %s ORDER BY {order_by}',
+        (*params, count)
+    )
 
+class RankedTeamManager(models.Manager):
+    """
+    Teams annotated with their `qualification_points`, `total_score` and
+    `tiebreak` (see teams.tiebreakers), as stored on their standings
+    """
     def get_queryset(self):
         return (
             super().get_queryset()
-            .annotate(_qpaw=self.gen_qual_points_as_white(),
-                      _qpab=self.gen_qual_points_as_black(),
-                      _saw=self.gen_score_as_white(),
-                      _sab=self.gen_score_as_black())
-            .annotate(qualification_points=Coalesce('_qpaw', 0) + Coalesce('_qpab', 0),
-                total_score=Coalesce('_saw', 0) + Coalesce('_sab', 0))
+            .annotate(qualification_points=Coalesce('standing__qualification_points', 0),
+                total_score=Coalesce('standing__total_score', 0),
+                tiebreak=F('standing__tiebreak'))
+        )
+
+    def ranking(self, category=None):
+        """
+        Teams (of the given category, if any) ordered by their standings: by their
+        qualification points, then by the tie-breakers, then by the raffle
+        """
+        ranking = self.order_by('-qualification_points', TIEBREAK_ORDER, 'raffle')
+        if category is not None:
+            ranking = ranking.filter(category=category)
+        return ranking
+
+    def live_ranking(self, category=None, statuses=None, limit=None):
+        """
+        Like `ranking` with positions (see `with_positions`), but calculated from the
+        matches instead of from the standings, so only matches with one of the given
+        statuses may be taken into account. Teams are tie-broken by the tiebreaks of
+        their standings while their live results are the same, otherwise by their
+        total score. The category may also be given by its ID. Returns a RawQuerySet,
+        of the first `limit` teams if given.
+        """
+        results_sql, params = team_results_sql(statuses=statuses)
+        quote_name = connections[self.db].ops.quote_name
+        where = ''
+        if category is not None:
+            where = 'WHERE team.category_id = %s'
+            params = (*params, getattr(category, 'pk', category))
+        limit_sql = ''
+        if limit is not None:
+            limit_sql = 'LIMIT %s'
+            params = (*params, limit)
+        return self.raw(
+            f'SELECT ranking.*, {POSITION_COLUMNS_SQL} FROM ('
+            'SELECT team.*, '
+            'COALESCE(results.qualification_points, 0) AS qualification_points, '
+            'COALESCE(results.total_score, 0) AS total_score, '
+            'CASE WHEN standing.qualification_points = COALESCE(results.qualification_points, 0) '
+            'AND standing.total_score = COALESCE(results.total_score, 0) '
+            'THEN standing.tiebreak END AS tiebreak '
+            f'FROM {quote_name(self.model._meta.db_table)} AS team '
+            f'LEFT JOIN ({results_sql}) AS results ON results.team_id = team.id '
+            f'LEFT JOIN {quote_name(TeamStanding._meta.db_table)} AS standing '
+            'ON standing.team_id = team.id '
+            f'{where}'
+            f') AS ranking ORDER BY ranking_row {limit_sql}',
+            params
         )
 
 def gen_raffle_result():
@@ -78,6 +221,10 @@ class Team(models.Model):
     class Meta:
         verbose_name = _('team')
         verbose_name_plural = _('teams')
+        indexes = [
+            # Keyset pagination
+            models.Index(fields=('raffle', 'id'))
+        ]
 
     # Managers:
     ranked_objects = RankedTeamManager()
@@ -135,3 +282,389 @@ class TeamMembership(models.Model):
 
     def __str__(self):
         return gettext("%(user)s of team %(team)s") % { 'user': self.user, 'team': self.team }
+
+class TeamStandingManager(models.Manager):
+    def compute(self, team_ids=None):
+        """
+        Compute the standings of the given teams (or all teams, if None) from their
+        scored matches. Returns a dictionary of unsaved TeamStanding by team ID.
+        Teams without any scored match are included with zeroed standings.
+        """
+        if team_ids is None:
+            standings = { team_id: TeamStanding(team_id=team_id)
+                for team_id in Team.objects.values_list('id', flat=True) }
+            sql, params = team_results_sql()
+        else:
+            standings = { team_id: TeamStanding(team_id=team_id) for team_id in team_ids }
+            sql, params = team_results_sql(standings.keys())
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            for team_id, qualification_points, total_score, played, won, drawn in cursor:
+                standing = standings.get(team_id)
+                if standing is None:
+                    continue
+                standing.qualification_points = qualification_points
+                standing.total_score = total_score
+                standing.matches_played = played
+                standing.wins = won
+                standing.draws = drawn
+                standing.losses = played - won - drawn
+        return standings
+
+    def refresh(self, team_ids):
+        """
+        Recompute and store the standings of the given teams. The tiebreaks of the tie
+        groups are only recomputed for the teams whose results changed: those of the
+        groups they leave or join (and, if their qualification points changed, of the
+        groups of their opponents, whose strength of schedule changes). Should be
+        called inside the transaction that changed their results.
+        """
+        from matches.models import Match
+        team_ids = set(team_ids)
+        team_ids.discard(None)
+        if not team_ids:
+            return
+        with transaction.atomic(using=self.db):
+            previous = self.in_bulk(team_ids)
+            # Deleted teams are skipped by Team.objects
+            standings = self.compute(Team.objects.filter(id__in=team_ids).values_list('id', flat=True))
+            groups, moved_ids = set(), set()
+            for team_id, standing in standings.items():
+                old = previous.get(team_id)
+                if old is not None and old.results == standing.results:
+                    standing.tiebreak = old.tiebreak
+                    continue
+                groups.add(standing.qualification_points)
+                if old is None or old.qualification_points != standing.qualification_points:
+                    moved_ids.add(team_id)
+                if old is not None:
+                    groups.add(old.qualification_points)
+            # Deleted teams leave their groups
+            for team_id in previous.keys() - standings.keys():
+                groups.add(previous[team_id].qualification_points)
+                moved_ids.add(team_id)
+            self.filter(team_id__in=team_ids).delete()
+            self.bulk_create(standings.values())
+            if moved_ids and 'buchholz' in tiebreakers.get_tiebreakers():
+                opponents = (
+                    Match.objects.filter(Q(white_team__in=moved_ids) | Q(black_team__in=moved_ids))
+                    .values_list('white_team', 'black_team')
+                )
+                # Including the given teams whose own results did not change
+                opponent_ids = { team_id for match in opponents for team_id in match } - moved_ids - {None}
+                groups.update(Team.ranked_objects.filter(id__in=opponent_ids)
+                    .values_list('qualification_points', flat=True))
+            if groups:
+                self.refresh_tiebreaks(groups)
+
+    def rebuild(self):
+        """
+        Recompute and store the standings of all teams from scratch.
+        Returns the number of standings stored.
+        """
+        with transaction.atomic(using=self.db):
+            standings = self.compute()
+            self.all().delete()
+            self.bulk_create(standings.values())
+            self.refresh_tiebreaks()
+        return len(standings)
+
+    def refresh_tiebreaks(self, qualification_points=None):
+        """
+        Recompute and store the tiebreaks of the teams of the tie groups with the given
+        qualification points (or of all of them, if None). Only the tiebreaks that
+        changed are written. Teams without standings get zeroed ones.
+        """
+        tiebreaks = tiebreakers.compute_tiebreaks(qualification_points)
+        with transaction.atomic(using=self.db):
+            standings = []
+            current = self.filter(team_id__in=tiebreaks.keys()).values_list('team_id', 'tiebreak')
+            for team_id, tiebreak in current:
+                new_tiebreak = tiebreaks.pop(team_id)
+                if new_tiebreak != tiebreak:
+                    standings.append(TeamStanding(team_id=team_id, tiebreak=new_tiebreak))
+            self.bulk_update(standings, ['tiebreak'], batch_size=500)
+            # Teams without standings
+            self.bulk_create(TeamStanding(team_id=team_id, tiebreak=tiebreak)
+                for team_id, tiebreak in tiebreaks.items())
+
+class TeamStanding(models.Model):
+    """
+    Results of a team, derived from its scored matches. Kept up to date with
+    every change of a match or score (see `matches.signals.results_changed`),
+    and rebuilt with the `rebuild_standings` management command.
+    """
+    class Meta:
+        verbose_name = _('team standing')
+        verbose_name_plural = _('team standings')
+        indexes = [
+            models.Index(fields=('-qualification_points', '-total_score'))
+        ]
+
+    objects = TeamStandingManager()
+
+    team = models.OneToOneField(
+        Team,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='standing',
+        verbose_name=_('team')
+    )
+    qualification_points = models.IntegerField(default=0, verbose_name=_('qualification points'))
+    total_score = models.IntegerField(default=0, verbose_name=_('total score'))
+    matches_played = models.PositiveIntegerField(default=0, verbose_name=_('matches played'))
+    wins = models.PositiveIntegerField(default=0, verbose_name=_('wins'))
+    draws = models.PositiveIntegerField(default=0, verbose_name=_('draws'))
+    losses = models.PositiveIntegerField(default=0, verbose_name=_('losses'))
+    tiebreak = models.PositiveIntegerField(null=True, verbose_name=_('tiebreak'),
+        help_text=_("Rank of the team among those with the same qualification points, by the "
+            "tie-breakers"))
+
+    @property
+    def results(self):
+        """
+        Results the tiebreaks are computed from
+        """
+        return (self.qualification_points, self.total_score, self.matches_played, self.wins,
+            self.draws, self.losses)
+
+    def __str__(self):
+        return gettext("Standing of team %s") % (self.team,)
+
+class RankingSnapshotManager(models.Manager):
+    def current(self, category=None):
+        """
+        Get the snapshot the ranking of the given category (or the overall ranking,
+        if None) is frozen to, or None if it is not frozen.
+        """
+        return self.filter(category=category, frozen=True).order_by('-version').first()
+
+    def freeze(self, category=None):
+        """
+        Take a new snapshot of the ranking of the given category (or of the overall
+        ranking, if None) and freeze the ranking to it. Returns the new snapshot.
+        """
+        with transaction.atomic(using=self.db):
+            ranking = Team.ranked_objects.ranking()
+            if category is not None:
+                ranking = ranking.filter(category=category)
+            snapshot = self.create(category=category, frozen=True)
+            RankingSnapshotEntry.objects.bulk_create(
+                RankingSnapshotEntry(
+                    snapshot=snapshot,
+                    position=position,
+                    team_id=team['id'],
+                    qualification_points=team['qualification_points'],
+                    total_score=team['total_score'],
+                    tiebreak=team['tiebreak']
+                )
+                for position, team in enumerate(
+                    ranking.values('id', 'qualification_points', 'total_score', 'tiebreak'),
+                    start=1
+                )
+            )
+            self.filter(category=category, frozen=True).exclude(pk=snapshot.pk).update(frozen=False)
+        return snapshot
+
+    def unfreeze(self, category=None):
+        """
+        Unfreeze the ranking of the given category (or the overall ranking, if None),
+        so the live ranking is shown again. Returns whether it was frozen.
+        """
+        return self.filter(category=category, frozen=True).update(frozen=False) > 0
+
+class RankingSnapshot(models.Model):
+    """
+    Immutable copy of a ranking at a given time. While a snapshot is frozen, the
+    public ranking is served from it instead of the live standings.
+    """
+    class Meta:
+        verbose_name = _('ranking snapshot')
+        verbose_name_plural = _('ranking snapshots')
+        indexes = [
+            models.Index(fields=('category', 'frozen'))
+        ]
+
+    objects = RankingSnapshotManager()
+
+    version = models.AutoField(primary_key=True, verbose_name=_('version'))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('created at'))
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='ranking_snapshots',
+        verbose_name=_('category'),
+        help_text=_("Category of the ranking, or empty for the overall ranking")
+    )
+    # Only the manager may change this flag (see RankingSnapshotManager.freeze and unfreeze)
+    frozen = models.BooleanField(default=False, verbose_name=_('frozen'))
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ranking snapshots are immutable")
+        super().save(*args, **kwargs)
+
+    def ranking(self):
+        """
+        Teams in this snapshot, annotated with their `qualification_points`,
+        `total_score` and `tiebreak` at the time it was taken and ordered by their
+        position.
+        """
+        return (
+            Team.objects.filter(ranking_entries__snapshot=self)
+            .annotate(qualification_points=F('ranking_entries__qualification_points'),
+                total_score=F('ranking_entries__total_score'),
+                tiebreak=F('ranking_entries__tiebreak'))
+            .order_by('ranking_entries__position')
+        )
+
+    def __str__(self):
+        if self.category is None:
+            return gettext('Ranking snapshot %d') % (self.version,)
+        return gettext('Ranking snapshot %(version)d (%(category)s)') % {
+            'version': self.version, 'category': self.category }
+
+class RankingSnapshotEntry(models.Model):
+    class Meta:
+        verbose_name = _('ranking snapshot entry')
+        verbose_name_plural = _('ranking snapshot entries')
+        constraints = [
+            models.UniqueConstraint(fields=('snapshot', 'position'), name='unique_snapshot_position')
+        ]
+
+    snapshot = models.ForeignKey(
+        RankingSnapshot,
+        on_delete=models.CASCADE,
+        related_name='entries',
+        verbose_name=_('snapshot')
+    )
+    position = models.PositiveIntegerField(verbose_name=_('position'))
+    team = models.ForeignKey(
+        Team,
+        on_delete=models.CASCADE,
+        related_name='ranking_entries',
+        verbose_name=_('team')
+    )
+    qualification_points = models.IntegerField(verbose_name=_('qualification points'))
+    total_score = models.IntegerField(verbose_name=_('total score'))
+    tiebreak = models.PositiveIntegerField(null=True, verbose_name=_('tiebreak'))
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ranking snapshots are immutable")
+        super().save(*args, **kwargs)
+
+class FinalistManager(models.Manager):
+    def _scope(self, category=None):
+        # A selection for a category replaces the overall one too: finalists are either
+        # the first teams of the overall ranking or those of each category
+        if category is None:
+            return self.all()
+        return self.filter(Q(category=category) | Q(category__isnull=True))
+
+    def select(self, count, category=None, per_category=False, snapshot=None, overwrite=False):
+        """
+        Choose the first `count` teams of the ranking as the finalists, replacing the
+        previous selection: of the overall ranking, of each category (if
+        `per_category`) or of the given category only, keeping the finalists of the
+        other categories. The ranking is the live one, or that of the given snapshot.
+        Published finalists are only replaced if `overwrite`, otherwise ValueError is
+        raised. Returns the new finalists.
+        """
+        ranking = snapshot.ranking() if snapshot is not None else Team.ranked_objects.ranking()
+        if category is not None:
+            ranking = ranking.filter(category=category)
+        per_category = per_category or category is not None
+        with transaction.atomic(using=self.db):
+            replaced = self._scope(category)
+            if not overwrite and replaced.filter(published=True).exists():
+                raise ValueError('Published finalists are only replaced when overwriting them')
+            finalists = [
+                Finalist(
+                    team_id=team.id,
+                    category_id=team.category_id if per_category else None,
+                    position=team.ranking_row,
+                    qualification_points=team.qualification_points,
+                    total_score=team.total_score
+                )
+                for team in ranking_top(ranking, count, per_category)
+            ]
+            replaced.delete()
+            self.bulk_create(finalists)
+        data_version.bump(self.db)
+        return finalists
+
+    def drop(self, category=None):
+        """
+        Drop the finalists (of the given category, or all of them). Returns how many
+        were dropped.
+        """
+        finalists = self.filter(category=category) if category is not None else self.all()
+        count, _ = finalists.delete()
+        if count:
+            data_version.bump(self.db)
+        return count
+
+    def publish(self, published=True, category=None):
+        """
+        Publish (or unpublish) the finalists (of the given category, or all of them).
+        Returns how many were changed.
+        """
+        finalists = self.filter(category=category) if category is not None else self.all()
+        count = finalists.exclude(published=published).update(published=published)
+        if count:
+            data_version.bump(self.db)
+        return count
+
+    def public(self, category=None):
+        """
+        Published finalists (of the given category, if any), ordered by category and
+        position
+        """
+        finalists = self.filter(published=True)
+        if category is not None:
+            finalists = finalists.filter(category=category)
+        return finalists.order_by('category', 'position')
+
+class Finalist(models.Model):
+    """
+    Team chosen to play the finals, with its results at the time it was chosen.
+    Selected and published in bulk (see FinalistManager).
+    """
+    class Meta:
+        verbose_name = _('finalist')
+        verbose_name_plural = _('finalists')
+        indexes = [
+            # The public list
+            models.Index(fields=('published', 'category', 'position'))
+        ]
+
+    objects = FinalistManager()
+
+    team = models.OneToOneField(
+        Team,
+        on_delete=models.CASCADE,
+        related_name='finalist',
+        verbose_name=_('team')
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='finalists',
+        verbose_name=_('category'),
+        help_text=_("Category the team was chosen from, or empty if chosen from the overall ranking")
+    )
+    position = models.PositiveIntegerField(verbose_name=_('position'),
+        help_text=_("Position of the team in the ranking it was chosen from"))
+    qualification_points = models.IntegerField(verbose_name=_('qualification points'))
+    total_score = models.IntegerField(verbose_name=_('total score'))
+    published = models.BooleanField(default=False, verbose_name=_('published'))
+    selected_at = models.DateTimeField(auto_now_add=True, verbose_name=_('selected at'))
+
+    def __str__(self):
+        return gettext('Finalist %(position)d: %(team)s') % {
+            'position': self.position, 'team': self.team }
@@ -1,6 +1,13 @@
 import graphene
+from promise import Promise
 from graphene_django import DjangoObjectType
-from .models import Category, Team, Institution
+from robocat import data_version, events, response_cache
+from robocat.loaders import get_loaders
+from robocat.pagination import MAX_PAGE_SIZE, KeysetConnectionField
+from robocat.reference_data import CategoryRecord, TeamRecord, get_record, get_reference_data
+from matches.schema import MatchStatusEnum, ScoredMatchType
+from .models import (Category, Team, Institution, RankingSnapshot, Finalist, ranking_around,
+    with_positions)
 
 class CategoryType(DjangoObjectType):
     class Meta:
@@ -9,9 +16,26 @@ class CategoryType(DjangoObjectType):
 
     id = graphene.NonNull(graphene.ID)
 
+    @classmethod
+    def is_type_of(cls, root, info):
+        # Categories are usually served from the reference data
+        return isinstance(root, CategoryRecord) or super().is_type_of(root, info)
+
     def resolve_id(self, info, **kwargs):
         return self.key
 
+class TeamStatsType(graphene.ObjectType):
+    """
+    Results of a team over its scored matches
+    """
+    played = graphene.Int(required=True)
+    won = graphene.Int(required=True)
+    drawn = graphene.Int(required=True)
+    lost = graphene.Int(required=True)
+    points_for = graphene.Int(required=True)
+    points_against = graphene.Int(required=True)
+    average_score = graphene.Float(description='Average score per match, or null if none was played')
+
 class TeamType(DjangoObjectType):
     class Meta:
         model = Team
@@ -20,12 +44,42 @@ class TeamType(DjangoObjectType):
 
     id = graphene.NonNull(graphene.ID)
     institution_name = graphene.NonNull(graphene.String)
+    next_match = graphene.Field('schedules.schema.ScheduledMatchType',
+        description='Match being played by the team, or its next one, on the active schedule')
+    matches = graphene.List(graphene.NonNull(ScoredMatchType),
+        description='Matches of the team, on either side')
+    stats = graphene.NonNull(TeamStatsType)
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        # Teams are usually served from the reference data
+        return isinstance(root, TeamRecord) or super().is_type_of(root, info)
 
     def resolve_id(self, info, **kwargs):
         return self.key
 
     def resolve_institution_name(self, info, **kwargs):
-        return self.institution.name
+        institution = get_record(info, 'institution', self.institution_id)
+        if isinstance(institution, Promise):
+            return institution.then(lambda institution: institution.name)
+        return institution.name
+
+    def resolve_category(self, info, **kwargs):
+        return get_record(info, 'category', self.category_id)
+
+    def resolve_next_match(self, info, **kwargs):
+        # Changes with the time, not only with the data
+        response_cache.never_cache(info.context)
+        schedule = get_reference_data(info).active_schedule
+        if schedule is None:
+            return None
+        return get_loaders(info).next_match.load((schedule.id, self.id))
+
+    def resolve_matches(self, info, **kwargs):
+        return get_loaders(info).team_matches.load(self.id)
+
+    def resolve_stats(self, info, **kwargs):
+        return get_loaders(info).team_stats.load(self.id)
 
 class RankedTeamType(TeamType):
     class Meta:
@@ -34,6 +88,9 @@ class RankedTeamType(TeamType):
 
     qualification_points = graphene.Int()
     total_score = graphene.Int()
+    position = graphene.Int(description='Position in the ranking, shared by tied teams (as in 1, 1, 3)')
+    category_position = graphene.Int(description='Position among the teams of the same category')
+    tied_with = graphene.Int(description='Number of other teams of the same category with the same position')
 
     def resolve_qualification_points(self, info, **kwargs):
         return self.qualification_points
@@ -41,30 +98,257 @@ class RankedTeamType(TeamType):
     def resolve_total_score(self, info, **kwargs):
         return self.total_score
 
+    def resolve_position(self, info, **kwargs):
+        return self.position
+
+    def resolve_category_position(self, info, **kwargs):
+        return self.category_position
+
+    def resolve_tied_with(self, info, **kwargs):
+        return self.tied_with
+
+class RankingSnapshotType(DjangoObjectType):
+    class Meta:
+        model = RankingSnapshot
+        fields = ['version', 'created_at', 'category']
+
+class FinalistType(DjangoObjectType):
+    class Meta:
+        model = Finalist
+        fields = ['position', 'qualification_points', 'total_score', 'published', 'selected_at']
+
+    team = graphene.NonNull(TeamType)
+    category = graphene.Field(CategoryType,
+        description='Category the team was chosen from, or null if chosen from the overall ranking')
+
+    def resolve_team(self, info, **kwargs):
+        return get_record(info, 'team', self.team_id)
+
+    def resolve_category(self, info, **kwargs):
+        return get_record(info, 'category', self.category_id)
+
+def public_ranking(info, category=None, statuses=None, limit=None):
+    """
+    Ranking of the given category (or its ID; or the overall ranking), as shown to the current user:
+    staff users always see the live ranking, while everybody else sees the frozen snapshot,
+    if any. Only matches with the given statuses are counted, if any (not supported by
+    snapshots). Teams have their positions (see teams.models.with_positions), and only
+    the first `limit` are returned, if given.
+    """
+    if not info.context.user.is_staff:
+        snapshot = RankingSnapshot.objects.current(category)
+        if snapshot is None and category is not None:
+            # Do not leak the live ranking of a category while the overall ranking is frozen
+            snapshot = RankingSnapshot.objects.current()
+        if snapshot is not None:
+            ranking = snapshot.ranking()
+            if category is not None and snapshot.category_id is None:
+                ranking = ranking.filter(category=category)
+            return with_positions(ranking)[:limit]
+    if statuses:
+        return Team.ranked_objects.live_ranking(category, statuses, limit)
+    return with_positions(Team.ranked_objects.ranking(category))[:limit]
+
+class FreezeScoreboard(graphene.Mutation):
+    class Arguments:
+        category_id = graphene.String(required=False)
+
+    ok = graphene.Boolean(required=True)
+    snapshot = graphene.Field(RankingSnapshotType)
+
+    @staticmethod
+    def mutate(parent, info, category_id=None):
+        if not info.context.user.is_staff:
+            return FreezeScoreboard(ok=False)
+        category = None
+        if category_id is not None:
+            category = Category.objects.filter(key=category_id).first()
+            if category is None:
+                return FreezeScoreboard(ok=False)
+        snapshot = RankingSnapshot.objects.freeze(category)
+        return FreezeScoreboard(ok=True, snapshot=snapshot)
+
+class UnfreezeScoreboard(graphene.Mutation):
+    class Arguments:
+        category_id = graphene.String(required=False)
+
+    ok = graphene.Boolean(required=True)
+
+    @staticmethod
+    def mutate(parent, info, category_id=None):
+        if not info.context.user.is_staff:
+            return UnfreezeScoreboard(ok=False)
+        category = None
+        if category_id is not None:
+            category = Category.objects.filter(key=category_id).first()
+            if category is None:
+                return UnfreezeScoreboard(ok=False)
+        if RankingSnapshot.objects.unfreeze(category):
+            # Publish the live ranking, which was held back while frozen
+            events.notify('ranking')
+            data_version.bump()
+        return UnfreezeScoreboard(ok=True)
+
+class SelectFinalists(graphene.Mutation):
+    """
+    Choose the first `count` teams of the overall ranking, of each category (`perCategory`)
+    or of a single category as the finalists, replacing the previous selection. The live
+    ranking is used, or that of a snapshot, given its version. Fails if published finalists
+    would be replaced, unless `overwrite` is set. New finalists are not published.
+    """
+    class Arguments:
+        count = graphene.Int(required=True)
+        category_id = graphene.String(required=False)
+        per_category = graphene.Boolean(default_value=False)
+        snapshot_version = graphene.Int(required=False)
+        overwrite = graphene.Boolean(default_value=False,
+            description='Replace the finalists even if they are published')
+
+    ok = graphene.Boolean(required=True)
+    finalists = graphene.List(graphene.NonNull(FinalistType))
+
+    @staticmethod
+    def mutate(parent, info, count, per_category, overwrite, category_id=None, snapshot_version=None):
+        if not info.context.user.is_staff or count < 0:
+            return SelectFinalists(ok=False)
+        category = None
+        if category_id is not None:
+            category = Category.objects.filter(key=category_id).first()
+            if category is None:
+                return SelectFinalists(ok=False)
+        snapshot = None
+        if snapshot_version is not None:
+            snapshot = RankingSnapshot.objects.filter(version=snapshot_version).first()
+            if snapshot is None:
+                return SelectFinalists(ok=False)
+        try:
+            finalists = Finalist.objects.select(count, category, per_category, snapshot, overwrite)
+        except ValueError:
+            # Published finalists
+            return SelectFinalists(ok=False)
+        return SelectFinalists(ok=True, finalists=finalists)
+
+class DropFinalists(graphene.Mutation):
+    class Arguments:
+        category_id = graphene.String(required=False)
+
+    ok = graphene.Boolean(required=True)
+    count = graphene.Int()
+
+    @staticmethod
+    def mutate(parent, info, category_id=None):
+        if not info.context.user.is_staff:
+            return DropFinalists(ok=False)
+        category = None
+        if category_id is not None:
+            category = Category.objects.filter(key=category_id).first()
+            if category is None:
+                return DropFinalists(ok=False)
+        return DropFinalists(ok=True, count=Finalist.objects.drop(category))
+
+class PublishFinalists(graphene.Mutation):
+    class Arguments:
+        category_id = graphene.String(required=False)
+        published = graphene.Boolean(default_value=True)
+
+    ok = graphene.Boolean(required=True)
+    count = graphene.Int()
+
+    @staticmethod
+    def mutate(parent, info, published, category_id=None):
+        if not info.context.user.is_staff:
+            return PublishFinalists(ok=False)
+        category = None
+        if category_id is not None:
+            category = Category.objects.filter(key=category_id).first()
+            if category is None:
+                return PublishFinalists(ok=False)
+        return PublishFinalists(ok=True, count=Finalist.objects.publish(published, category))
+
+class Mutation:
+    freeze_scoreboard = FreezeScoreboard.Field()
+    unfreeze_scoreboard = UnfreezeScoreboard.Field()
+    select_finalists = SelectFinalists.Field()
+    drop_finalists = DropFinalists.Field()
+    publish_finalists = PublishFinalists.Field()
+
 class Query:
     all_categories = graphene.List(graphene.NonNull(CategoryType))
     category = graphene.Field(CategoryType, categoryId=graphene.String(required=True))
 
     all_teams = graphene.List(graphene.NonNull(TeamType))
+    teams_connection = KeysetConnectionField(TeamType, ordering=('raffle', 'id'))
     team = graphene.Field(TeamType, teamId=graphene.String(required=True))
 
-    ranking = graphene.List(RankedTeamType)
+    ranking = graphene.List(RankedTeamType,
+        category=graphene.ID(required=False),
+        status=graphene.List(graphene.NonNull(MatchStatusEnum), required=False),
+        first=graphene.Int(required=False),
+        description="Ranking of all the teams, or those of a category (or only its first "
+            "teams). If statuses are given, only the matches with those statuses are counted.")
+    ranking_around = graphene.List(RankedTeamType,
+        teamId=graphene.String(required=True),
+        radius=graphene.Int(default_value=2),
+        category=graphene.ID(required=False),
+        status=graphene.List(graphene.NonNull(MatchStatusEnum), required=False),
+        description="Slice of the ranking (as in `ranking`) around a team: the team and up to "
+            "`radius` teams before and after it. Empty if the team is not in the ranking.")
     ranked_team = graphene.Field(RankedTeamType, teamId=graphene.String(required=True))
+    frozen_scoreboard = graphene.Field(RankingSnapshotType, categoryId=graphene.String(required=False))
+    finalists = graphene.List(graphene.NonNull(FinalistType),
+        categoryId=graphene.String(required=False),
+        description='Published finalists (of a category, if given), by category and position. '
+            'Staff users also see the unpublished ones.')
 
     def resolve_all_categories(self, info, **kwargs):
-        return Category.objects.all()
+        return get_reference_data(info).categories
 
     def resolve_category(self, info, categoryId, **kwargs):
-        return Category.objects.filter(key=categoryId).first()
+        return get_reference_data(info).categories_by_key.get(categoryId)
 
     def resolve_all_teams(self, info, **kwargs):
+        return get_reference_data(info).teams
+
+    def resolve_teams_connection(self, info, **kwargs):
         return Team.objects.all()
 
     def resolve_team(self, info, teamId, **kwargs):
-        return Team.objects.filter(key=teamId).first()
+        return get_reference_data(info).teams_by_key.get(teamId)
+
+    def resolve_ranking(self, info, category=None, status=None, first=None, **kwargs):
+        if category is not None:
+            category = get_reference_data(info).categories_by_key.get(category)
+            if category is None:
+                return []
+            category = category.id
+        return public_ranking(info, category, status, max(first, 0) if first is not None else None)
+
+    def resolve_ranking_around(self, info, teamId, radius, category=None, status=None, **kwargs):
+        if category is not None:
+            category = get_reference_data(info).categories_by_key.get(category)
+            if category is None:
+                return []
+            category = category.id
+        radius = min(max(radius, 0), MAX_PAGE_SIZE)
+        return ranking_around(public_ranking(info, category, status), teamId, radius)
+
+    def resolve_ranked_team(self, info, teamId, **kwargs):
+        return next(iter(ranking_around(public_ranking(info), teamId, 0)), None)
 
-    def resolve_ranking(self, info, **kwargs):
-        return Team.ranked_objects.order_by('-qualification_points', '-total_score', 'raffle')
+    def resolve_frozen_scoreboard(self, info, categoryId=None, **kwargs):
+        if categoryId is None:
+            return RankingSnapshot.objects.current()
+        category = get_reference_data(info).categories_by_key.get(categoryId)
+        return RankingSnapshot.objects.current(category.id) if category is not None else None
 
-    def ranked_team(self, info, teamId, **kwargs):
-        return Team.ranked_objects.filter(key=teamId).first()
+    def resolve_finalists(self, info, categoryId=None, **kwargs):
+        category = None
+        if categoryId is not None:
+            category = get_reference_data(info).categories_by_key.get(categoryId)
+            if category is None:
+                return []
+            category = category.id
+        if info.context.user.is_staff:
+            finalists = Finalist.objects.order_by('category', 'position')
+            return finalists.filter(category=category) if category is not None else finalists
+        return Finalist.objects.public(category)
@@ -0,0 +1,33 @@
+from django.dispatch import receiver
+from matches.signals import results_changed
+from robocat import data_version, events, reference_data
+from .models import Category, Institution, Team, TeamStanding, RankingSnapshot
+
+data_version.track(Category, Institution, Team, RankingSnapshot)
+reference_data.track(Category, Institution, Team)
+
+@receiver(results_changed)
+def refresh_standings(sender, team_ids, **kwargs):
+    TeamStanding.objects.refresh(team_ids)
+    events.notify('ranking')
+
+_last_ranking = None
+
+@events.producer('ranking')
+def produce_ranking(ids):
+    global _last_ranking
+    if RankingSnapshot.objects.current() is not None:
+        # The public ranking is frozen
+        return None
+    # Nor are the rankings of the frozen categories
+    frozen_categories = RankingSnapshot.objects.filter(frozen=True, category__isnull=False).values('category')
+    ranking = list(
+        Team.ranked_objects.ranking().exclude(category__in=frozen_categories)
+        .values('key', 'name', 'category__key', 'qualification_points', 'total_score')
+    )
+    # Changes on the results do not always change the ranking (e.g. a match being edited
+    # twice), and the ranking is the most expensive event for the clients to process.
+    if ranking == _last_ranking:
+        return None
+    _last_ranking = ranking
+    return ranking
@@ -1,3 +1,620 @@
-from django.test import TestCase
+import io
+import json
+import re
+import tempfile
+import time
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from matches.models import Match
+from matches.tests import execute, make_score, make_teams
+from robocat import data_version, reference_data
+from robocat.synthetic import generate_tournament
+from schedules.models import Schedule
+from . import importing, signals, tiebreakers
+from .models import (Category, Institution, Team, TeamMembership, TeamStanding, RankingSnapshot,
+    Finalist)
 
-# Create your tests here.
+class TeamStandingTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(key='cat', name='Category', colour='red')
+        institution = Institution.objects.create(key='inst', name='Institution')
+        self.a, self.b, self.c = (
+            Team.objects.create(key=key, name=key, category=category, institution=institution)
+            for key in ('a', 'b', 'c')
+        )
+
+    def standing(self, team):
+        return TeamStanding.objects.get(team=team)
+
+    def test_score_save_updates_both_sides(self):
+        match = Match.objects.create(white_team=self.a, black_team=self.b)
+        make_score(match, cubes_on_upper_black=2)
+        a, b = self.standing(self.a), self.standing(self.b)
+        self.assertEqual((a.qualification_points, a.total_score, a.wins), (3, 20, 1))
+        self.assertEqual((b.qualification_points, b.total_score, b.losses), (0, 10, 1))
+        self.assertEqual(a.matches_played, 1)
+        self.assertEqual(b.matches_played, 1)
+
+    def test_score_delete_resets(self):
+        match = Match.objects.create(white_team=self.a, black_team=self.b)
+        make_score(match).delete()
+        self.assertEqual(self.standing(self.a).matches_played, 0)
+        self.assertEqual(self.standing(self.b).matches_played, 0)
+
+    def test_match_team_change_updates_previous_team(self):
+        match = Match.objects.create(white_team=self.a, black_team=self.b)
+        make_score(match)
+        self.assertEqual(self.standing(self.b).draws, 1)
+        match = Match.objects.get(pk=match.pk)
+        match.black_team = self.c
+        match.save()
+        self.assertEqual(self.standing(self.b).matches_played, 0)
+        self.assertEqual(self.standing(self.c).draws, 1)
+
+    def test_match_delete(self):
+        match = Match.objects.create(white_team=self.a, black_team=self.b)
+        make_score(match)
+        match.delete()
+        self.assertEqual(self.standing(self.a).matches_played, 0)
+
+    def test_rebuild_matches_incremental(self):
+        for white, black, upper in ((self.a, self.b, 1), (self.b, self.c, 0), (self.c, self.a, 3)):
+            make_score(Match.objects.create(white_team=white, black_team=black),
+                cubes_on_upper_black=upper)
+        incremental = list(TeamStanding.objects.order_by('team').values())
+        self.assertEqual(TeamStanding.objects.rebuild(), 3)
+        self.assertEqual(list(TeamStanding.objects.order_by('team').values()), incremental)
+
+    def test_unchanged_results(self):
+        score = make_score(Match.objects.create(white_team=self.a, black_team=self.b))
+        tiebreaks = list(TeamStanding.objects.order_by('team').values_list('team', 'tiebreak'))
+        with mock.patch.object(tiebreakers, 'compute_tiebreaks',
+                wraps=tiebreakers.compute_tiebreaks) as compute_tiebreaks:
+            # Saved again with the same results: the tie groups are kept
+            score.save()
+            compute_tiebreaks.assert_not_called()
+            self.assertEqual(list(TeamStanding.objects.order_by('team').values_list('team', 'tiebreak')),
+                tiebreaks)
+            score.cubes_on_upper_black = 1
+            score.save()
+            compute_tiebreaks.assert_called_once()
+        self.assertEqual(self.standing(self.a).wins, 1)
+
+    def test_ranking_order(self):
+        make_score(Match.objects.create(white_team=self.a, black_team=self.b), cubes_on_upper_white=1)
+        ranking = list(Team.ranked_objects.ranking())
+        self.assertEqual(ranking[0], self.b)
+        self.assertEqual(ranking[0].qualification_points, 3)
+        # Teams without standings are still ranked
+        self.assertEqual(ranking[-1].qualification_points, 0)
+
+class ScoreboardFreezeTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(key='cat', name='Category', colour='red')
+        institution = Institution.objects.create(key='inst', name='Institution')
+        self.a, self.b = (
+            Team.objects.create(key=key, name=key, category=category, institution=institution)
+            for key in ('a', 'b')
+        )
+        self.staff = User.objects.create(username='staff', is_staff=True)
+
+    def ranking(self, user=None):
+        return execute('{ ranking { id totalScore } }', user)['ranking']
+
+    def test_public_ranking_frozen(self):
+        make_score(Match.objects.create(white_team=self.a, black_team=self.b), cubes_on_upper_white=1)
+        execute('mutation { freezeScoreboard { ok } }', self.staff)
+        frozen = self.ranking()
+        make_score(Match.objects.create(white_team=self.a, black_team=self.b), cubes_on_upper_black=3)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.ranking(), frozen)
+        live = self.ranking(self.staff)
+        self.assertEqual(live[0], {'id': 'a', 'totalScore': 35})
+        execute('mutation { unfreezeScoreboard { ok } }', self.staff)
+        self.assertEqual(self.ranking(), live)
+
+    def test_frozen_category_events(self):
+        other = Category.objects.create(key='other', name='Other', colour='blue')
+        Team.objects.create(key='c', name='c', category=other, institution=self.a.institution)
+        RankingSnapshot.objects.freeze(other)
+        signals._last_ranking = None
+        ranking = signals.produce_ranking(set())
+        self.assertEqual(sorted(team['key'] for team in ranking), ['a', 'b'])
+
+    def test_versions(self):
+        first = RankingSnapshot.objects.freeze()
+        second = RankingSnapshot.objects.freeze()
+        self.assertGreater(second.version, first.version)
+        self.assertEqual(RankingSnapshot.objects.current(), second)
+        with self.assertRaises(ValueError):
+            second.save()
+
+    def test_freeze_requires_staff(self):
+        data = execute('mutation { freezeScoreboard { ok } }')
+        self.assertFalse(data['freezeScoreboard']['ok'])
+        self.assertIsNone(RankingSnapshot.objects.current())
+
+class LiveRankingTests(TestCase):
+    def test_matches_standings(self):
+        tournament = generate_tournament(30, categories=2, rounds=4, seed=1)
+        live = [(team.id, team.qualification_points, team.total_score)
+            for team in Team.ranked_objects.live_ranking()]
+        stored = list(Team.ranked_objects.ranking().values_list('id', 'qualification_points', 'total_score'))
+        self.assertEqual(live, stored)
+        category = tournament.categories[1]
+        self.assertEqual(
+            [team.id for team in Team.ranked_objects.live_ranking(category)],
+            [team.id for team in Team.ranked_objects.ranking(category)]
+        )
+
+    def test_filters(self):
+        a, b, c = make_teams(3, categories=2)
+        make_score(Match.objects.create(white_team=a, black_team=b, status=Match.Status.FINISHED),
+            cubes_on_upper_black=1)
+        make_score(Match.objects.create(white_team=c, black_team=b, status=Match.Status.SCORING),
+            cubes_on_upper_white=1)
+        ranking = execute('{ ranking(status: [FI]) { id qualificationPoints } }')['ranking']
+        self.assertEqual(ranking[:2], [{'id': a.key, 'qualificationPoints': 3},
+            {'id': b.key, 'qualificationPoints': 0}])
+        ranking = execute('query ($category: ID) { ranking(category: $category) { id } }',
+            category=b.category.key)['ranking']
+        self.assertEqual(ranking, [{'id': b.key}])
+
+class RankingPositionTests(TestCase):
+    FIELDS = 'id position categoryPosition tiedWith'
+
+    def setUp(self):
+        # team-3 won, team-0 and team-1 drew (tied), team-2 lost
+        teams = make_teams(4, categories=2)
+        make_score(Match.objects.create(white_team=teams[0], black_team=teams[1]))
+        make_score(Match.objects.create(white_team=teams[2], black_team=teams[3]), cubes_on_upper_white=1)
+        self.staff = User.objects.create(username='staff', is_staff=True)
+
+    def positions(self, ranking):
+        return { team['id']: (team['position'], team['categoryPosition'], team['tiedWith'])
+            for team in ranking }
+
+    def test_positions(self):
+        ranking = execute('{ ranking { %s } }' % self.FIELDS)['ranking']
+        self.assertEqual(ranking[0]['id'], 'team-3')
+        # team-0 and team-1 are tied, but not with a team of their category
+        expected = {'team-3': (1, 1, 0), 'team-0': (2, 1, 0), 'team-1': (2, 2, 0), 'team-2': (4, 2, 0)}
+        self.assertEqual(self.positions(ranking), expected)
+        live = execute('{ ranking(status: [NP]) { %s } }' % self.FIELDS)['ranking']
+        self.assertEqual(live, ranking)
+        # Positions within the category
+        ranking = execute('{ ranking(category: "cat-1") { %s } }' % self.FIELDS)['ranking']
+        self.assertEqual(self.positions(ranking), {'team-3': (1, 1, 0), 'team-1': (2, 2, 0)})
+
+    def test_first(self):
+        ranking = execute('{ ranking { id } }')['ranking']
+        self.assertEqual(execute('{ ranking(first: 2) { id } }')['ranking'], ranking[:2])
+        self.assertEqual(execute('{ ranking(first: 2, status: [NP]) { id } }')['ranking'], ranking[:2])
+        self.assertEqual(execute('{ ranking(first: 0) { id } }')['ranking'], [])
+
+    def test_around(self):
+        ranking = execute('{ ranking { %s } }' % self.FIELDS)['ranking']
+        query = 'query ($team: String!, $radius: Int) { rankingAround(teamId: $team, radius: $radius) { %s } }'
+        around = lambda team, radius, user=None: execute(query % self.FIELDS, user, team=team,
+            radius=radius)['rankingAround']
+        self.assertEqual(around('team-2', 1), ranking[2:])
+        self.assertEqual(around(ranking[1]['id'], 1), ranking[:3])
+        self.assertEqual(around('team-3', 10), ranking)
+        self.assertEqual(around('unknown', 1), [])
+        data = execute('{ rankedTeam(teamId: "team-1") { %s } }' % self.FIELDS)
+        self.assertEqual(self.positions([data['rankedTeam']]), {'team-1': (2, 2, 0)})
+
+        # From the frozen snapshot
+        execute('mutation { freezeScoreboard { ok } }', self.staff)
+        make_score(Match.objects.create(white_team=Team.objects.get(key='team-2'),
+            black_team=Team.objects.get(key='team-0')), cubes_on_upper_white=1)
+        self.assertEqual(around('team-2', 1), ranking[2:])
+        self.assertNotEqual(around('team-2', 1, self.staff), ranking[2:])
+
+class TiebreakerTests(TestCase):
+    def test_results(self):
+        # 1 beat 2, 2 beat 3 and 3 beat 4: 1, 2 and 3 are tied
+        teams = [(1, 3, 10, 1), (2, 3, 20, 1), (3, 3, 10, 1), (4, 0, 5, 0)]
+        matches = [(2, 1, 0, 3), (3, 2, 0, 3), (4, 3, 0, 3)]
+        results = tiebreakers.TieGroupResults(teams, matches, {1: 3, 2: 3, 3: 3, 4: 0})
+        self.assertEqual([results.head_to_head(i) for i in (1, 2, 3)], [3, 3, 0])
+        self.assertEqual([results.buchholz(i) for i in (1, 2, 3)], [3, 6, 3])
+        self.assertEqual(results.tiebreaks(['head_to_head', 'buchholz']), {1: 2, 2: 1, 3: 3, 4: 1})
+        self.assertEqual(results.tiebreaks(['total_score']), {1: 2, 2: 1, 3: 2, 4: 1})
+        self.assertEqual(results.tiebreaks(['wins']), {1: 1, 2: 1, 3: 1, 4: 1})
+
+    def ranking(self, status=None):
+        query = 'query ($status: [MatchStatus!]) { ranking(status: $status) { id position tiedWith } }'
+        return [(team['id'], team['position'], team['tiedWith'])
+            for team in execute(query, status=status)['ranking']]
+
+    def stored_tiebreaks(self):
+        return dict(TeamStanding.objects.values_list('team', 'tiebreak'))
+
+    @override_settings(RANKING={'TIEBREAKERS': ['head_to_head', 'buchholz']})
+    def test_ranking(self):
+        teams = make_teams(4)
+        # team-0 beat team-1, team-1 beat team-2 and team-2 beat team-3
+        for winner, loser in ((0, 1), (1, 2), (2, 3)):
+            make_score(Match.objects.create(white_team=teams[loser], black_team=teams[winner]),
+                cubes_on_upper_white=1)
+        self.assertEqual(self.ranking(), [('team-1', 1, 0), ('team-0', 2, 0), ('team-2', 3, 0),
+            ('team-3', 4, 0)])
+        # The live ranking is tie-broken the same way
+        self.assertEqual(self.ranking(['NP']), self.ranking())
+        # Kept up to date by the score saves, also for the opponents
+        tiebreaks = self.stored_tiebreaks()
+        TeamStanding.objects.rebuild()
+        self.assertEqual(self.stored_tiebreaks(), tiebreaks)
+
+        with override_settings(RANKING={'TIEBREAKERS': ['wins']}):
+            TeamStanding.objects.rebuild()
+            # Then by raffle
+            self.assertEqual(sorted(self.ranking()), [('team-0', 1, 2), ('team-1', 1, 2),
+                ('team-2', 1, 2), ('team-3', 4, 0)])
+
+    @override_settings(RANKING={'TIEBREAKERS': ['buchholz']})
+    def test_group(self):
+        teams = make_teams(4)
+        # team-0 beat team-1 and team-2, team-3 beat team-2: team-1 and team-2 are tied
+        for winner, loser in ((0, 1), (0, 2), (3, 2)):
+            make_score(Match.objects.create(white_team=teams[loser], black_team=teams[winner]),
+                cubes_on_upper_white=1)
+        points = TeamStanding.objects.get(team=teams[1]).qualification_points
+        # The teams of the group, their matches and the points of their opponents
+        with self.assertNumQueries(3), CaptureQueriesContext(connection) as queries:
+            tiebreaks = tiebreakers.compute_tiebreaks([points])
+        self.assertEqual(tiebreaks, {teams[1].id: 2, teams[2].id: 1})
+        # Only the opponents outside of the group
+        opponent_ids = re.search(r'IN \(([^)]*)\)', queries[2]['sql']).group(1).split(', ')
+        self.assertEqual(set(opponent_ids), {str(teams[0].id), str(teams[3].id)})
+
+    @override_settings(RANKING={'TIEBREAKERS': ['coin_toss']})
+    def test_unknown(self):
+        make_teams(2)
+        with self.assertRaises(ImproperlyConfigured):
+            TeamStanding.objects.rebuild()
+
+class FinalistTests(TestCase):
+    SELECT = '''mutation ($count: Int!, $category: String, $perCategory: Boolean, $snapshot: Int,
+            $overwrite: Boolean) {
+        selectFinalists(count: $count, categoryId: $category, perCategory: $perCategory,
+                snapshotVersion: $snapshot, overwrite: $overwrite) {
+            ok
+            finalists { team { id } position }
+        }
+    }'''
+    QUERY = '{ finalists { team { id } category { id } position published } }'
+
+    def setUp(self):
+        self.tournament = generate_tournament(12, categories=2, rounds=3, seed=1)
+        self.staff = User.objects.create(username='staff', is_staff=True)
+
+    def select(self, count, user=None, **variables):
+        return execute(self.SELECT, user or self.staff, count=count, **variables)['selectFinalists']
+
+    def keys(self, ranking, count):
+        return [team.key for team in ranking[:count]]
+
+    def finalists(self):
+        return { (finalist.team.key, finalist.category.key if finalist.category else None)
+            for finalist in Finalist.objects.all() }
+
+    def test_overall(self):
+        selection = self.select(3)
+        self.assertTrue(selection['ok'])
+        self.assertEqual([finalist['team']['id'] for finalist in selection['finalists']],
+            self.keys(Team.ranked_objects.ranking(), 3))
+        self.assertEqual([finalist['position'] for finalist in selection['finalists']], [1, 2, 3])
+        # Not public until published
+        self.assertEqual(execute(self.QUERY)['finalists'], [])
+        self.assertEqual(len(execute(self.QUERY, self.staff)['finalists']), 3)
+        data = execute('mutation { publishFinalists { ok count } }', self.staff)
+        self.assertEqual(data['publishFinalists'], {'ok': True, 'count': 3})
+        # The reference data (loaded on each request within the test transaction) and the finalists
+        with self.assertNumQueries(5):
+            finalists = execute(self.QUERY)['finalists']
+        self.assertEqual([(finalist['team']['id'], finalist['category'], finalist['published'])
+            for finalist in finalists], [(key, None, True) for key in self.keys(Team.ranked_objects.ranking(), 3)])
+
+    def test_per_category(self):
+        first, second = self.tournament.categories
+        self.assertTrue(self.select(2, perCategory=True)['ok'])
+        expected = {
+            (key, category.key) for category in (first, second)
+            for key in self.keys(Team.ranked_objects.ranking(category), 2)
+        }
+        self.assertEqual(self.finalists(), expected)
+        # A single category is replaced, the other one is kept
+        self.select(1, category=first.key)
+        self.assertEqual(self.finalists(), {
+            *((key, first.key) for key in self.keys(Team.ranked_objects.ranking(first), 1)),
+            *((key, second.key) for key in self.keys(Team.ranked_objects.ranking(second), 2))
+        })
+        data = execute('mutation { dropFinalists(categoryId: "%s") { ok count } }' % second.key,
+            self.staff)
+        self.assertEqual(data['dropFinalists'], {'ok': True, 'count': 2})
+        # The overall selection replaces all of them
+        self.select(4)
+        self.assertEqual(self.finalists(),
+            {(key, None) for key in self.keys(Team.ranked_objects.ranking(), 4)})
+
+    def test_from_snapshot(self):
+        execute('mutation { freezeScoreboard { ok } }', self.staff)
+        snapshot = RankingSnapshot.objects.current()
+        expected = self.keys(snapshot.ranking(), 5)
+        # Results changed after freezing
+        loser, winner = Team.ranked_objects.ranking()[:2]
+        for _ in range(3):
+            make_score(Match.objects.create(white_team=loser, black_team=winner),
+                cubes_on_upper_white=1)
+        selection = self.select(5, snapshot=snapshot.version)
+        self.assertEqual([finalist['team']['id'] for finalist in selection['finalists']], expected)
+        self.assertFalse(self.select(5, snapshot=snapshot.version + 1)['ok'])
+
+    def test_published(self):
+        first, second = self.tournament.categories
+        self.select(2, perCategory=True)
+        execute('mutation { publishFinalists(categoryId: "%s") { ok } }' % first.key, self.staff)
+        finalists = self.finalists()
+        # Published finalists are kept, unless overwritten
+        self.assertFalse(self.select(4)['ok'])
+        self.assertFalse(self.select(1, category=first.key)['ok'])
+        self.assertEqual(self.finalists(), finalists)
+        # Those of the other categories may still be replaced
+        self.assertTrue(self.select(1, category=second.key)['ok'])
+        self.assertEqual(Finalist.objects.filter(category=second).count(), 1)
+        self.assertTrue(self.select(4, overwrite=True)['ok'])
+        self.assertEqual(self.finalists(),
+            {(key, None) for key in self.keys(Team.ranked_objects.ranking(), 4)})
+        self.assertFalse(Finalist.objects.filter(published=True).exists())
+
+    def test_requires_staff(self):
+        self.assertFalse(self.select(3, User.objects.create(username='user'))['ok'])
+        self.assertFalse(self.select(-1)['ok'])
+        self.assertFalse(self.select(3, category='unknown')['ok'])
+        self.assertFalse(execute('mutation { publishFinalists { ok } }')['publishFinalists']['ok'])
+        self.assertFalse(execute('mutation { dropFinalists { ok } }')['dropFinalists']['ok'])
+        self.assertFalse(Finalist.objects.exists())
+
+class TeamMatchesTests(TestCase):
+    QUERY = '''{
+        allTeams {
+            id
+            matches { id whiteScore blackScore }
+            stats { played won drawn lost pointsFor pointsAgainst averageScore }
+        }
+    }'''
+
+    def test_matches_and_stats(self):
+        a, b, c = make_teams(3)
+        make_score(Match.objects.create(white_team=a, black_team=b))
+        make_score(Match.objects.create(white_team=b, black_team=c), cubes_on_upper_white=1)
+        make_score(Match.objects.create(white_team=c))
+        unscored = Match.objects.create(white_team=a, black_team=c)
+        # The reference data (loaded on each request within the test transaction), the
+        # matches and the stats
+        with self.assertNumQueries(6):
+            teams = { team['id']: team for team in execute(self.QUERY)['allTeams'] }
+        self.assertEqual(len(teams[a.key]['matches']), 2)
+        self.assertIn({'id': str(unscored.id), 'whiteScore': None, 'blackScore': None},
+            teams[a.key]['matches'])
+        self.assertEqual(len(teams[c.key]['matches']), 3)
+
+        for team in (a, b, c):
+            standing = TeamStanding.objects.get(team=team)
+            stats = teams[team.key]['stats']
+            self.assertEqual(
+                (stats['played'], stats['won'], stats['drawn'], stats['lost'], stats['pointsFor']),
+                (standing.matches_played, standing.wins, standing.draws, standing.losses,
+                    standing.total_score))
+        points = { (match.white_team_id, match.black_team_id): (match.white_score, match.black_score)
+            for match in Match.scored_objects.filter(score__isnull=False) }
+        self.assertEqual(teams[b.key]['stats']['pointsAgainst'],
+            points[a.id, b.id][0] + points[b.id, c.id][1])
+        self.assertEqual(teams[b.key]['stats']['averageScore'],
+            (points[a.id, b.id][1] + points[b.id, c.id][0]) / 2)
+
+    def test_no_matches(self):
+        make_teams(1)
+        team, = execute(self.QUERY)['allTeams']
+        self.assertEqual(team['matches'], [])
+        self.assertEqual(team['stats'], {'played': 0, 'won': 0, 'drawn': 0, 'lost': 0,
+            'pointsFor': 0, 'pointsAgainst': 0, 'averageScore': None})
+
+class TeamsConnectionTests(TestCase):
+    QUERY = '''query ($after: String) {
+        teamsConnection(first: 4, after: $after) {
+            edges { cursor node { id } }
+            pageInfo { hasNextPage endCursor }
+        }
+    }'''
+
+    def test_pages(self):
+        teams = make_teams(10)
+        seen, after = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = execute(self.QUERY, after=after)['teamsConnection']
+            seen += [edge['node']['id'] for edge in page['edges']]
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        self.assertEqual(seen, [team.key for team in sorted(teams, key=lambda team: (team.raffle, team.id))])
+
+    def test_invalid_cursor(self):
+        with self.assertRaisesMessage(Exception, 'Invalid cursor'):
+            execute(self.QUERY, after='garbage')
+
+class ReferenceDataTests(TransactionTestCase):
+    QUERY = '''{
+        allTeams { id name institutionName category { id name } }
+        allCategories { id }
+        team(teamId: "team-0") { name }
+        category(categoryId: "cat-0") { name }
+        schedule { active }
+    }'''
+
+    def setUp(self):
+        # The database is flushed between tests without any signal
+        reference_data.invalidate()
+
+    def test_steady_state(self):
+        make_teams(4, categories=2, institutions=2)
+        Schedule.objects.create(active=True)
+        execute(self.QUERY)
+        with self.assertNumQueries(0):
+            data = execute(self.QUERY)
+        self.assertEqual([team['id'] for team in data['allTeams']], ['team-0', 'team-1', 'team-2', 'team-3'])
+        self.assertEqual(data['allTeams'][1], {'id': 'team-1', 'name': 'Team 1',
+            'institutionName': 'Institution 1', 'category': {'id': 'cat-1', 'name': 'Category 1'}})
+        self.assertEqual(data['team'], {'name': 'Team 0'})
+        self.assertEqual(data['schedule'], {'active': True})
+
+    def test_invalidation(self):
+        team, = make_teams(1)
+        execute(self.QUERY)
+        team.name = 'Renamed'
+        team.save()
+        self.assertEqual(execute(self.QUERY)['team'], {'name': 'Renamed'})
+        Category.objects.update(name='Updated')
+        # Updates bypass the signals, and are only seen once the version is bumped
+        # (e.g. by another process)
+        self.assertEqual(execute(self.QUERY)['category'], {'name': 'Category 0'})
+        reference_data.version.bump()
+        self.assertEqual(execute(self.QUERY)['category'], {'name': 'Updated'})
+        schedule = Schedule.objects.create(active=True)
+        self.assertEqual(execute(self.QUERY)['schedule'], {'active': True})
+        schedule.delete()
+        self.assertIsNone(execute(self.QUERY)['schedule'])
+
+    def test_newer_than_read_model(self):
+        make_teams(1)
+        execute(self.QUERY)
+        # Created by another process, which has not bumped the version yet
+        Category.objects.bulk_create([Category(key='new', name='New', colour='blue')])
+        Institution.objects.bulk_create([Institution(key='new', name='New')])
+        Team.objects.bulk_create([Team(key='new', name='New', category=Category.objects.get(key='new'),
+            institution=Institution.objects.get(key='new'))])
+        Match.objects.create(white_team=Team.objects.get(key='new'))
+        data = execute('{ allMatches { whiteTeam { id institutionName category { id } } } }')
+        self.assertEqual(data['allMatches'], [{'whiteTeam': {'id': 'new', 'institutionName': 'New',
+            'category': {'id': 'new'}}}])
+
+    def test_shared_versions(self):
+        self.assertEqual(data_version.get_cache().get(data_version.CACHE_KEY), data_version.get_version())
+        self.assertEqual(data_version.check_shared_cache(None), [])
+        local = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with override_settings(CACHES={'default': local}):
+            warning, = data_version.check_shared_cache(None)
+        self.assertEqual(warning.id, 'robocat.W001')
+
+    def test_transactions(self):
+        make_teams(1)
+        execute(self.QUERY)
+        with transaction.atomic():
+            Team.objects.update(name='Uncommitted')
+            self.assertEqual(execute(self.QUERY)['team'], {'name': 'Uncommitted'})
+            transaction.set_rollback(True)
+        # Not shared while uncommitted
+        self.assertEqual(execute(self.QUERY)['team'], {'name': 'Team 0'})
+
+class ImportTests(TestCase):
+    CSV = (
+        'type,key,name,colour,category,institution,username,team\n'
+        'category,sumo,Sumo,red,,,,\n'
+        'institution,school,School,,,,,\n'
+        'team,bots,Bots,,sumo,school,,\n'
+        'member,,,,,,alice,bots\n'
+    )
+
+    def test_import(self):
+        User.objects.create(username='alice')
+        report = importing.import_stream(io.StringIO(self.CSV), 'csv')
+        self.assertTrue(report.ok)
+        self.assertEqual(report.records, 4)
+        self.assertEqual(report.created, {'category': 1, 'institution': 1, 'team': 1, 'user': 0, 'member': 1})
+        team = Team.objects.get(key='bots')
+        self.assertEqual((team.name, team.category.key, team.institution.key), ('Bots', 'sumo', 'school'))
+        self.assertEqual(team.members.get().user.username, 'alice')
+
+        records = [
+            {'type': 'team', 'key': 'bots', 'name': 'Renamed', 'category': 'sumo', 'institution': 'school'},
+            {'type': 'team', 'key': 'droids', 'name': 'Droids', 'category': 'sumo', 'institution': 'school'},
+            {'type': 'member', 'username': 'alice', 'team': 'droids'},
+            {'type': 'member', 'username': 'bob', 'team': 'droids'},
+        ]
+        report = importing.import_stream(io.StringIO(''.join(json.dumps(record) + '\n' for record in records)),
+            'jsonl')
+        self.assertTrue(report.ok)
+        self.assertEqual(report.updated['team'], 1)
+        self.assertEqual(Team.objects.get(key='bots').name, 'Renamed')
+        # Members moved, and new users created without password
+        self.assertEqual(sorted(TeamMembership.objects.filter(team__key='droids')
+            .values_list('user__username', flat=True)), ['alice', 'bob'])
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+
+    def test_invalid_records(self):
+        records = [
+            '{"type": "category", "key": "sumo", "name": "Sumo", "colour": "red"}',
+            '{"type": "team", "key": "not a slug", "name": "Bots", "category": "sumo", "institution": "x"}',
+            'garbage',
+            '{"type": "robot"}',
+            '{"type": "category", "key": "sumo", "name": "Sumo", "colour": "red"}',
+            '{"type": "member", "team": "sumo"}',
+        ]
+        for dry_run in (True, False):
+            report = importing.import_stream(io.StringIO('\n'.join(records)), 'jsonl', dry_run)
+            self.assertFalse(report.ok)
+            self.assertEqual(sorted((error.line, error.field) for error in report.errors), [
+                (2, 'institution'), (3, None), (4, 'type'), (5, 'key'), (6, 'username')])
+            self.assertFalse(Category.objects.exists())
+        report = importing.import_stream(io.StringIO(records[0]), 'jsonl', dry_run=True)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.created['category'], 1)
+        self.assertFalse(Category.objects.exists())
+
+    def test_large_import(self):
+        def records():
+            yield {'type': 'category', 'key': 'sumo', 'name': 'Sumo', 'colour': 'red'}
+            for i in range(20):
+                yield {'type': 'institution', 'key': f'school-{i}', 'name': f'School {i}'}
+            for i in range(2000):
+                yield {'type': 'team', 'key': f'team-{i}', 'name': f'Team {i}', 'category': 'sumo',
+                    'institution': f'school-{i % 20}'}
+        stream = (json.dumps(record) + '\n' for record in records())
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            report = importing.import_stream(stream, 'jsonl')
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertTrue(report.ok)
+        self.assertEqual(Team.objects.count(), 2000)
+        # A fixed number of queries per chunk
+        self.assertLess(len(queries), 100)
+
+    def test_endpoint(self):
+        url = reverse('import')
+        self.assertEqual(self.client.post(url, self.CSV, content_type='text/csv').status_code, 403)
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        response = self.client.post(url + '?dry_run=1', self.CSV, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created']['team'], 1)
+        self.assertFalse(Team.objects.exists())
+        response = self.client.post(url, self.CSV, content_type='text/csv')
+        self.assertEqual(response.json()['created']['user'], 1)
+        self.assertTrue(Team.objects.filter(key='bots').exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write(self.CSV)
+            file.flush()
+            call_command('import_teams', file.name, '--dry-run', stdout=io.StringIO())
+            self.assertFalse(Team.objects.exists())
+            call_command('import_teams', file.name, stdout=io.StringIO())
+            self.assertTrue(Team.objects.filter(key='bots').exists())
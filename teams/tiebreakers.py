@@ -0,0 +1,136 @@
+"""
+Tie-breakers of the ranking: how teams with the same qualification points are
+ordered, before resorting to the raffle.
+
+The tie-breakers are applied in the order configured, each one only deciding
+between the teams still tied by the previous ones:
+
+- `total_score`: total score of the team.
+- `head_to_head`: qualification points won by the team in its matches against
+  the other teams of its tie group.
+- `buchholz`: sum of the qualification points of all the opponents of the
+  team (its strength of schedule).
+- `wins`: number of matches won by the team.
+
+They are computed in memory for whole tie groups (teams with the same
+qualification points), loading the standings of their teams and the results
+of their matches once, and stored on the standings as the `tiebreak` of each
+team (its dense rank within its group: teams still tied share it), which the
+ranking is ordered by (see RankedTeamManager.ranking). Standings keep them up
+to date (see TeamStandingManager.refresh); after changing the configuration,
+run the `rebuild_standings` command.
+
+Configured with `settings.RANKING` (see DEFAULTS).
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+DEFAULTS = {
+    'TIEBREAKERS': ['total_score'],
+}
+
+TIEBREAKERS = ('total_score', 'head_to_head', 'buchholz', 'wins')
+
+def get_config():
+    return { **DEFAULTS, **getattr(settings, 'RANKING', {}) }
+
+def get_tiebreakers():
+    tiebreakers = get_config()['TIEBREAKERS']
+    for name in tiebreakers:
+        if name not in TIEBREAKERS:
+            raise ImproperlyConfigured(f'Unknown ranking tie-breaker: {name}')
+    return tiebreakers
+
+class TieGroupResults:
+    """
+    Results of the teams of some tie groups: their standings and the result graph
+    of their scored matches
+    """
+    def __init__(self, teams, matches, points):
+        """
+        `teams` are (team ID, qualification points, total score, wins) of the teams
+        of the groups, `matches` (white team ID, black team ID, white qualification
+        points, black qualification points) of their scored matches, and `points`
+        the qualification points of the teams and their opponents by ID.
+        """
+        self.groups = defaultdict(list)
+        self.total_scores = {}
+        self.win_counts = {}
+        group_of = {}
+        for team_id, qualification_points, total_score, wins in teams:
+            self.groups[qualification_points].append(team_id)
+            group_of[team_id] = qualification_points
+            self.total_scores[team_id] = total_score
+            self.win_counts[team_id] = wins
+        self.head_to_head_points = defaultdict(int)
+        self.opponent_points = defaultdict(int)
+        for white_id, black_id, white_points, black_points in matches:
+            for team_id, opponent_id, team_points in (
+                    (white_id, black_id, white_points), (black_id, white_id, black_points)):
+                if team_id not in group_of or opponent_id is None:
+                    continue
+                self.opponent_points[team_id] += points.get(opponent_id, 0)
+                if group_of.get(opponent_id) == group_of[team_id]:
+                    self.head_to_head_points[team_id] += team_points or 0
+
+    def total_score(self, team_id):
+        return self.total_scores[team_id]
+
+    def head_to_head(self, team_id):
+        return self.head_to_head_points[team_id]
+
+    def buchholz(self, team_id):
+        return self.opponent_points[team_id]
+
+    def wins(self, team_id):
+        return self.win_counts[team_id]
+
+    def tiebreaks(self, tiebreakers):
+        """
+        Tiebreak of each team of the groups, by ID
+        """
+        methods = [getattr(self, name) for name in tiebreakers]
+        tiebreaks = {}
+        for team_ids in self.groups.values():
+            keys = { team_id: tuple(method(team_id) for method in methods) for team_id in team_ids }
+            ordered = sorted(set(keys.values()), reverse=True)
+            rank = { key: tiebreak for tiebreak, key in enumerate(ordered, 1) }
+            for team_id, key in keys.items():
+                tiebreaks[team_id] = rank[key]
+        return tiebreaks
+
+def compute_tiebreaks(qualification_points=None):
+    """
+    Compute the tiebreaks of the teams of the groups with the given qualification
+    points (or of all the groups, if None) from their standings. Returns a
+    dictionary of tiebreaks by team ID.
+    """
+    from matches.models import Match
+    from .models import Team
+    tiebreakers = get_tiebreakers()
+    teams = Team.ranked_objects.order_by()
+    if qualification_points is not None:
+        teams = teams.filter(qualification_points__in=list(qualification_points))
+    team_rows = list(teams.values_list('id', 'qualification_points', 'total_score',
+        'standing__wins'))
+    matches, points = [], {}
+    if 'head_to_head' in tiebreakers or 'buchholz' in tiebreakers:
+        team_ids = teams.values('id')
+        matches = list(
+            Match.scored_objects.for_teams(team_ids).filter(score__isnull=False).order_by()
+            .values_list('white_team', 'black_team', 'white_qualification_points',
+                'black_qualification_points')
+        )
+        if 'buchholz' in tiebreakers:
+            # Only the points of the opponents outside of the groups are missing
+            points = { team_id: qualification_points
+                for team_id, qualification_points, _, _ in team_rows }
+            opponent_ids = { team_id for white_id, black_id, _, _ in matches
+                for team_id in (white_id, black_id) if team_id is not None } - points.keys()
+            if opponent_ids:
+                points.update(Team.ranked_objects.filter(id__in=opponent_ids).order_by()
+                    .values_list('id', 'qualification_points'))
+    teams = ((team_id, qualification_points, total_score, wins or 0)
+        for team_id, qualification_points, total_score, wins in team_rows)
+    return TieGroupResults(teams, matches, points).tiebreaks(tiebreakers)
@@ -1,3 +1,31 @@
-from django.shortcuts import render
+import codecs
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from .importing import READERS, import_stream
 
-# Create your views here.
+# Formats of the imports, by content type
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/jsonl': 'jsonl',
+    'application/x-ndjson': 'jsonl',
+}
+
+@require_POST
+def import_teams(request):
+    """
+    Import the records of the request body (see teams.importing), streaming it. The
+    format is given by the `format` parameter or the content type, and the records are
+    only validated if the `dry_run` parameter is set. Responds with the import report.
+    Only for staff users.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    format = request.GET.get('format') or IMPORT_CONTENT_TYPES.get(request.content_type)
+    if format not in READERS:
+        return JsonResponse({'error': 'Unsupported format'}, status=400)
+    dry_run = request.GET.get('dry_run', '') not in ('', '0', 'false')
+    try:
+        report = import_stream(codecs.iterdecode(request, 'utf-8'), format, dry_run)
+    except UnicodeDecodeError:
+        return JsonResponse({'error': 'Invalid encoding, expected UTF-8'}, status=400)
+    return JsonResponse(report.as_dict(), status=200 if report.ok else 400)